@@ -0,0 +1,70 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+
+from .minio_client import minio_client
+from .zip_stream import CHUNK_SIZE
+
+_io_executor = ThreadPoolExecutor(max_workers=settings.ASYNC_IO_THREADS, thread_name_prefix="async-io")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Выполняет блокирующий вызов в пуле потоков, не занимая event loop.
+
+    Контекст запроса (в том числе этапы Server-Timing) передается в поток.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_io_executor, partial(context.run, func, *args, **kwargs))
+
+
+async def aiter_blocking(iterable):
+    """Асинхронный итератор поверх блокирующего: каждый next() выполняется в пуле потоков"""
+    iterator = iter(iterable)
+    done = object()
+    try:
+        while (item := await run_blocking(next, iterator, done)) is not done:
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            await run_blocking(close)
+
+
+class AsyncMinio:
+    """Асинхронный фасад над minio_client.
+
+    Асинхронного S3-клиента в зависимостях нет, поэтому сетевые вызовы идут
+    через общий пул соединений minio_client в ограниченном пуле потоков.
+    Поток занят только на время одного вызова или чтения куска, а не на весь
+    запрос, так что число одновременных загрузок не ограничено числом потоков.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await run_blocking(attr, *args, **kwargs)
+
+        return call
+
+    async def iter_object(self, object_name, offset=0, length=0, chunk_size=CHUNK_SIZE):
+        """Тело объекта кусками; соединение возвращается в пул в конце потока"""
+        response = await self.get_object(settings.MINIO_BUCKET_NAME, object_name, offset=offset, length=length)
+        try:
+            while chunk := await run_blocking(response.read, chunk_size):
+                yield chunk
+        finally:
+            response.close()
+            response.release_conn()
+
+
+async_minio_client = AsyncMinio(minio_client)
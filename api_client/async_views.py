@@ -0,0 +1,214 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated
+
+from .async_minio import aiter_blocking, run_blocking
+from .authentication import authenticate_token_key
+from .blobs import archive_object_name
+from .models import Project, RenderJob
+from .object_streaming import aobject_response
+from .output_options import OutputOptions, OutputOptionsError
+from .presigned import presigned_urls, wants_redirect
+from .render_cache import MinioRenderCache, etag_matches, make_render_key, render_cache, render_etag
+from .rendering import acquire_scratch, get_batch_pool, iter_render_archive, parallel_rendering, render_project
+from .scratch import ScratchQuotaExceeded, scratch_unavailable
+from .stage_timing import failed_stage, stage
+from .template_cache import template_cache
+
+
+async def authenticate_token(request):
+    """Проверка заголовка "Authorization: Token <key>", как в CachedTokenAuthentication"""
+    auth = request.headers.get("Authorization", "").split()
+    if not auth or auth[0].lower() != "token":
+        raise NotAuthenticated()
+    if len(auth) != 2:
+        raise AuthenticationFailed("Invalid token header.")
+    # Запросы к БД — через sync_to_async: соединения в его потоке Django закрывает и проверяет сам
+    return await sync_to_async(authenticate_token_key)(auth[1])
+
+
+def _render_adopted(lease, *args):
+    output_dir, work_dir = render_project(*args)
+    lease.adopt(output_dir, work_dir)
+    return output_dir, work_dir
+
+
+async def render_leased(lease, *args):
+    """render_project вне event loop; каталоги результата сразу передаются резерву.
+
+    Если запрос отменен, пока генерация еще идет, ее результат удаляется по
+    готовности, а не остается на диске.
+    """
+    with stage("render"):
+        if parallel_rendering():
+            # Файлы шаблона и так рендерятся в пуле, здесь только распаковка и слияние
+            return await run_blocking(_render_adopted, lease, *args)
+        # Этапы внутри процесса пула (checkout, extract) в Server-Timing не попадают
+        future = get_batch_pool().submit(render_project, *args)
+        future.add_done_callback(lease.adopt_result)
+        return await asyncio.wrap_future(future)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncTokenView(View):
+    """Асинхронное представление, доступное только по токену.
+
+    DRF не поддерживает async-обработчики, поэтому представления на чистом
+    Django View; ошибки аутентификации отдаются в формате DRF.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            request.user = await authenticate_token(request)
+        except (NotAuthenticated, AuthenticationFailed) as e:
+            response = JsonResponse({"detail": str(e.detail)}, status=e.status_code)
+            response["WWW-Authenticate"] = "Token"
+            return response
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncDownloadTemplateView(AsyncTokenView):
+    async def get(self, request, project_id):
+        try:
+            project = await Project.objects.aget(id=project_id)
+            if wants_redirect(request):
+                url = await run_blocking(presigned_urls.get_url, archive_object_name(project), filename=project.file_name)
+                return HttpResponseRedirect(url)
+            return await aobject_response(request, archive_object_name(project), 'application/zip',
+                                          filename=project.file_name)
+
+        except Project.DoesNotExist:
+            return JsonResponse({"error": "Project not found"}, status=404)
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=500)
+
+
+class AsyncGetTemplateJsonView(AsyncTokenView):
+    async def get(self, request, project_id):
+        try:
+            project = await Project.objects.aget(id=project_id)
+            return await aobject_response(request, f"{project.id}_context.json", 'application/json')
+        except Project.DoesNotExist:
+            return JsonResponse({"error": "Project not found"}, status=404)
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=500)
+
+
+class AsyncProcessTemplateView(AsyncTokenView):
+    """Асинхронный вариант ProcessTemplateView.
+
+    Генерация выполняется в пуле процессов пакетной генерации, а архив
+    результата отдается асинхронным потоком.
+    """
+
+    async def post(self, request):
+        project_id = request.GET.get("project_id")
+        if not project_id:
+            return JsonResponse({"error": "Project ID is required in query parameters"}, status=400)
+
+        try:
+            context_data = json.loads(request.body or b"null")
+        except ValueError as e:
+            return JsonResponse({"error": f"Invalid JSON: {str(e)}"}, status=400)
+        if not context_data:
+            return JsonResponse({"error": "Context data is required in the request body"}, status=400)
+        try:
+            self.options = OutputOptions.from_request(request)
+        except OutputOptionsError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        try:
+            with stage("project_lookup"):
+                project = await Project.objects.aget(id=project_id)
+
+            if request.GET.get("mode") == "async":
+                job = await RenderJob.objects.acreate(
+                    user=request.user, project=project, context=context_data, output=self.options.to_dict(),
+                )
+                return JsonResponse({
+                    "job_id": str(job.id),
+                    "status_url": f"/api_client/render-jobs/{job.id}/",
+                }, status=202)
+
+            archive_key = await run_blocking(template_cache.archive_key, project)
+            redirect = wants_redirect(request) and isinstance(render_cache, MinioRenderCache)
+
+            render_key = None
+            if render_cache is not None:
+                render_key = make_render_key(archive_key, context_data, self.options)
+                if etag_matches(request, render_key):
+                    response = HttpResponse(status=304)
+                    response["ETag"] = render_etag(render_key)
+                    return response
+                if "no-cache" not in request.headers.get("Cache-Control", ""):
+                    with stage("render_cache_lookup"):
+                        if redirect and await run_blocking(render_cache.exists, render_key):
+                            return await self.redirect_response(render_key)
+                        cached = None if redirect else await run_blocking(render_cache.lookup, render_key)
+                    if cached is not None:
+                        chunks, size = cached
+                        response = self.archive_response(aiter_blocking(chunks), render_key)
+                        response["Content-Length"] = str(size)
+                        return response
+
+            with stage("scratch_admission"):
+                lease = await run_blocking(
+                    acquire_scratch, project, archive_key, timeout=settings.SCRATCH_ADMISSION_TIMEOUT
+                )
+            try:
+                output_dir, work_dir = await render_leased(lease, project, context_data, archive_key)
+                if redirect:
+                    chunks = iter_render_archive(output_dir, project, archive_key, self.options)
+                    try:
+                        await run_blocking(render_cache.store, render_key, chunks)
+                    finally:
+                        await run_blocking(lease.release)
+                    return await self.redirect_response(render_key)
+            except BaseException:
+                # В том числе отмена запроса при обрыве соединения во время генерации
+                await asyncio.shield(run_blocking(lease.release))
+                raise
+            chunks = iter_render_archive(output_dir, project, archive_key, self.options)
+            return self.archive_response(self.archive_chunks(chunks, lease, render_key), render_key)
+
+        except Project.DoesNotExist:
+            return JsonResponse({"error": "Project not found"}, status=404)
+        except ScratchQuotaExceeded as e:
+            return scratch_unavailable(e)
+        except Exception as e:
+            return JsonResponse({"error": str(e), "error_type": type(e).__name__, "stage": failed_stage()},
+                                status=500)
+
+    async def archive_chunks(self, chunks, lease, render_key=None):
+        try:
+            if render_key is not None:
+                chunks = render_cache.tee(render_key, chunks)
+            async for chunk in aiter_blocking(chunks):
+                yield chunk
+        finally:
+            await run_blocking(lease.release)
+
+    async def redirect_response(self, render_key):
+        url = await run_blocking(
+            presigned_urls.get_url,
+            render_cache.object_name(render_key),
+            filename=self.options.filename("processed_template"),
+            content_type=self.options.content_type,
+        )
+        response = HttpResponseRedirect(url)
+        response["ETag"] = render_etag(render_key)
+        return response
+
+    def archive_response(self, chunks, render_key=None):
+        response = StreamingHttpResponse(chunks, content_type=self.options.content_type)
+        response["Content-Disposition"] = f'attachment; filename="{self.options.filename("processed_template")}"'
+        if render_key is not None:
+            response["ETag"] = render_etag(render_key)
+        return response
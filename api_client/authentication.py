@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from .models import ClientToken
+from .token_cache import token_cache
+
+
+def _load_token_user(key):
+    """Пользователь и срок действия токена из БД: сначала общий токен DRF, затем токен клиента"""
+    token = Token.objects.select_related("user").filter(key=key).first()
+    if token is not None:
+        return token.user, None
+    token = ClientToken.objects.select_related("user").filter(key=key, expires_at__gt=timezone.now()).first()
+    if token is not None:
+        return token.user, token.expires_at
+    raise AuthenticationFailed("Invalid token.")
+
+
+def authenticate_token_key(key):
+    """Пользователь по ключу токена; из БД читается только при промахе кэша"""
+    user = token_cache.get(key)
+    if user is None:
+        user, expires_at = _load_token_user(key)
+        token_cache.set(key, user, expires_at)
+    if not user.is_active:
+        raise AuthenticationFailed("User inactive or deleted.")
+    return user
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запросов Token и User к БД на каждый вызов API.
+
+    Принимает и токены клиентов ClientToken, пока не истек их срок.
+    """
+
+    def authenticate_credentials(self, key):
+        user = authenticate_token_key(key)
+        # Токен не читается из БД; request.auth — несохраненный экземпляр с тем же ключом
+        return user, Token(key=key, user=user)
+
+
+def _client_token(user, client):
+    """Действующий токен клиента или новый вместо истекшего"""
+    now = timezone.now()
+    token = ClientToken.objects.filter(user=user, client=client).first()
+    if token is not None and token.expires_at > now:
+        return token
+    expires_at = now + timedelta(seconds=settings.CLIENT_TOKEN_TTL)
+    try:
+        with transaction.atomic():
+            if token is not None:
+                token.delete()
+            return ClientToken.objects.create(user=user, client=client, expires_at=expires_at)
+    except IntegrityError:
+        # Тот же клиент одновременно вошел в другом запросе
+        return ClientToken.objects.get(user=user, client=client)
+
+
+def issue_login_token(user, client=None):
+    """Токен для ответа на вход или регистрацию по LOGIN_TOKEN_MODE.
+
+    "rotate" — удалить токен пользователя и выдать новый (другие клиенты
+    разлогиниваются); "reuse" — вернуть существующий токен без записи в БД;
+    "client" — свой токен для каждого клиента со сроком CLIENT_TOKEN_TTL.
+    Возвращает пару (ключ, срок действия или None).
+    """
+    mode = settings.LOGIN_TOKEN_MODE
+    if mode == "client":
+        token = _client_token(user, client or "default")
+        return token.key, token.expires_at
+    if mode == "reuse":
+        token, _ = Token.objects.get_or_create(user=user)
+        return token.key, None
+    Token.objects.filter(user=user).delete()
+    return Token.objects.create(user=user).key, None
@@ -0,0 +1,90 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .minio_client import minio_client
+from .models import Project, TemplateBlob
+
+
+class UnknownBlob(Exception):
+    pass
+
+
+def blob_object_name(sha256):
+    return f"{settings.TEMPLATE_BLOB_PREFIX}{sha256}"
+
+
+def blob_manifest_name(sha256):
+    return f"{blob_object_name(sha256)}_manifest.json"
+
+
+def archive_object_name(project):
+    """Объект архива проекта: блоб по содержимому или, для старых проектов, объект с именем id"""
+    return blob_object_name(project.file_id) if project.file_id else str(project.id)
+
+
+def blob_ready(sha256):
+    return TemplateBlob.objects.filter(sha256=sha256, ready=True).exists()
+
+
+def reserve_blob(sha256, size):
+    """Строка блоба до загрузки объектов: ready=False, ссылок нет.
+
+    Короткая отдельная запись без блокировки: архив загружается в MinIO вне
+    транзакции, а одновременные загрузки того же архива не ждут друг друга
+    (они пишут одинаковые байты в один объект). Повторный резерв обновляет
+    created_at, чтобы collect_blob не счел идущую загрузку брошенной.
+    """
+    try:
+        with transaction.atomic():
+            TemplateBlob.objects.create(sha256=sha256, size=size, ref_count=0, ready=False)
+    except IntegrityError:
+        TemplateBlob.objects.filter(sha256=sha256, ready=False).update(created_at=timezone.now())
+
+
+def acquire_blob(sha256, uploaded=False):
+    """Добавляет ссылку на блоб; вызывается в транзакции создания проекта, последним шагом.
+
+    uploaded — этот запрос сам загрузил объекты блоба: тогда блоб
+    становится готовым. Если блоба нет (удален, пока шла загрузка) или он
+    еще загружается другим запросом, UnknownBlob.
+    """
+    # Блокировка строки не дает collect_blob удалить объект между проверкой и ссылкой
+    blob = TemplateBlob.objects.select_for_update().filter(sha256=sha256).first()
+    if blob is None or not (blob.ready or uploaded):
+        raise UnknownBlob(sha256)
+    TemplateBlob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') + 1, ready=True)
+
+
+def recount_blob(sha256):
+    """Пересчитывает ссылки блоба по таблице проектов (после операций в обход сигналов)"""
+    with transaction.atomic():
+        blob = TemplateBlob.objects.select_for_update().filter(sha256=sha256).first()
+        if blob is None:
+            return None
+        blob.ref_count = Project.objects.filter(file_id=sha256).count()
+        blob.save(update_fields=['ref_count'])
+        return blob.ref_count
+
+
+def collect_blob(sha256):
+    """Удаляет блоб без ссылок вместе с объектами в MinIO; возвращает True, если удален.
+
+    Незавершенный блоб удаляется, только если его загрузка брошена дольше
+    TEMPLATE_BLOB_PENDING_TIMEOUT. Строка удаляется под блокировкой до
+    удаления объектов: если MinIO недоступен, транзакция откатывается и
+    блоб остается целым.
+    """
+    abandoned = timezone.now() - timedelta(seconds=settings.TEMPLATE_BLOB_PENDING_TIMEOUT)
+    with transaction.atomic():
+        if TemplateBlob.objects.select_for_update().filter(
+            Q(ready=True) | Q(created_at__lt=abandoned), sha256=sha256, ref_count=0,
+        ).first() is None:
+            return False
+        TemplateBlob.objects.filter(sha256=sha256).delete()
+        minio_client.remove_object(settings.MINIO_BUCKET_NAME, blob_object_name(sha256))
+        minio_client.remove_object(settings.MINIO_BUCKET_NAME, blob_manifest_name(sha256))
+    return True
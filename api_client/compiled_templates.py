@@ -0,0 +1,226 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+CONTEXT_FILE = "templater.json"
+
+# Подстановка {{ templater.name }}; других конструкций с templater кэш не вычисляет
+PLACEHOLDER_PATTERN = r"\{\{\s*templater\.([A-Za-z_]\w*)\s*\}\}"
+MARKER = "templater"
+
+_VARIABLE_RE = re.compile(PLACEHOLDER_PATTERN)
+_UNSUPPORTED = object()
+
+
+class NotCompilable(Exception):
+    pass
+
+
+def compile_text(text):
+    """Разбивает текст на [литерал, имя, литерал, ...] по подстановкам {{ templater.name }}.
+
+    Любое другое упоминание templater (фильтры, теги, вложенные ключи)
+    означает, что шаблон нельзя вычислять без движка.
+    """
+    parts = _VARIABLE_RE.split(text)
+    if any(MARKER in literal for literal in parts[0::2]):
+        raise NotCompilable(text[:80])
+    return parts
+
+
+def evaluate(parts, context):
+    return "".join(part if index % 2 == 0 else context[part] for index, part in enumerate(parts))
+
+
+class CompiledTemplate:
+    """Разобранное дерево шаблона: пути и тела файлов как списки литералов и подстановок"""
+
+    def __init__(self, directories, files):
+        self.directories = directories
+        self.files = files
+        self.path_variables = {
+            name for parts in directories + [path for path, _ in files] for name in parts[1::2]
+        }
+        self.variables = self.path_variables | {
+            name for _, body in files if isinstance(body, list) for name in body[1::2]
+        }
+        self.size = sum(
+            len(body) if isinstance(body, bytes) else sum(map(len, body)) for _, body in files
+        )
+
+    @classmethod
+    def from_tree(cls, root):
+        directories, files = [], []
+        for path in sorted(root.rglob("*")):
+            relative = path.relative_to(root).as_posix()
+            if relative == CONTEXT_FILE:
+                continue
+            if path.is_dir():
+                directories.append(compile_text(relative))
+                continue
+            data = path.read_bytes()
+            if MARKER.encode() not in data:
+                files.append((compile_text(relative), data))
+                continue
+            try:
+                text = data.decode("utf-8")
+            except UnicodeDecodeError:
+                raise NotCompilable(relative)
+            files.append((compile_text(relative), compile_text(text)))
+        return cls(directories, files)
+
+    def accepts(self, context):
+        """Можно ли вычислить шаблон без движка для этого контекста.
+
+        Поведение движка проверено только для строковых значений, а значения
+        в путях не должны менять структуру каталогов.
+        """
+        if not isinstance(context, dict):
+            return False
+        for name in self.variables:
+            value = context.get(name)
+            if not isinstance(value, str):
+                return False
+            if name in self.path_variables and (not value or "/" in value or "\0" in value or value in (".", "..")):
+                return False
+        return True
+
+    def render(self, context):
+        """Результат как {путь: байты, для каталогов — None}"""
+        result = {}
+        for parts in self.directories:
+            result[evaluate(parts, context)] = None
+        for path_parts, body in self.files:
+            path = evaluate(path_parts, context)
+            if result.get(path) is not None:
+                # Порядок перезаписи определяет движок — такие шаблоны не вычисляем
+                raise NotCompilable(path)
+            result[path] = body if isinstance(body, bytes) else evaluate(body, context).encode("utf-8")
+        for path in list(result):
+            parent = path.rpartition("/")[0]
+            while parent and parent not in result:
+                result[parent] = None
+                parent = parent.rpartition("/")[0]
+        return result
+
+    def write(self, context, output_dir):
+        rendered = self.render(context)
+        output_dir.mkdir(parents=True)
+        for path, data in sorted(rendered.items()):
+            target = output_dir / path
+            if data is None:
+                target.mkdir(parents=True, exist_ok=True)
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                target.write_bytes(data)
+        return output_dir
+
+
+def probe_context(template):
+    # Спецсимволы и подстановка внутри значения выявляют экранирование и повторный рендер в движке
+    return {
+        name: f"<&\"'é{{{{ templater.{name} }}}} {index}>"
+        for index, name in enumerate(sorted(template.variables))
+    }
+
+
+class CompiledTemplateCache:
+    """Разобранные шаблоны в памяти процесса, LRU с ограничением по размеру.
+
+    Ключ — идентичность содержимого архива: SHA-256 для проектов на общих
+    архивах, id проекта и ETag для старых проектов. Шаблон используется
+    вместо движка, только если при компиляции его результат на пробном
+    контексте побайтно совпал с результатом движка; иначе архив помечается
+    неподдерживаемым и всегда генерируется движком.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.compiled = 0
+        self.unsupported = 0
+        self.fallbacks = 0
+        self.compile_seconds = 0.0
+
+    def lookup(self, key):
+        """Шаблон по ключу; None — шаблон еще не компилировался в этом процессе"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry
+
+    def compile(self, key, root, engine_render):
+        """Компилирует распакованное дерево root и сверяет его с движком.
+
+        engine_render(root, context) возвращает результат движка в формате
+        CompiledTemplate.render.
+        """
+        started = time.perf_counter()
+        try:
+            template = CompiledTemplate.from_tree(root)
+            probe = probe_context(template)
+            if template.render(probe) != engine_render(root, probe):
+                raise NotCompilable(key)
+        except NotCompilable:
+            template = _UNSUPPORTED
+        elapsed = time.perf_counter() - started
+
+        size = 0 if template is _UNSUPPORTED else template.size
+        with self._lock:
+            self.compile_seconds += elapsed
+            if template is _UNSUPPORTED:
+                self.unsupported += 1
+            else:
+                self.compiled += 1
+            if key not in self._entries and size <= self.max_bytes:
+                self._entries[key] = template
+                self._size += size
+                while self._size > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._size -= 0 if evicted is _UNSUPPORTED else evicted.size
+        return template
+
+    def render(self, template, context_data, output_dir):
+        """Пишет результат в output_dir; None — генерировать нужно движком"""
+        if template is not _UNSUPPORTED and template.accepts(context_data):
+            try:
+                return template.write(context_data, output_dir)
+            except NotCompilable:
+                pass
+        with self._lock:
+            self.fallbacks += 1
+        return None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else None,
+                'compiled': self.compiled,
+                'unsupported': self.unsupported,
+                'engine_fallbacks': self.fallbacks,
+                'compile_seconds': self.compile_seconds,
+                'avg_compile_seconds': self.compile_seconds / (self.compiled + self.unsupported)
+                if self.compiled + self.unsupported else None,
+                'entries': len(self._entries),
+                'size_bytes': self._size,
+                'max_bytes': self.max_bytes,
+            }
+
+
+compiled_templates = (
+    CompiledTemplateCache(settings.TEMPLATE_COMPILED_CACHE_BYTES) if settings.TEMPLATE_COMPILED_CACHE_BYTES else None
+)
@@ -0,0 +1,143 @@
+import hashlib
+import io
+import threading
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from minio.datatypes import Object
+from minio.error import S3Error
+from minio.helpers import ObjectWriteResult
+from urllib3 import HTTPHeaderDict, HTTPResponse
+
+
+class InMemoryMinio:
+    """S3-совместимое хранилище в памяти процесса с интерфейсом Minio.
+
+    Поддерживает только вызовы, которые делает приложение; используется
+    бенчмарками вместо сервера MinIO (см. manage.py bench_endpoints). Ответы
+    и ошибки — те же типы, что возвращает настоящий клиент.
+    """
+
+    def __init__(self, latency=0.0):
+        # Искусственная задержка каждого вызова в секундах, имитирует сеть
+        self.latency = latency
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._wait = threading.Event()
+
+    def _delay(self):
+        if self.latency:
+            self._wait.wait(self.latency)
+
+    def _bucket(self, bucket_name):
+        try:
+            return self._buckets[bucket_name]
+        except KeyError:
+            raise S3Error("NoSuchBucket", "The specified bucket does not exist",
+                          f"/{bucket_name}", None, None, None, bucket_name) from None
+
+    def _object(self, bucket_name, object_name):
+        with self._lock:
+            objects = self._bucket(bucket_name)
+            try:
+                return objects[object_name]
+            except KeyError:
+                raise S3Error("NoSuchKey", "The specified key does not exist",
+                              f"/{bucket_name}/{object_name}", None, None, None,
+                              bucket_name, object_name) from None
+
+    def bucket_exists(self, bucket_name):
+        self._delay()
+        with self._lock:
+            return bucket_name in self._buckets
+
+    def make_bucket(self, bucket_name, *args, **kwargs):
+        self._delay()
+        with self._lock:
+            if bucket_name in self._buckets:
+                raise S3Error("BucketAlreadyOwnedByYou", "Bucket already exists",
+                              f"/{bucket_name}", None, None, None, bucket_name)
+            self._buckets[bucket_name] = {}
+
+    def put_object(self, bucket_name, object_name, data, length, content_type="application/octet-stream",
+                   metadata=None, **kwargs):
+        self._delay()
+        payload = data.read() if length < 0 else data.read(length)
+        stored = Object(
+            bucket_name,
+            object_name,
+            last_modified=datetime.now(timezone.utc).replace(microsecond=0),
+            etag=hashlib.md5(payload).hexdigest(),
+            size=len(payload),
+            metadata=dict(metadata or {}),
+            content_type=content_type,
+        )
+        with self._lock:
+            self._bucket(bucket_name)[object_name] = (stored, payload)
+        return ObjectWriteResult(bucket_name, object_name, None, stored.etag, HTTPHeaderDict(),
+                                 last_modified=stored.last_modified)
+
+    def fput_object(self, bucket_name, object_name, file_path, content_type="application/octet-stream",
+                    metadata=None, **kwargs):
+        with open(file_path, "rb") as file:
+            return self.put_object(bucket_name, object_name, file, -1, content_type, metadata)
+
+    def stat_object(self, bucket_name, object_name, *args, **kwargs):
+        self._delay()
+        return self._object(bucket_name, object_name)[0]
+
+    def get_object(self, bucket_name, object_name, offset=0, length=0, *args, **kwargs):
+        self._delay()
+        stored, payload = self._object(bucket_name, object_name)
+        body = payload[offset:offset + length] if length else payload[offset:]
+        headers = HTTPHeaderDict({
+            "Content-Length": str(len(body)),
+            "Content-Type": stored.content_type,
+            "ETag": f'"{stored.etag}"',
+        })
+        return HTTPResponse(body=io.BytesIO(body), headers=headers, status=206 if offset or length else 200,
+                            preload_content=False)
+
+    def fget_object(self, bucket_name, object_name, file_path, *args, **kwargs):
+        self._delay()
+        stored, payload = self._object(bucket_name, object_name)
+        with open(file_path, "wb") as file:
+            file.write(payload)
+        return stored
+
+    def remove_object(self, bucket_name, object_name, *args, **kwargs):
+        self._delay()
+        with self._lock:
+            self._bucket(bucket_name).pop(object_name, None)
+
+    def list_objects(self, bucket_name, prefix=None, recursive=False, start_after=None, **kwargs):
+        self._delay()
+        prefix = prefix or ""
+        with self._lock:
+            names = sorted(name for name in self._bucket(bucket_name) if name.startswith(prefix))
+            objects = {name: self._buckets[bucket_name][name][0] for name in names}
+        seen_dirs = set()
+        for name in names:
+            if start_after is not None and name <= start_after:
+                continue
+            if not recursive and "/" in name[len(prefix):]:
+                directory = prefix + name[len(prefix):].split("/", 1)[0] + "/"
+                if directory not in seen_dirs:
+                    seen_dirs.add(directory)
+                    yield Object(bucket_name, directory)
+                continue
+            yield objects[name]
+
+    def presigned_get_object(self, bucket_name, object_name, expires=None, response_headers=None, **kwargs):
+        query = "&".join(f"{key}={quote(value)}" for key, value in (response_headers or {}).items())
+        return f"http://in-memory-minio/{bucket_name}/{quote(object_name)}?{query}".rstrip("?")
+
+    def stats(self):
+        with self._lock:
+            return {
+                bucket_name: {
+                    "objects": len(objects),
+                    "bytes": sum(stored.size for stored, _ in objects.values()),
+                }
+                for bucket_name, objects in self._buckets.items()
+            }
@@ -0,0 +1,276 @@
+import itertools
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from api_client.fake_minio import InMemoryMinio
+from api_client.minio_client import minio_client
+
+from .bench_project_queries import percentile
+
+PASSWORD = 'bench-password'
+ENDPOINTS = ['login', 'upload-template', 'list-templates', 'download-template', 'process-template']
+
+
+class PeakRss:
+    """Пиковый RSS процесса за время блока: опрос /proc/self/statm в фоновом потоке.
+
+    Без /proc (macOS) — ru_maxrss, то есть пик с начала процесса.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def current():
+        try:
+            with open('/proc/self/statm') as statm:
+                return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except OSError:
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.current())
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=settings.BASE_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+
+def read_body(response):
+    if response.streaming:
+        try:
+            return sum(len(chunk) for chunk in response.streaming_content)
+        finally:
+            response.close()
+    return len(response.content)
+
+
+class Command(BaseCommand):
+    help = ('Load-test the main API endpoints in-process against an in-memory MinIO and report '
+            'throughput, p50/p95/p99 latency and peak RSS per endpoint')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                            help=f'Comma-separated subset of: {", ".join(ENDPOINTS)}')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--archive', default=str(Path(settings.BASE_DIR) / 'templater.zip'),
+                            help='Template archive to upload and render')
+        parser.add_argument('--context', default=str(Path(settings.BASE_DIR) / 'templates' / 'context.json'),
+                            help='Context JSON for the template')
+        parser.add_argument('--storage-latency', type=float, default=0.0, metavar='MS',
+                            help='Artificial delay of every in-memory MinIO call')
+        parser.add_argument('--real-minio', action='store_true',
+                            help='Use the configured MinIO server instead of the in-memory stand-in')
+        parser.add_argument('--output', help='Also write the JSON report to this file')
+        parser.add_argument('--baseline', help='Report of a previous run to compare against')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        endpoints = [name.strip() for name in options['endpoints'].split(',') if name.strip()]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f'Unknown endpoints: {", ".join(sorted(unknown))}')
+        self.archive = Path(options['archive']).read_bytes()
+        self.context = Path(options['context']).read_bytes()
+        baseline = json.loads(Path(options['baseline']).read_text()) if options['baseline'] else None
+
+        if connection.vendor == 'sqlite':
+            # Файл SQLite из bench_settings создается и мигрируется здесь же
+            Path(settings.DATABASES['default']['NAME']).parent.mkdir(parents=True, exist_ok=True)
+            call_command('migrate', verbosity=0, interactive=False)
+
+        original_client = minio_client._client
+        if not options['real_minio']:
+            minio_client._client = InMemoryMinio(latency=options['storage_latency'] / 1000)
+            minio_client._bucket_ready = False
+
+        self.email = f'bench-endpoints-{uuid.uuid4().hex[:8]}@example.com'
+        User = get_user_model()
+        user = User.objects.create_user(username=self.email, email=self.email, password=PASSWORD)
+        self.token = Token.objects.get_or_create(user=user)[0].key
+        try:
+            response = self.upload_template(0)
+            if response.status_code != 200:
+                raise CommandError(f'Upload failed with {response.status_code}: {response.content[:200]!r}')
+            self.project_id = response.json()['project_id']
+            results = {}
+            for name in endpoints:
+                request = getattr(self, name.replace('-', '_'))
+                self.run_phase(request, options['warmup'], options['concurrency'])
+                results[name] = self.measure(request, options['requests'], options['concurrency'])
+        finally:
+            user.delete()
+            minio_client._client = original_client
+            minio_client._bucket_ready = False
+
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'storage': 'minio' if options['real_minio'] else 'in-memory',
+                'storage_latency_ms': options['storage_latency'],
+                'concurrency': options['concurrency'],
+                'requests': options['requests'],
+                'archive_bytes': len(self.archive),
+            },
+            'endpoints': results,
+        }
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, indent=2))
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        meta = report['meta']
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{meta['commit'] or 'unknown commit'}  {meta['database']} + {meta['storage']} storage, "
+            f"concurrency {meta['concurrency']}, {meta['requests']} requests per endpoint"
+        ))
+        for name, stats in results.items():
+            line = (f"  {name:<18} {stats['throughput_rps']:8.1f} req/s   p50 {stats['p50_ms']:7.1f} ms"
+                    f"   p95 {stats['p95_ms']:7.1f} ms   p99 {stats['p99_ms']:7.1f} ms"
+                    f"   peak RSS {stats['peak_rss_mb']:6.1f} MB   errors {stats['errors']}")
+            previous = (baseline or {}).get('endpoints', {}).get(name)
+            if previous:
+                line += (f"   [{change(previous['throughput_rps'], stats['throughput_rps'])} req/s,"
+                         f" {change(previous['p95_ms'], stats['p95_ms'])} p95]")
+            self.stdout.write(line)
+        if baseline:
+            self.stdout.write(f"  baseline: {baseline['meta'].get('commit') or 'unknown commit'}")
+
+    def client(self):
+        return Client(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def login(self, index):
+        return Client().post('/api_client/login/', {'email': self.email, 'password': PASSWORD},
+                             content_type='application/json')
+
+    def upload_template(self, index):
+        return self.client().post('/api_client/upload-template/', {
+            'file': SimpleUploadedFile('templater.zip', self.archive, content_type='application/zip'),
+            'json_file': SimpleUploadedFile('context.json', self.context, content_type='application/json'),
+            'project_name': f'bench-{index}',
+            'description': 'bench',
+            'project_type': 'bench',
+            'status': 'draft',
+        })
+
+    def list_templates(self, index):
+        return self.client().get('/api_client/list-templates/')
+
+    def download_template(self, index):
+        return self.client().get(f'/api_client/download-template/{self.project_id}/')
+
+    def process_template(self, index):
+        return self.client().post(f'/api_client/process-template/?project_id={self.project_id}',
+                                  self.context, content_type='application/json')
+
+    def run_phase(self, request, count, concurrency):
+        """count запросов в concurrency потоках; возвращает (задержка, статус) каждого"""
+        indexes = itertools.count()
+        lock = threading.Lock()
+        results = []
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        index = next(indexes)
+                    if index >= count:
+                        return
+                    started = time.perf_counter()
+                    try:
+                        response = request(index)
+                        read_body(response)
+                        status = response.status_code
+                    except Exception as e:
+                        status = type(e).__name__
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        results.append((elapsed, status))
+            finally:
+                # Соединения с БД у каждого потока свои
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def measure(self, request, count, concurrency):
+        with PeakRss() as rss:
+            started = time.perf_counter()
+            results = self.run_phase(request, count, concurrency)
+            wall = time.perf_counter() - started
+
+        latencies = [elapsed for elapsed, _ in results]
+        statuses = {}
+        for _, status in results:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        return {
+            'requests': count,
+            'errors': sum(1 for _, status in results if not (isinstance(status, int) and status < 400)),
+            'statuses': statuses,
+            'throughput_rps': count / wall,
+            'mean_ms': statistics.mean(latencies) * 1000,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'peak_rss_mb': rss.peak / (1024 * 1024),
+        }
+
+
+def change(before, after):
+    if not before:
+        return 'n/a'
+    return f'{(after - before) / before * 100:+.1f}%'
@@ -0,0 +1,109 @@
+import json
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .bench_project_queries import percentile
+
+PASSWORD = 'bench-password'
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+# Исходное поведение входа и режимы без сессии
+VARIANTS = {
+    'rotate+session': {'LOGIN_TOKEN_MODE': 'rotate', 'LOGIN_CREATE_SESSION': True},
+    'reuse': {'LOGIN_TOKEN_MODE': 'reuse', 'LOGIN_CREATE_SESSION': False},
+    'client': {'LOGIN_TOKEN_MODE': 'client', 'LOGIN_CREATE_SESSION': False},
+}
+
+
+class Command(BaseCommand):
+    help = 'Measure logins/sec, latency and DB writes per login for each login mode'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=50, help='Measured logins per variant')
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--iterations', type=int, default=None,
+                            help='Also measure with PASSWORD_PBKDF2_ITERATIONS set to this value')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        emails = [f'bench-login-{run_id}-{i}@example.com' for i in range(options['users'])]
+        User = get_user_model()
+        for email in emails:
+            User.objects.create_user(username=email, email=email, password=PASSWORD)
+
+        variants = [(name, overrides) for name, overrides in VARIANTS.items()]
+        if options['iterations'] is not None:
+            variants += [
+                (f'{name}+pbkdf2:{options["iterations"]}', {**overrides, 'PASSWORD_PBKDF2_ITERATIONS': options['iterations']})
+                for name, overrides in VARIANTS.items()
+            ]
+
+        self.session_keys = set()
+        report = {}
+        try:
+            for name, overrides in variants:
+                with override_settings(ALLOWED_HOSTS=['testserver'], **overrides):
+                    # Первый вход каждого пользователя пересчитывает хеш под текущий хешер — в замер не входит
+                    for email in emails:
+                        self.login(Client(), email)
+                    report[name] = self.measure(emails, options['logins'], options['concurrency'])
+        finally:
+            User.objects.filter(email__in=emails).delete()
+            Session.objects.filter(session_key__in=self.session_keys).delete()
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for name, stats in report.items():
+            self.stdout.write(
+                f"  {name:<28} {stats['logins_per_sec']:8.1f} logins/s   p50 {stats['p50_ms']:8.1f} ms"
+                f"   p99 {stats['p99_ms']:8.1f} ms   {stats['queries_per_login']:5.2f} queries"
+                f"   {stats['writes_per_login']:5.2f} writes per login"
+            )
+
+    def login(self, client, email):
+        response = client.post(
+            '/api_client/login/',
+            {'email': email, 'password': PASSWORD, 'client': 'bench'},
+            content_type='application/json',
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f'Login failed with {response.status_code}: {response.content[:200]!r}')
+        session = response.cookies.get(settings.SESSION_COOKIE_NAME)
+        if session is not None:
+            self.session_keys.add(session.value)
+
+    def measure(self, emails, logins, concurrency):
+        def run(index):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                self.login(Client(), emails[index % len(emails)])
+                elapsed = time.perf_counter() - started
+            sql = [query['sql'].lstrip().upper() for query in queries.captured_queries]
+            return elapsed, len(sql), sum(1 for statement in sql if statement.startswith(WRITE_STATEMENTS))
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(run, range(logins)))
+        wall = time.perf_counter() - started
+
+        latencies = [elapsed for elapsed, _, _ in results]
+        return {
+            'logins_per_sec': logins / wall,
+            'p50_ms': statistics.median(latencies) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'queries_per_login': statistics.mean(count for _, count, _ in results),
+            'writes_per_login': statistics.mean(writes for _, _, writes in results),
+        }
@@ -0,0 +1,96 @@
+import json
+import shutil
+import statistics
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api_client.output_options import OutputOptions, OutputOptionsError, iter_directory_archive
+
+VARIANTS = [
+    ("zip", "store", None),
+    ("zip", "deflate", 1),
+    ("zip", "deflate", 6),
+    ("zip", "deflate", 9),
+    ("zip", "bzip2", None),
+    ("zip", "lzma", None),
+    ("tar.gz", None, 1),
+    ("tar.gz", None, 6),
+    ("tar.gz", None, 9),
+    ("tar.zst", None, 3),
+    ("tar.zst", None, 19),
+]
+
+
+class Command(BaseCommand):
+    help = 'Measure CPU time, wall time and size of the output archive for each format and compression level'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', nargs='?', default=str(Path(settings.BASE_DIR) / 'templater.zip'),
+                            help='Directory or zip archive with the files to pack')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        source = Path(options['source'])
+        if not source.exists():
+            raise CommandError(f'{source} does not exist')
+
+        work_dir = None
+        if source.is_dir():
+            directory = source
+        else:
+            work_dir = Path(tempfile.mkdtemp())
+            with zipfile.ZipFile(source) as zip_ref:
+                zip_ref.extractall(work_dir)
+            directory = work_dir
+        try:
+            raw_size = sum(path.stat().st_size for path in directory.rglob('*') if path.is_file())
+            report = {'source': str(source), 'raw_size': raw_size, 'variants': []}
+            for format, compression, level in VARIANTS:
+                try:
+                    output = OutputOptions(format, compression, level)
+                except OutputOptionsError as e:
+                    report['variants'].append({'variant': output_label(format, compression, level), 'skipped': str(e)})
+                    continue
+                report['variants'].append(self.measure(output, directory, raw_size, options['repeat']))
+        finally:
+            if work_dir is not None:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{source} ({raw_size} bytes)"))
+        for result in report['variants']:
+            if 'skipped' in result:
+                self.stdout.write(f"  {result['variant']:<16} skipped: {result['skipped']}")
+                continue
+            self.stdout.write(
+                f"  {result['variant']:<16} cpu {result['cpu_ms']:9.1f} ms   wall {result['wall_ms']:9.1f} ms"
+                f"   size {result['size']:>10}   ratio {result['ratio']:.3f}"
+            )
+
+    def measure(self, output, directory, raw_size, repeat):
+        cpu, wall = [], []
+        size = 0
+        for _ in range(repeat):
+            started_cpu, started_wall = time.process_time(), time.perf_counter()
+            size = sum(len(chunk) for chunk in iter_directory_archive(directory, output))
+            cpu.append(time.process_time() - started_cpu)
+            wall.append(time.perf_counter() - started_wall)
+        return {
+            'variant': output_label(output.format, output.compression, output.level),
+            'cpu_ms': statistics.median(cpu) * 1000,
+            'wall_ms': statistics.median(wall) * 1000,
+            'size': size,
+            'ratio': size / raw_size if raw_size else None,
+        }
+
+
+def output_label(format, compression, level):
+    return ":".join(str(part) for part in (format, compression, level) if part is not None)
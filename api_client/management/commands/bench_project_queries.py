@@ -0,0 +1,159 @@
+import json
+import random
+import statistics
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from api_client.models import Project, rebuild_user_summary
+
+# Колонки списков, запрошенных с ?fields= без description: только их покрывают индексы с INCLUDE
+LIST_COLUMNS = ('id', 'project_name', 'project_type', 'status', 'file_name', 'created_at')
+PROJECT_TYPES = ['web', 'cli', 'library', 'service']
+STATUSES = ['draft', 'active', 'archived']
+BATCH_SIZE = 1000
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class Command(BaseCommand):
+    help = 'Seed projects and measure p50/p99 latency of the project listing queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--projects', type=int, default=100000)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--database', default='default',
+                            help='Database alias to seed and measure; prefer a dedicated database')
+        parser.add_argument('--compare', action='store_true',
+                            help='Also measure with the Project indexes dropped; the project table stays '
+                                 'locked for other sessions until the run ends')
+        parser.add_argument('--keep', action='store_true', help='Commit seeded rows instead of rolling back')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        self.using = options['database']
+        # Индексы снимаются внутри транзакции прогона: нужен транзакционный DDL PostgreSQL
+        if options['compare'] and connections[self.using].vendor != 'postgresql':
+            raise CommandError('--compare is supported on PostgreSQL only')
+
+        # Весь прогон — одна транзакция: сгенерированные строки и снятые индексы откатываются
+        # вместе с ней, даже если команда упала, и ничего не нужно удалять в обход сигналов
+        with transaction.atomic(using=self.using):
+            users = self.seed(options['projects'], options['users'])
+            queries = self.queries(users, options['page_size'])
+            report = {}
+            if options['compare']:
+                with self.indexes_dropped():
+                    report['without_indexes'] = self.measure(queries, options['iterations'])
+            report['with_indexes'] = self.measure(queries, options['iterations'])
+            if options['keep']:
+                # bulk_create не вызывает сигналы, сводки оставленных пользователей считаются заново
+                for user in users:
+                    rebuild_user_summary(user.id)
+            else:
+                transaction.set_rollback(True, using=self.using)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for phase, results in report.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(phase))
+            for name, stats in results.items():
+                self.stdout.write(
+                    f"  {name:<28} p50 {stats['p50_ms']:8.3f} ms   p99 {stats['p99_ms']:8.3f} ms"
+                )
+
+    def seed(self, project_count, user_count):
+        User = get_user_model()
+        projects = Project.objects.using(self.using)
+        run_id = uuid.uuid4().hex[:8]
+        users = User.objects.using(self.using).bulk_create([
+            User(username=f'bench-{run_id}-{i}', email=f'bench-{run_id}-{i}@example.com')
+            for i in range(user_count)
+        ])
+        if not all(user.pk for user in users):
+            users = list(User.objects.using(self.using).filter(username__startswith=f'bench-{run_id}-'))
+
+        now = timezone.now()
+        rng = random.Random(run_id)
+        for batch_no, start in enumerate(range(0, project_count, BATCH_SIZE)):
+            batch = projects.bulk_create([
+                Project(
+                    user=rng.choice(users),
+                    project_name=f'project-{i}',
+                    description='x' * rng.randint(100, 2000),
+                    project_type=rng.choice(PROJECT_TYPES),
+                    status=rng.choice(STATUSES),
+                    file_name=f'project-{i}.zip',
+                    file_id=uuid.uuid4().hex,
+                )
+                for i in range(start, min(start + BATCH_SIZE, project_count))
+            ])
+            # auto_now_add проставляет одно время на весь bulk_create — раскладываем пачки по времени
+            projects.filter(id__in=[p.id for p in batch if p.id]).update(
+                created_at=now - timedelta(minutes=batch_no)
+            )
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f'ANALYZE {Project._meta.db_table}')
+        self.stdout.write(f'Seeded {project_count} projects for {user_count} users')
+        return users
+
+    def queries(self, users, page_size):
+        projects = Project.objects.using(self.using)
+        middle = projects.order_by('-created_at', '-id').values('created_at', 'id')[projects.count() // 2]
+        file_id = projects.filter(user__in=users).values_list('file_id', flat=True).first()
+        ordered = projects.order_by('-created_at', '-id')
+
+        return {
+            'user_projects_first_page': lambda: ordered.filter(user=random.choice(users)).values(*LIST_COLUMNS)[:page_size],
+            'list_templates_first_page': lambda: ordered.values(*LIST_COLUMNS)[:page_size],
+            'list_templates_deep_page': lambda: ordered.filter(
+                Q(created_at__lt=middle['created_at']) | Q(created_at=middle['created_at'], id__lt=middle['id'])
+            ).values(*LIST_COLUMNS)[:page_size],
+            'filter_type_status': lambda: ordered.filter(
+                project_type=random.choice(PROJECT_TYPES), status=random.choice(STATUSES)
+            ).values(*LIST_COLUMNS)[:page_size],
+            'lookup_by_file_id': lambda: projects.filter(file_id=file_id).values(*LIST_COLUMNS),
+        }
+
+    def measure(self, queries, iterations):
+        results = {}
+        for name, make_query in queries.items():
+            samples = []
+            for _ in range(iterations):
+                query = make_query()
+                started = time.perf_counter()
+                list(query)
+                samples.append((time.perf_counter() - started) * 1000)
+            results[name] = {
+                'p50_ms': percentile(samples, 0.50),
+                'p99_ms': percentile(samples, 0.99),
+                'mean_ms': statistics.fmean(samples),
+            }
+        return results
+
+    @contextmanager
+    def indexes_dropped(self):
+        with connections[self.using].schema_editor() as editor:
+            for index in Project._meta.indexes:
+                editor.remove_index(Project, index)
+        self.stdout.write('Dropped Project indexes')
+        try:
+            yield
+        finally:
+            with connections[self.using].schema_editor() as editor:
+                for index in Project._meta.indexes:
+                    editor.add_index(Project, index)
+            self.stdout.write('Restored Project indexes')
@@ -0,0 +1,100 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Выполняется в новом интерпретаторе: холодный старт до первого обслуженного запроса
+CHILD_SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+setup_done = time.perf_counter()
+from django.test import Client
+from django.urls import get_resolver
+get_resolver().url_patterns
+urls_done = time.perf_counter()
+client = Client(HTTP_HOST=sys.argv[2])
+response = client.get(sys.argv[1])
+first_done = time.perf_counter()
+client.get(sys.argv[1])
+second_done = time.perf_counter()
+print(json.dumps({
+    "setup_ms": (setup_done - started) * 1000,
+    "urls_ms": (urls_done - setup_done) * 1000,
+    "first_request_ms": (first_done - urls_done) * 1000,
+    "total_ms": (first_done - started) * 1000,
+    "second_request_ms": (second_done - first_done) * 1000,
+    "status": response.status_code,
+}))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Measure cold start of a new process up to the first served request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api_client/list-templates/',
+                            help='Request path; without a token the API answers 401 without DB or MinIO access')
+        parser.add_argument('--host', default='localhost', help='Host header, must be in ALLOWED_HOSTS')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--importtime', type=int, default=0, metavar='N',
+                            help='Also print the N slowest imports (python -X importtime)')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'code_gen.settings'))
+        runs = [self.run_child(env, options['path'], options['host']) for _ in range(options['repeat'])]
+
+        report = {
+            'path': options['path'],
+            'status': runs[-1]['status'],
+            'runs': len(runs),
+            **{
+                name: statistics.median(run[name] for run in runs)
+                for name in ('setup_ms', 'urls_ms', 'first_request_ms', 'total_ms', 'second_request_ms')
+            },
+        }
+        if options['importtime']:
+            report['slowest_imports'] = self.slowest_imports(env, options['path'], options['host'],
+                                                             options['importtime'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{report['path']} -> {report['status']} (median of {report['runs']} cold starts)"
+        ))
+        for name in ('setup_ms', 'urls_ms', 'first_request_ms', 'total_ms', 'second_request_ms'):
+            self.stdout.write(f"  {name:<20} {report[name]:9.1f} ms")
+        for module, micros in report.get('slowest_imports', []):
+            self.stdout.write(f"  import {module:<50} {micros / 1000:9.1f} ms")
+
+    def spawn(self, env, path, host, extra_args=()):
+        result = subprocess.run(
+            [sys.executable, *extra_args, '-c', CHILD_SCRIPT, path, host],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(f'Child process failed:\n{result.stderr[-2000:]}')
+        return result
+
+    def run_child(self, env, path, host):
+        return json.loads(self.spawn(env, path, host).stdout.strip().splitlines()[-1])
+
+    def slowest_imports(self, env, path, host, count):
+        result = self.spawn(env, path, host, extra_args=('-X', 'importtime'))
+        imports = []
+        for line in result.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, module = line[len('import time:'):].split('|')
+            # Вложенные импорты идут с отступом; берем только импорты верхнего уровня
+            if not module.startswith('  '):
+                imports.append((module.strip(), int(cumulative)))
+        return sorted(imports, key=lambda item: -item[1])[:count]
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api_client.blobs import collect_blob, recount_blob
+from api_client.models import TemplateBlob
+
+
+class Command(BaseCommand):
+    help = 'Recount template blob references and delete blobs no project refers to or whose upload was abandoned'
+
+    def handle(self, *args, **kwargs):
+        collected = 0
+        for sha256 in TemplateBlob.objects.values_list('sha256', flat=True).iterator():
+            if recount_blob(sha256) == 0 and collect_blob(sha256):
+                collected += 1
+        self.stdout.write(self.style.SUCCESS(f'Deleted {collected} unreferenced blobs'))
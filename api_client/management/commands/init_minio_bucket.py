@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api_client.minio_init import init_minio_bucket
+
+
+class Command(BaseCommand):
+    help = 'Create the MinIO bucket MINIO_BUCKET_NAME if it does not exist'
+
+    def handle(self, *args, **kwargs):
+        try:
+            init_minio_bucket()
+        except Exception as e:
+            raise CommandError(f'Failed to initialize MinIO bucket: {e}')
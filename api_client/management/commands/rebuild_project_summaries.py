@@ -0,0 +1,16 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from api_client.models import rebuild_user_summary
+
+
+class Command(BaseCommand):
+    help = 'Recompute per-user project summaries (e.g. after bulk imports that bypass signals)'
+
+    def handle(self, *args, **kwargs):
+        user_ids = get_user_model().objects.values_list('id', flat=True)
+        count = 0
+        for user_id in user_ids.iterator():
+            rebuild_user_summary(user_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt summaries for {count} users'))
@@ -0,0 +1,101 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api_client.pool_worker import init_pool_worker
+
+
+def _run_job(job_id, worker):
+    from api_client.render_jobs import run_job
+    return run_job(job_id, worker)
+
+
+class Command(BaseCommand):
+    help = 'Run render job worker backed by the database queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.RENDER_JOB_WORKERS)
+        parser.add_argument('--poll-interval', type=float, default=settings.RENDER_JOB_POLL_INTERVAL)
+
+    def handle(self, *args, **options):
+        # Модуль импортируется и в дочерних процессах до django.setup(), поэтому модели — лениво
+        from api_client.render_jobs import claim_next_job, heartbeat_jobs, mark_job_crashed, requeue_job, worker_name
+
+        workers = options['workers']
+        poll_interval = options['poll_interval']
+        worker = worker_name()
+
+        pool = self.create_pool(workers)
+        self.stdout.write(self.style.SUCCESS(f'Render worker started with {workers} processes'))
+        running = {}
+        next_requeue = 0
+        next_heartbeat = 0
+        try:
+            while True:
+                # Пульс отправляет этот процесс: задача живого воркера не считается брошенной, сколько бы ни шла
+                if running and time.monotonic() >= next_heartbeat:
+                    heartbeat_jobs(worker, list(running.values()))
+                    next_heartbeat = time.monotonic() + settings.RENDER_JOB_HEARTBEAT_INTERVAL
+
+                # Задачи упавших воркеров (в том числе других процессов) возвращаются не только при старте
+                if time.monotonic() >= next_requeue:
+                    self.requeue_stale()
+                    next_requeue = time.monotonic() + settings.RENDER_JOB_REQUEUE_INTERVAL
+
+                while len(running) < workers:
+                    job = claim_next_job(worker)
+                    if job is None:
+                        break
+                    try:
+                        running[pool.submit(_run_job, job.id, worker)] = job.id
+                    except BrokenProcessPool:
+                        # Дочерний процесс умер (например, OOM): задача еще не начата — обратно в очередь
+                        requeue_job(job.id, worker)
+                        pool = self.restart_pool(pool, workers)
+                        break
+
+                if not running:
+                    close_old_connections()
+                    time.sleep(poll_interval)
+                    continue
+
+                done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        state = future.result()
+                    except Exception as e:
+                        # Какая из выполнявшихся задач убила процесс, неизвестно — повторять их нельзя
+                        mark_job_crashed(job_id, worker, e)
+                        state = f'crashed: {e}'
+                        broken = broken or isinstance(e, BrokenProcessPool)
+                    self.stdout.write(f'Job {job_id}: {state}')
+                if broken and not running:
+                    pool = self.restart_pool(pool, workers)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def create_pool(self, workers):
+        # spawn, а не fork: дочерние процессы не должны делить соединения с БД родителя
+        return ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'), initializer=init_pool_worker)
+
+    def restart_pool(self, pool, workers):
+        self.stdout.write(self.style.WARNING('Process pool is broken, restarting it'))
+        pool.shutdown(wait=False, cancel_futures=True)
+        return self.create_pool(workers)
+
+    def requeue_stale(self):
+        from api_client.render_jobs import expire_jobs, requeue_stale_jobs
+
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'Requeued {requeued} stale jobs'))
+        expired = expire_jobs()
+        if expired:
+            self.stdout.write(f'Removed {expired} expired jobs')
@@ -0,0 +1,159 @@
+import hashlib
+import io
+import json
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from zipfile import ZipFile
+
+from django.conf import settings
+from minio.error import S3Error
+
+from .blobs import archive_object_name, blob_manifest_name
+from .compiled_templates import MARKER, PLACEHOLDER_PATTERN
+from .minio_client import minio_client
+from .zip_stream import CHUNK_SIZE
+
+MANIFEST_VERSION = 1
+
+_PLACEHOLDER_RE = re.compile(PLACEHOLDER_PATTERN.encode())
+# Хвост предыдущего куска, чтобы не пропустить подстановку на границе кусков
+_OVERLAP = 256
+# Сколько манифестов держать в памяти процесса
+_CACHED_MANIFESTS = 256
+
+_manifests = OrderedDict()
+_manifests_lock = threading.Lock()
+
+
+def manifest_object_name(project):
+    """Манифест общий для всех проектов с одним блобом; у старых проектов — свой по id"""
+    return blob_manifest_name(project.file_id) if project.file_id else f"{project.id}_manifest.json"
+
+
+def _scan_member(zip_ref, info):
+    digest = hashlib.sha256()
+    variables = set()
+    templated = False
+    tail = b""
+    with zip_ref.open(info) as member:
+        while chunk := member.read(CHUNK_SIZE):
+            digest.update(chunk)
+            window = tail + chunk
+            templated = templated or MARKER.encode() in window
+            variables.update(name.decode() for name in _PLACEHOLDER_RE.findall(window))
+            tail = window[-_OVERLAP:]
+    return digest.hexdigest(), templated, sorted(variables)
+
+
+def build_manifest(archive):
+    """Описание содержимого архива шаблона.
+
+    Для каждого элемента — размеры, CRC и SHA-256, подстановки
+    {{ templater.* }} в пути и в теле. Элементы без упоминания templater
+    в теле статические: их содержимое не зависит от контекста.
+    """
+    members = []
+    with ZipFile(archive) as zip_ref:
+        for info in zip_ref.infolist():
+            path_variables = sorted({name.decode() for name in _PLACEHOLDER_RE.findall(info.filename.encode())})
+            entry = {
+                'path': info.filename,
+                'is_dir': info.is_dir(),
+                'size': info.file_size,
+                'compressed_size': info.compress_size,
+                'compress_type': info.compress_type,
+                'crc32': info.CRC,
+                'path_templated': MARKER in info.filename,
+                'path_variables': path_variables,
+            }
+            if not info.is_dir():
+                sha256, templated, variables = _scan_member(zip_ref, info)
+                entry.update(sha256=sha256, static=not templated, variables=variables)
+            members.append(entry)
+    archive.seek(0)
+
+    files = [entry for entry in members if not entry['is_dir']]
+    return {
+        'version': MANIFEST_VERSION,
+        'members': members,
+        'variables': sorted({
+            name for entry in members for name in entry['path_variables'] + entry.get('variables', [])
+        }),
+        'total_size': sum(entry['size'] for entry in files),
+        'static_files': sum(1 for entry in files if entry['static']),
+        'templated_files': sum(1 for entry in files if not entry['static']),
+    }
+
+
+def store_manifest(object_name, manifest):
+    data = json.dumps(manifest, ensure_ascii=False).encode()
+    minio_client.put_object(
+        settings.MINIO_BUCKET_NAME,
+        object_name,
+        io.BytesIO(data),
+        length=len(data),
+        content_type='application/json',
+    )
+
+
+def ensure_manifest(project):
+    """Создает манифест для проекта, загруженного до появления манифестов.
+
+    Возвращает False, если манифест уже был.
+    """
+    try:
+        minio_client.stat_object(settings.MINIO_BUCKET_NAME, manifest_object_name(project))
+        return False
+    except S3Error as e:
+        if e.code != 'NoSuchKey':
+            raise
+
+    with tempfile.TemporaryFile() as archive:
+        response = minio_client.get_object(settings.MINIO_BUCKET_NAME, archive_object_name(project))
+        digest = hashlib.sha256()
+        try:
+            for chunk in response.stream(CHUNK_SIZE):
+                digest.update(chunk)
+                archive.write(chunk)
+        finally:
+            response.close()
+            response.release_conn()
+        archive.seek(0)
+        manifest = build_manifest(archive)
+    manifest['archive_sha256'] = digest.hexdigest()
+    store_manifest(manifest_object_name(project), manifest)
+    return True
+
+
+def _read_manifest(project):
+    response = minio_client.get_object(settings.MINIO_BUCKET_NAME, manifest_object_name(project))
+    try:
+        return json.loads(response.read())
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def load_manifest(project, archive_key):
+    """Манифест архива с кэшем в памяти процесса по идентичности архива"""
+    with _manifests_lock:
+        manifest = _manifests.get(archive_key)
+        if manifest is not None:
+            _manifests.move_to_end(archive_key)
+            return manifest
+
+    try:
+        manifest = _read_manifest(project)
+    except S3Error as e:
+        if e.code != 'NoSuchKey':
+            raise
+        ensure_manifest(project)
+        manifest = _read_manifest(project)
+
+    with _manifests_lock:
+        _manifests[archive_key] = manifest
+        while len(_manifests) > _CACHED_MANIFESTS:
+            _manifests.popitem(last=False)
+    return manifest
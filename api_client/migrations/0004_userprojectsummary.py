@@ -0,0 +1,81 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+USER_EMAIL_INDEX = 'api_client_user_email_idx'
+
+
+def populate_summaries(apps, schema_editor):
+    Project = apps.get_model('api_client', 'Project')
+    UserProjectSummary = apps.get_model('api_client', 'UserProjectSummary')
+    stats = Project.objects.values('user_id').annotate(count=models.Count('id'), latest=models.Max('created_at'))
+    UserProjectSummary.objects.bulk_create([
+        UserProjectSummary(user_id=row['user_id'], project_count=row['count'], latest_created_at=row['latest'])
+        for row in stats
+    ], batch_size=1000)
+
+
+def _email_index(apps):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    field = User._meta.get_field('email')
+    # У пользовательской модели с unique email индекс уже есть
+    if field.unique or field.db_index:
+        return User, None
+    return User, models.Index(fields=['email'], name=USER_EMAIL_INDEX)
+
+
+def add_user_email_index(apps, schema_editor):
+    User, index = _email_index(apps)
+    if index is not None:
+        schema_editor.add_index(User, index)
+
+
+def remove_user_email_index(apps, schema_editor):
+    User, index = _email_index(apps)
+    if index is not None:
+        schema_editor.remove_index(User, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_client', '0003_project_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        # Индекс по email создается после всех изменений таблицы auth_user
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserProjectSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='project_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('project_count', models.PositiveIntegerField(default=0)),
+                ('latest_created_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+        # Таблица auth_user не наша: индекс создается на модели пользователя, а в состоянии
+        # миграций описан на неуправляемой модели UserEmailIndex
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(add_user_email_index, remove_user_email_index),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name='UserEmailIndex',
+                    fields=[
+                        ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('email', models.EmailField(max_length=254)),
+                    ],
+                    options={
+                        'db_table': 'auth_user',
+                        'managed': False,
+                        'indexes': [models.Index(fields=['email'], name=USER_EMAIL_INDEX)],
+                    },
+                ),
+            ],
+        ),
+    ]
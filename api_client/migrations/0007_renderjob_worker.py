@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_client', '0006_templateblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='renderjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='renderjob',
+            name='output',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='renderjob',
+            name='worker',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
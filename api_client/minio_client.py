@@ -1,9 +1,179 @@
+import os
+import socket
+import threading
+import time
+
+import certifi
+import urllib3
 from django.conf import settings
 from minio import Minio
+from minio.error import S3Error
+from urllib3.connection import HTTPConnection
+from urllib3.util import Retry, Timeout
+
+from .stage_timing import stage
+
+
+def create_http_client():
+    """Пул соединений urllib3 для MinIO с параметрами из настроек MINIO_*"""
+    socket_options = list(HTTPConnection.default_socket_options)
+    if settings.MINIO_TCP_KEEPALIVE:
+        socket_options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+
+    return urllib3.PoolManager(
+        num_pools=settings.MINIO_NUM_POOLS,
+        maxsize=settings.MINIO_POOL_MAXSIZE,
+        block=settings.MINIO_POOL_BLOCK,
+        timeout=Timeout(connect=settings.MINIO_CONNECT_TIMEOUT, read=settings.MINIO_READ_TIMEOUT),
+        retries=Retry(
+            total=settings.MINIO_MAX_RETRIES,
+            backoff_factor=settings.MINIO_RETRY_BACKOFF,
+            backoff_jitter=settings.MINIO_RETRY_JITTER,
+            status_forcelist=[500, 502, 503, 504],
+        ),
+        socket_options=socket_options,
+        cert_reqs='CERT_REQUIRED',
+        ca_certs=os.environ.get('SSL_CERT_FILE') or certifi.where(),
+    )
+
+
+class MinioMetrics:
+    """Задержки операций MinIO и загрузка пула соединений"""
+
+    def __init__(self, pool_maxsize):
+        self.pool_maxsize = pool_maxsize
+        self._lock = threading.Lock()
+        self._operations = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.saturated_calls = 0
+
+    def start(self):
+        with self._lock:
+            if self.in_flight >= self.pool_maxsize:
+                self.saturated_calls += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def finish(self, operation, seconds, failed):
+        with self._lock:
+            self.in_flight -= 1
+            stats = self._operations.setdefault(
+                operation, {'count': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0}
+            )
+            stats['count'] += 1
+            stats['errors'] += int(failed)
+            stats['total_seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+
+    def snapshot(self, http_client=None):
+        with self._lock:
+            operations = {
+                name: dict(stats, avg_seconds=stats['total_seconds'] / stats['count'])
+                for name, stats in self._operations.items()
+            }
+            data = {
+                'operations': operations,
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+                'saturated_calls': self.saturated_calls,
+                'pool_maxsize': self.pool_maxsize,
+            }
+
+        if http_client is not None:
+            data['pools'] = [
+                {
+                    'host': pool.host,
+                    'port': pool.port,
+                    # Очередь пула заполнена заглушками None, открытые соединения — остальные элементы
+                    'idle_connections': sum(1 for conn in list(pool.pool.queue) if conn is not None)
+                    if pool.pool is not None else 0,
+                    'connections_created': pool.num_connections,
+                    'requests': pool.num_requests,
+                }
+                for pool in list(http_client.pools._container.values())
+            ]
+        return data
+
+
+class InstrumentedMinio:
+    """Обертка над Minio, замеряющая каждую публичную операцию.
+
+    Для get_object время считается до получения заголовков ответа: чтение
+    тела идет потоково уже после возврата из вызова. Операции попадают и в
+    этапы запроса (Server-Timing) как minio_<операция>.
+    """
+
+    def __init__(self, client, http_client, metrics):
+        self._client = client
+        self.http_client = http_client
+        self.metrics = metrics
+        self._bucket_ready = False
+        self._bucket_lock = threading.Lock()
+
+    def ensure_bucket(self, create=None):
+        """Проверка бакета один раз на процесс при первом обращении к хранилищу.
+
+        Отсутствующий бакет создается, если create (по умолчанию
+        MINIO_AUTO_CREATE_BUCKET) истинно. Неудачная проверка не запоминается:
+        ее повторит следующее обращение. Возвращает True, если бакет создан.
+        """
+        if create is None:
+            create = settings.MINIO_AUTO_CREATE_BUCKET
+        if self._bucket_ready:
+            return False
+        with self._bucket_lock:
+            if self._bucket_ready:
+                return False
+            created = False
+            bucket_name = settings.MINIO_BUCKET_NAME
+            if not self._client.bucket_exists(bucket_name):
+                if not create:
+                    raise RuntimeError(f"MinIO bucket {bucket_name} does not exist")
+                try:
+                    self._client.make_bucket(bucket_name)
+                    created = True
+                except S3Error as e:
+                    # Бакет между проверкой и созданием создал другой процесс
+                    if e.code not in ('BucketAlreadyOwnedByYou', 'BucketAlreadyExists'):
+                        raise
+            self._bucket_ready = True
+            return created
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        def timed(*args, **kwargs):
+            self.ensure_bucket()
+            self.metrics.start()
+            started = time.perf_counter()
+            failed = True
+            try:
+                with stage(f"minio_{name}"):
+                    result = attr(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                self.metrics.finish(name, time.perf_counter() - started, failed)
+
+        return timed
+
+    def metrics_snapshot(self):
+        return self.metrics.snapshot(self.http_client)
+
+
+def create_minio_client():
+    http_client = create_http_client()
+    client = Minio(
+        settings.MINIO_ENDPOINT,
+        access_key=settings.MINIO_ACCESS_KEY,
+        secret_key=settings.MINIO_SECRET_KEY,
+        secure=settings.MINIO_USE_SSL,
+        http_client=http_client,
+    )
+    return InstrumentedMinio(client, http_client, MinioMetrics(settings.MINIO_POOL_MAXSIZE))
+
 
-minio_client = Minio(
-    settings.MINIO_ENDPOINT,
-    access_key=settings.MINIO_ACCESS_KEY,
-    secret_key=settings.MINIO_SECRET_KEY,
-    secure=settings.MINIO_USE_SSL
-)
\ No newline at end of file
+minio_client = create_minio_client()
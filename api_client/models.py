@@ -1,14 +1,68 @@
+import uuid
+
 from django.conf import settings
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import models, transaction
+from django.db.models import F, Max
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
 
+from .token_cache import token_cache
+
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
         Token.objects.create(user=instance)
 
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user_tokens(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    # Кэш хранит пользователя целиком: смена пароля, is_active или is_staff должна действовать сразу
+    if created or raw or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    keys = [
+        *Token.objects.filter(user=instance).values_list('key', flat=True),
+        *ClientToken.objects.filter(user=instance).values_list('key', flat=True),
+    ]
+    for key in keys:
+        token_cache.invalidate(key)
+
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    # Вход и регистрация в режиме "rotate" удаляют старый токен перед выдачей нового
+    token_cache.invalidate(instance.key)
+
+class ClientToken(models.Model):
+    """Токен отдельного клиента пользователя со сроком действия (LOGIN_TOKEN_MODE = "client")"""
+    key = models.CharField(max_length=40, primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='client_tokens', on_delete=models.CASCADE)
+    client = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'client'], name='client_token_user_client_uniq'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self.key:
+            self.key = Token.generate_key()
+        return super().save(*args, **kwargs)
+
+@receiver(post_delete, sender=ClientToken)
+def invalidate_cached_client_token(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+class TemplateBlob(models.Model):
+    """Архив шаблона в MinIO по SHA-256 содержимого, общий для проектов с одинаковым архивом"""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    # False, пока объекты загружаются: на такой блоб нельзя сослаться по хешу
+    ready = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
 class Project(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     project_name = models.CharField(max_length=255)
@@ -16,5 +70,153 @@ class Project(models.Model):
     project_type = models.CharField(max_length=255)
     status = models.CharField(max_length=255)
     file_name = models.CharField(max_length=255)
+    # SHA-256 архива (TemplateBlob); пусто у проектов, загруженных до хранения по содержимому
     file_id = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Списки проектов пользователя и всех шаблонов: keyset по (created_at, id).
+            # INCLUDE дает index-only scan только запросам с ?fields= без description (PostgreSQL);
+            # набор полей по умолчанию содержит description и читает строки таблицы
+            models.Index(
+                fields=['user', '-created_at', '-id'],
+                include=['project_name', 'project_type', 'status', 'file_name'],
+                name='project_user_created_idx',
+            ),
+            models.Index(
+                fields=['-created_at', '-id'],
+                include=['project_name', 'project_type', 'status', 'file_name'],
+                name='project_created_idx',
+            ),
+            models.Index(fields=['project_type', 'status'], name='project_type_status_idx'),
+            models.Index(fields=['file_id'], name='project_file_id_idx'),
+        ]
+
+
+class UserProjectSummary(models.Model):
+    """Денормализованная сводка по проектам пользователя для частых опросов дашборда"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='project_summary',
+    )
+    project_count = models.PositiveIntegerField(default=0)
+    latest_created_at = models.DateTimeField(null=True, blank=True)
+
+
+class UserEmailIndex(models.Model):
+    """Индекс auth_user(email) для выдачи проектов и сводки по email пользователя.
+
+    Таблица принадлежит приложению auth, поэтому модель не управляется
+    миграциями: индекс создает 0004, а здесь он описан, чтобы быть в
+    состоянии миграций.
+    """
+    email = models.EmailField()
+
+    class Meta:
+        managed = False
+        db_table = 'auth_user'
+        indexes = [models.Index(fields=['email'], name='api_client_user_email_idx')]
+
+
+def rebuild_user_summary(user_id):
+    """Пересчитывает сводку пользователя по таблице проектов"""
+    stats = Project.objects.filter(user_id=user_id).aggregate(count=models.Count('id'), latest=Max('created_at'))
+    UserProjectSummary.objects.update_or_create(
+        user_id=user_id,
+        defaults={'project_count': stats['count'], 'latest_created_at': stats['latest']},
+    )
+
+
+@receiver(post_save, sender=Project)
+def count_created_project(sender, instance, created=False, raw=False, **kwargs):
+    if not created or raw:
+        return
+    created_at = models.Value(instance.created_at)
+    UserProjectSummary.objects.get_or_create(user_id=instance.user_id)
+    UserProjectSummary.objects.filter(user_id=instance.user_id).update(
+        project_count=F('project_count') + 1,
+        # На части СУБД GREATEST с NULL дает NULL, поэтому сначала Coalesce
+        latest_created_at=Greatest(Coalesce('latest_created_at', created_at), created_at),
+    )
+
+
+@receiver(post_delete, sender=Project)
+def count_deleted_project(sender, instance, **kwargs):
+    updated = UserProjectSummary.objects.filter(user_id=instance.user_id, project_count__gt=0).update(
+        project_count=F('project_count') - 1,
+    )
+    # Удален самый новый проект — дату последнего берем заново по индексу (user, -created_at)
+    if updated and UserProjectSummary.objects.filter(
+        user_id=instance.user_id, latest_created_at=instance.created_at
+    ).exists():
+        latest = Project.objects.filter(user_id=instance.user_id).aggregate(latest=Max('created_at'))['latest']
+        UserProjectSummary.objects.filter(user_id=instance.user_id).update(latest_created_at=latest)
+
+
+class RenderJob(models.Model):
+    STATE_QUEUED = 'queued'
+    STATE_RUNNING = 'running'
+    STATE_FINISHED = 'finished'
+    STATE_FAILED = 'failed'
+    STATE_CHOICES = [
+        (STATE_QUEUED, 'Queued'),
+        (STATE_RUNNING, 'Running'),
+        (STATE_FINISHED, 'Finished'),
+        (STATE_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    context = models.JSONField()
+    # Формат архива результата (OutputOptions.to_dict()); пустой — настройки OUTPUT_*
+    output = models.JSONField(default=dict, blank=True)
+    state = models.CharField(max_length=16, choices=STATE_CHOICES, default=STATE_QUEUED)
+    # Воркер (хост:pid), выполняющий задачу, и время его последнего пульса
+    worker = models.CharField(max_length=255, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    result_object = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'created_at']),
+        ]
+
+
+@receiver(post_delete, sender=RenderJob)
+def remove_render_job_result(sender, instance, **kwargs):
+    if not instance.result_object:
+        return
+
+    def remove():
+        from .minio_client import minio_client
+        try:
+            minio_client.remove_object(settings.MINIO_BUCKET_NAME, instance.result_object)
+        except Exception as e:
+            print(f"Render job result {instance.result_object} not removed: {e}")
+
+    transaction.on_commit(remove)
+
+
+@receiver(post_delete, sender=Project)
+def release_template_blob(sender, instance, **kwargs):
+    if not instance.file_id:
+        return
+    TemplateBlob.objects.filter(sha256=instance.file_id, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+
+    def collect():
+        # Импорт здесь: модели не должны тянуть клиент MinIO при старте
+        from .blobs import collect_blob
+        try:
+            collect_blob(instance.file_id)
+        except Exception as e:
+            print(f"Template blob {instance.file_id} not collected: {e}")
+
+    transaction.on_commit(collect)
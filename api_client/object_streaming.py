@@ -0,0 +1,139 @@
+import re
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+
+from .async_minio import async_minio_client
+from .minio_client import minio_client
+from .zip_stream import CHUNK_SIZE
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def iter_object_chunks(response, chunk_size=CHUNK_SIZE):
+    """Читает тело объекта MinIO кусками; соединение возвращается в пул в конце потока"""
+    try:
+        yield from response.stream(chunk_size)
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def iter_object(object_name, offset=0, length=0, chunk_size=CHUNK_SIZE):
+    """Тело объекта MinIO кусками; объект открывается при первой итерации.
+
+    Ответ, тело которого не читается (HEAD, обрыв до начала передачи), не
+    занимает соединение пула.
+    """
+    response = minio_client.get_object(settings.MINIO_BUCKET_NAME, object_name, offset=offset, length=length)
+    yield from iter_object_chunks(response, chunk_size)
+
+
+def parse_range(header, size):
+    """Разбирает заголовок Range с одним диапазоном.
+
+    Возвращает (start, end) включительно, None если заголовок нужно
+    проигнорировать (нет его, несколько диапазонов или конец раньше
+    начала) и False для неудовлетворимого диапазона.
+    """
+    match = _RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Суффиксный диапазон: последние N байт
+        length = int(last)
+        if length == 0 or size == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    if last and int(last) < start:
+        # RFC 9110: такой диапазон синтаксически неверен, заголовок игнорируется
+        return None
+    if start >= size:
+        return False
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+
+    if_modified_since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+    return if_modified_since is not None and int(last_modified) <= if_modified_since
+
+
+def object_response(request, object_name, content_type, filename=None):
+    """Потоковый ответ с объектом MinIO без чтения его целиком в память.
+
+    Метаданные берутся из stat_object: Content-Length, ETag и Last-Modified,
+    поддерживаются условные запросы и один диапазон Range.
+    """
+    stat = minio_client.stat_object(settings.MINIO_BUCKET_NAME, object_name)
+
+    def open_body(offset, length):
+        return iter_object(object_name, offset, length)
+
+    return build_object_response(request, stat, open_body, content_type, filename)
+
+
+def build_object_response(request, stat, open_body, content_type, filename=None):
+    """Собирает ответ по результату stat_object.
+
+    open_body(offset, length) возвращает итератор (или асинхронный итератор)
+    кусков тела; length=0 означает "до конца объекта".
+    """
+    etag = '"{}"'.format(stat.etag.strip('"'))
+    last_modified = stat.last_modified.timestamp()
+
+    def with_headers(response):
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        response["Accept-Ranges"] = "bytes"
+        if filename is not None:
+            response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+    if _not_modified(request, etag, last_modified):
+        return with_headers(HttpResponse(status=304))
+
+    byte_range = parse_range(request.headers.get("Range"), stat.size)
+    if_range = request.headers.get("If-Range")
+    if byte_range and if_range and if_range != etag and parse_http_date_safe(if_range) != int(last_modified):
+        # Объект изменился с момента частичной загрузки — отдаем целиком
+        byte_range = None
+
+    if byte_range is False:
+        response = with_headers(HttpResponse(status=416))
+        response["Content-Range"] = f"bytes */{stat.size}"
+        return response
+
+    if byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(open_body(start, length), status=206, content_type=content_type)
+        response["Content-Range"] = f"bytes {start}-{end}/{stat.size}"
+    else:
+        length = stat.size
+        response = StreamingHttpResponse(open_body(0, 0), content_type=content_type)
+
+    response["Content-Length"] = str(length)
+    return with_headers(response)
+
+
+async def aobject_response(request, object_name, content_type, filename=None):
+    """Асинхронный вариант object_response: тело отдается асинхронным итератором"""
+    stat = await async_minio_client.stat_object(settings.MINIO_BUCKET_NAME, object_name)
+
+    def open_body(offset, length):
+        return async_minio_client.iter_object(object_name, offset, length)
+
+    return build_object_response(request, stat, open_body, content_type, filename)
@@ -0,0 +1,136 @@
+import zipfile
+import zlib
+
+from django.conf import settings
+
+from .zip_stream import CHUNK_SIZE, TarStream, ZipStream
+
+try:
+    import zstandard
+except ImportError:  # tar.zst доступен только с установленным пакетом zstandard
+    zstandard = None
+
+ZIP_METHODS = {
+    "store": zipfile.ZIP_STORED,
+    "deflate": zipfile.ZIP_DEFLATED,
+    "bzip2": zipfile.ZIP_BZIP2,
+    "lzma": zipfile.ZIP_LZMA,
+}
+
+# Допустимые уровни сжатия; None — уровень не задается
+LEVELS = {
+    ("zip", "store"): None,
+    ("zip", "deflate"): (0, 9),
+    ("zip", "bzip2"): (1, 9),
+    ("zip", "lzma"): None,
+    ("tar.gz", None): (0, 9),
+    ("tar.zst", None): (1, 22),
+}
+
+FORMATS = {
+    "zip": ("application/zip", ".zip"),
+    "tar.gz": ("application/gzip", ".tar.gz"),
+    "tar.zst": ("application/zstd", ".tar.zst"),
+}
+
+
+class OutputOptionsError(ValueError):
+    pass
+
+
+class OutputOptions:
+    """Формат, метод и уровень сжатия архива результата"""
+
+    def __init__(self, format="zip", compression="deflate", level=None):
+        if format not in FORMATS:
+            raise OutputOptionsError(f"Unknown format: {format}")
+        if format != "zip":
+            # tar сжимается целиком, метод определяется форматом
+            compression = None
+        elif compression not in ZIP_METHODS:
+            raise OutputOptionsError(f"Unknown compression: {compression}")
+        if format == "tar.zst" and zstandard is None:
+            raise OutputOptionsError("tar.zst output requires the zstandard package")
+
+        levels = LEVELS[(format, compression)]
+        if level is not None:
+            if levels is None:
+                raise OutputOptionsError(f"Compression level is not supported for {compression or format}")
+            if not levels[0] <= level <= levels[1]:
+                raise OutputOptionsError(f"Compression level must be between {levels[0]} and {levels[1]}")
+
+        self.format = format
+        self.compression = compression
+        self.level = level
+
+    @classmethod
+    def default(cls):
+        return cls(settings.OUTPUT_FORMAT, settings.OUTPUT_COMPRESSION, settings.OUTPUT_COMPRESSION_LEVEL)
+
+    @classmethod
+    def from_request(cls, request):
+        """Параметры ?archive=, ?compression=, ?level=; незаданные берутся из настроек OUTPUT_*.
+
+        Формат задается параметром archive: ?format= в DRF выбирает рендерер ответа.
+        """
+        params = request.GET
+        if not any(name in params for name in ("archive", "compression", "level")):
+            return cls.default()
+
+        level = params.get("level")
+        if level is not None:
+            try:
+                level = int(level)
+            except ValueError:
+                raise OutputOptionsError("level must be an integer")
+        elif "archive" not in params and "compression" not in params:
+            level = settings.OUTPUT_COMPRESSION_LEVEL
+        return cls(
+            params.get("archive", settings.OUTPUT_FORMAT),
+            params.get("compression", settings.OUTPUT_COMPRESSION),
+            level,
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        """Параметры, сохраненные to_dict(); пустой словарь — настройки OUTPUT_*"""
+        if not data:
+            return cls.default()
+        return cls(data["format"], data["compression"], data["level"])
+
+    def to_dict(self):
+        return {"format": self.format, "compression": self.compression, "level": self.level}
+
+    @property
+    def variant(self):
+        """Строка, различающая варианты архива в ключе кэша результатов"""
+        return f"{self.format}:{self.compression}:{self.level}"
+
+    @property
+    def content_type(self):
+        return FORMATS[self.format][0]
+
+    def filename(self, stem):
+        return f"{stem}{FORMATS[self.format][1]}"
+
+    def open_stream(self, chunk_size=CHUNK_SIZE):
+        if self.format == "zip":
+            return ZipStream(
+                ZIP_METHODS[self.compression],
+                chunk_size,
+                compress_level=self.level,
+                store_extensions=settings.OUTPUT_STORE_EXTENSIONS,
+            )
+        if self.format == "tar.gz":
+            level = self.level if self.level is not None else 6
+            # wbits=31 — формат gzip
+            return TarStream(zlib.compressobj(level, zlib.DEFLATED, 31), chunk_size)
+        level = self.level if self.level is not None else 3
+        return TarStream(zstandard.ZstdCompressor(level=level).compressobj(), chunk_size)
+
+
+def iter_directory_archive(directory, options, source=None):
+    """Отдает архив всех файлов каталога в формате options кусками по мере сжатия"""
+    stream = options.open_stream()
+    yield from stream.write_directory(directory, source=source)
+    yield from stream.close()
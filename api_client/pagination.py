@@ -0,0 +1,105 @@
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def encode_cursor(created_at, pk):
+    raw = json.dumps([created_at.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, pk = json.loads(raw)
+        created_at = parse_datetime(created_at)
+    except (ValueError, TypeError):
+        raise PaginationError("Invalid cursor")
+    if created_at is None or not isinstance(pk, int):
+        raise PaginationError("Invalid cursor")
+    return created_at, pk
+
+
+def parse_fields(request, field_map):
+    """Поля ответа из параметра ?fields=a,b; по умолчанию — все"""
+    requested = request.query_params.get("fields")
+    if not requested:
+        return list(field_map)
+    names = [name.strip() for name in requested.split(",") if name.strip()]
+    unknown = [name for name in names if name not in field_map]
+    if unknown:
+        raise PaginationError(f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+
+def parse_page_size(request):
+    try:
+        page_size = int(request.query_params.get("page_size", settings.LIST_PAGE_SIZE))
+    except ValueError:
+        raise PaginationError("page_size must be an integer")
+    if page_size < 1:
+        raise PaginationError("page_size must be positive")
+    return min(page_size, settings.LIST_MAX_PAGE_SIZE)
+
+
+def _rows(queryset, fields, field_map, chunk_size=None):
+    # created_at и id нужны для курсора, даже если их нет среди запрошенных полей
+    columns = {field_map[name] for name in fields} | {"created_at", "id"}
+    rows = queryset.values(*columns)
+    if chunk_size is not None:
+        rows = rows.iterator(chunk_size=chunk_size)
+    for row in rows:
+        yield row, {name: row[field_map[name]] for name in fields}
+
+
+def keyset_response(request, queryset, field_map):
+    """Список по ключу (created_at, id) от новых к старым.
+
+    Тело ответа — JSON-массив, как и раньше; курсор следующей страницы
+    передается в заголовках X-Next-Cursor и Link. С ?stream=1 отдается весь
+    список потоково, без ограничения размера страницы.
+    field_map сопоставляет имена полей ответа с колонками модели.
+    """
+    fields = parse_fields(request, field_map)
+    queryset = queryset.order_by("-created_at", "-id")
+
+    cursor = request.query_params.get("cursor")
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+    if request.query_params.get("stream") in ("1", "true"):
+        return StreamingHttpResponse(_stream_json(queryset, fields, field_map), content_type="application/json")
+
+    page_size = parse_page_size(request)
+    rows = list(_rows(queryset[:page_size + 1], fields, field_map))
+    response = Response([data for _, data in rows[:page_size]])
+
+    if len(rows) > page_size:
+        last, _ = rows[page_size - 1]
+        next_cursor = encode_cursor(last["created_at"], last["id"])
+        params = request.query_params.copy()
+        params["cursor"] = next_cursor
+        response["X-Next-Cursor"] = next_cursor
+        response["Link"] = f'<{request.build_absolute_uri(request.path)}?{params.urlencode()}>; rel="next"'
+    return response
+
+
+def _stream_json(queryset, fields, field_map):
+    encoder = JSONEncoder()
+    first = True
+    yield "["
+    for _, data in _rows(queryset, fields, field_map, chunk_size=settings.LIST_STREAM_CHUNK_SIZE):
+        yield ("" if first else ",") + encoder.encode(data)
+        first = False
+    yield "]"
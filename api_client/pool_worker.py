@@ -0,0 +1,15 @@
+"""Инициализация дочерних процессов пулов генерации.
+
+spawn загружает инициализатор до django.setup(), поэтому модуль не
+импортирует ни модели, ни модули, которые их импортируют.
+"""
+import django
+
+in_pool_worker = False
+
+
+def init_pool_worker():
+    """Инициализатор процессов пулов генерации"""
+    global in_pool_worker
+    in_pool_worker = True
+    django.setup()
@@ -0,0 +1,62 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+
+from .minio_client import minio_client
+
+
+def wants_redirect(request):
+    """Отдавать ли клиенту redirect на presigned URL вместо байтов через Django"""
+    value = request.GET.get("redirect")
+    if value is None:
+        return settings.MINIO_PRESIGNED_DOWNLOADS
+    return value.lower() in ("1", "true", "yes")
+
+
+class PresignedUrlCache:
+    """Кэш presigned GET URL для объектов бакета.
+
+    URL переиспользуется, пока до истечения его срока больше refresh_margin
+    секунд, поэтому клиент всегда получает ссылку с запасом по времени.
+    """
+
+    def __init__(self, expires, refresh_margin, max_entries=10000):
+        self.expires = expires
+        self.refresh_margin = refresh_margin
+        self.max_entries = max_entries
+        self._urls = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_url(self, object_name, filename=None, content_type=None):
+        key = (object_name, filename, content_type)
+        now = time.time()
+        with self._lock:
+            cached = self._urls.get(key)
+            if cached is not None and cached[1] - self.refresh_margin > now:
+                self._urls.move_to_end(key)
+                return cached[0]
+
+        response_headers = {}
+        if filename is not None:
+            response_headers["response-content-disposition"] = f'attachment; filename="{filename}"'
+        if content_type is not None:
+            response_headers["response-content-type"] = content_type
+
+        url = minio_client.presigned_get_object(
+            settings.MINIO_BUCKET_NAME,
+            object_name,
+            expires=timedelta(seconds=self.expires),
+            response_headers=response_headers or None,
+        )
+        with self._lock:
+            self._urls[key] = (url, now + self.expires)
+            self._urls.move_to_end(key)
+            while len(self._urls) > self.max_entries:
+                self._urls.popitem(last=False)
+        return url
+
+
+presigned_urls = PresignedUrlCache(settings.MINIO_PRESIGNED_EXPIRES, settings.MINIO_PRESIGNED_REFRESH_MARGIN)
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from minio.error import S3Error
+
+from .minio_client import minio_client
+from .object_streaming import iter_object
+from .output_options import FORMATS
+from .scratch import scratch_root
+from .zip_stream import CHUNK_SIZE
+
+
+def make_render_key(archive_key, context_data, options):
+    """Ключ результата: идентичность архива, канонический JSON контекста и вариант архива (формат, сжатие).
+
+    Ключ оканчивается расширением формата и служит именем файла или объекта в кэше.
+    """
+    canonical = json.dumps(context_data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    digest = hashlib.sha256()
+    digest.update(archive_key.encode())
+    digest.update(b"\n")
+    digest.update(canonical.encode())
+    digest.update(b"\n")
+    digest.update(options.variant.encode())
+    return options.filename(digest.hexdigest())
+
+
+def key_content_type(key):
+    for content_type, extension in FORMATS.values():
+        if key.endswith(extension):
+            return content_type
+    return "application/octet-stream"
+
+
+def render_etag(key):
+    # Байты zip зависят от времени файлов, совпадает только содержимое — поэтому weak ETag
+    return f'W/"{key}"'
+
+
+def etag_matches(request, key):
+    header = request.headers.get("If-None-Match", "")
+    if header.strip() == "*":
+        return True
+    tags = [tag.strip().removeprefix("W/").strip('"') for tag in header.split(",")]
+    return key in tags
+
+
+class LocalRenderCache:
+    """Готовые архивы в локальном каталоге с TTL и LRU-вытеснением по размеру"""
+
+    def __init__(self, root, ttl, max_bytes):
+        self.root = Path(root)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def lookup(self, key):
+        path = self.root / key
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
+
+        stat = os.fstat(f.fileno())
+        if time.time() - stat.st_mtime > self.ttl:
+            f.close()
+            path.unlink(missing_ok=True)
+            return None
+        # atime служит отметкой последнего использования для LRU
+        os.utime(path, (time.time(), stat.st_mtime))
+
+        def chunks():
+            with f:
+                while chunk := f.read(CHUNK_SIZE):
+                    yield chunk
+
+        return chunks(), stat.st_size
+
+    def tee(self, key, chunks):
+        """Отдает куски дальше и сохраняет архив, если он был отдан целиком"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.root / f".tmp-{uuid.uuid4()}"
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(tmp_path, self.root / key)
+            self._evict()
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def _evict(self):
+        entries = []
+        for path in self.root.iterdir():
+            if path.name.startswith(".tmp-"):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+class MinioRenderCache:
+    """Готовые архивы в бакете MinIO под общим префиксом.
+
+    S3 не хранит время доступа, поэтому при превышении размера удаляются
+    самые старые по времени записи объекты. Префикс перечисляется не при
+    каждой записи, а не чаще раза в evict_interval секунд: между проходами
+    кэш может ненадолго превысить max_bytes.
+    """
+
+    def __init__(self, prefix, ttl, max_bytes, evict_interval=0):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.evict_interval = evict_interval
+        self._next_evict = 0
+        self._evict_lock = threading.Lock()
+
+    def object_name(self, key):
+        return f"{self.prefix}{key}"
+
+    def _fresh_stat(self, key):
+        object_name = self.object_name(key)
+        try:
+            stat = minio_client.stat_object(settings.MINIO_BUCKET_NAME, object_name)
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchObject"):
+                return None
+            raise
+
+        age = (datetime.now(timezone.utc) - stat.last_modified).total_seconds()
+        if age > self.ttl:
+            minio_client.remove_object(settings.MINIO_BUCKET_NAME, object_name)
+            return None
+        return stat
+
+    def exists(self, key):
+        return self._fresh_stat(key) is not None
+
+    def lookup(self, key):
+        stat = self._fresh_stat(key)
+        if stat is None:
+            return None
+        return iter_object(self.object_name(key)), stat.size
+
+    def store(self, key, chunks):
+        """Сохраняет архив целиком, ничего не отдавая клиенту"""
+        for _ in self.tee(key, chunks):
+            pass
+
+    def tee(self, key, chunks):
+        tmp_dir = scratch_root(settings.TEMPLATE_PROCESSING_DIR)
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = tmp_dir / f"render-{uuid.uuid4()}-{key}"
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            minio_client.fput_object(
+                settings.MINIO_BUCKET_NAME,
+                self.object_name(key),
+                str(tmp_path),
+                content_type=key_content_type(key),
+            )
+            self._evict()
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def _evict(self):
+        # Проход уже идет в другом потоке или был недавно — запись его не ждет
+        if not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() < self._next_evict:
+                return
+            self._evict_objects()
+            self._next_evict = time.monotonic() + self.evict_interval
+        finally:
+            self._evict_lock.release()
+
+    def _evict_objects(self):
+        objects = [
+            obj for obj in minio_client.list_objects(settings.MINIO_BUCKET_NAME, prefix=self.prefix, recursive=True)
+            if not obj.is_dir
+        ]
+        expired = datetime.now(timezone.utc).timestamp() - self.ttl
+        total = sum(obj.size for obj in objects)
+        for obj in sorted(objects, key=lambda o: o.last_modified):
+            if total <= self.max_bytes and obj.last_modified.timestamp() >= expired:
+                break
+            minio_client.remove_object(settings.MINIO_BUCKET_NAME, obj.object_name)
+            total -= obj.size
+
+
+def build_render_cache():
+    backend = settings.RENDER_CACHE_BACKEND
+    if backend is None:
+        return None
+    if backend == "local":
+        return LocalRenderCache(settings.RENDER_CACHE_DIR, settings.RENDER_CACHE_TTL, settings.RENDER_CACHE_MAX_BYTES)
+    if backend == "minio":
+        return MinioRenderCache(
+            settings.RENDER_CACHE_PREFIX,
+            settings.RENDER_CACHE_TTL,
+            settings.RENDER_CACHE_MAX_BYTES,
+            settings.RENDER_CACHE_EVICT_INTERVAL,
+        )
+    raise ValueError(f"Unknown RENDER_CACHE_BACKEND: {backend}")
+
+
+render_cache = build_render_cache()
@@ -0,0 +1,157 @@
+import os
+import socket
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .minio_client import minio_client
+from .models import RenderJob
+from .output_options import OutputOptions
+from .rendering import acquire_scratch, cleanup_render, iter_render_archive, render_project
+from .scratch import scratch_root
+from .template_cache import template_cache
+
+
+def result_object_name(job_id, options):
+    return f"{settings.RENDER_JOB_RESULT_PREFIX}{options.filename(job_id)}"
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_next_job(worker):
+    """Забирает самую старую задачу из очереди для воркера worker.
+
+    SKIP LOCKED позволяет нескольким воркерам разбирать одну таблицу, не
+    блокируя друг друга и не получая одну и ту же задачу дважды.
+    """
+    with transaction.atomic():
+        job = (
+            RenderJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(state=RenderJob.STATE_QUEUED)
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.state = RenderJob.STATE_RUNNING
+        job.started_at = job.heartbeat_at = timezone.now()
+        job.worker = worker
+        job.save(update_fields=['state', 'started_at', 'heartbeat_at', 'worker'])
+        return job
+
+
+def heartbeat_jobs(worker, job_ids):
+    """Отмечает, что воркер жив и выполняет задачи job_ids"""
+    return RenderJob.objects.filter(id__in=job_ids, state=RenderJob.STATE_RUNNING, worker=worker).update(
+        heartbeat_at=timezone.now(),
+    )
+
+
+def requeue_stale_jobs():
+    """Возвращает в очередь задачи, воркер которых перестал отправлять пульс.
+
+    Длинная задача живого воркера не возвращается, сколько бы она ни шла.
+    """
+    deadline = timezone.now() - timedelta(seconds=settings.RENDER_JOB_TIMEOUT)
+    # Задачи без пульса взяты воркером до появления пульса; для них прежнее правило по времени старта
+    return RenderJob.objects.filter(
+        Q(heartbeat_at__lt=deadline) | Q(heartbeat_at__isnull=True, started_at__lt=deadline),
+        state=RenderJob.STATE_RUNNING,
+    ).update(state=RenderJob.STATE_QUEUED, started_at=None, heartbeat_at=None, worker='')
+
+
+def requeue_job(job_id, worker):
+    """Возвращает в очередь задачу, которую не удалось передать воркеру"""
+    RenderJob.objects.filter(id=job_id, state=RenderJob.STATE_RUNNING, worker=worker).update(
+        state=RenderJob.STATE_QUEUED, started_at=None, heartbeat_at=None, worker='',
+    )
+
+
+def mark_job_crashed(job_id, worker, error):
+    """Помечает упавшей задачу, процесс которой завершился аварийно"""
+    RenderJob.objects.filter(id=job_id, state=RenderJob.STATE_RUNNING, worker=worker).update(
+        state=RenderJob.STATE_FAILED,
+        error=str(error),
+        finished_at=timezone.now(),
+    )
+
+
+def run_job(job_id, worker):
+    """Выполняет задачу: генерация, упаковка в архив заказанного формата и загрузка результата в MinIO.
+
+    Результат записывается, только если задача все еще за воркером worker:
+    задачу, возвращенную в очередь, уже выполняет другой.
+    """
+    job = RenderJob.objects.select_related('project').get(id=job_id)
+    result_object, error = "", ""
+    try:
+        options = OutputOptions.from_dict(job.output)
+        archive_key = template_cache.archive_key(job.project)
+        # Задача ждет места сколько нужно: отказывать ей некому
+        with acquire_scratch(job.project, archive_key) as lease:
+            tmp_path = scratch_root(settings.TEMPLATE_PROCESSING_DIR) / options.filename(f"job-{uuid.uuid4()}")
+            lease.adopt(tmp_path)
+            output_dir, work_dir = render_project(job.project, job.context, archive_key)
+            lease.adopt(output_dir, work_dir)
+            with open(tmp_path, "wb") as f:
+                for chunk in iter_render_archive(output_dir, job.project, archive_key, options):
+                    f.write(chunk)
+            cleanup_render(output_dir, work_dir)
+
+            result_object = result_object_name(job.id, options)
+            minio_client.fput_object(
+                settings.MINIO_BUCKET_NAME,
+                result_object,
+                str(tmp_path),
+                content_type=options.content_type,
+            )
+        state = RenderJob.STATE_FINISHED
+    except Exception as e:
+        state = RenderJob.STATE_FAILED
+        error = str(e)
+
+    updated = RenderJob.objects.filter(id=job.id, state=RenderJob.STATE_RUNNING, worker=worker).update(
+        state=state, result_object=result_object, error=error, finished_at=timezone.now(),
+    )
+    return state if updated else "lost"
+
+
+def expire_jobs():
+    """Удаляет завершенные задачи старше RENDER_JOB_RESULT_TTL вместе с результатами в MinIO"""
+    deadline = timezone.now() - timedelta(seconds=settings.RENDER_JOB_RESULT_TTL)
+    expired = RenderJob.objects.filter(
+        state__in=[RenderJob.STATE_FINISHED, RenderJob.STATE_FAILED],
+        finished_at__lt=deadline,
+    )
+    # Объекты результатов удаляет сигнал post_delete после коммита
+    with transaction.atomic():
+        deleted, _ = expired.delete()
+    return deleted
+
+
+def job_status(job):
+    def seconds(start, end):
+        return (end - start).total_seconds() if start and end else None
+
+    data = {
+        'job_id': str(job.id),
+        'project_id': job.project_id,
+        'state': job.state,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+        'queue_seconds': seconds(job.created_at, job.started_at),
+        'render_seconds': seconds(job.started_at, job.finished_at),
+    }
+    if job.state == RenderJob.STATE_FAILED:
+        data['error'] = job.error
+    if job.state == RenderJob.STATE_FINISHED:
+        data['download_url'] = f'/api_client/render-jobs/{job.id}/download/'
+    return data
@@ -0,0 +1,379 @@
+import io
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from zipfile import ZipFile
+
+from django.conf import settings
+
+from . import pool_worker
+from .blobs import archive_object_name
+from .compiled_templates import CONTEXT_FILE, compiled_templates
+from .manifests import load_manifest
+from .minio_client import minio_client
+from .output_options import OutputOptions, iter_directory_archive
+from .pool_worker import init_pool_worker
+from .scratch import scratch_root, scratch_space
+from .stage_timing import stage, timed_iter
+from .template_cache import link_or_copy, template_cache
+from .zip_stream import ArchiveSource
+
+_batch_pool = None
+_parallel_pool = None
+_thread_pool = None
+
+
+class ArchiveMemoryCache:
+    """LRU архивов шаблонов в памяти процесса, ограниченный суммарным размером"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+
+archive_memory_cache = ArchiveMemoryCache(settings.TEMPLATE_MEMORY_CACHE_BYTES)
+
+
+def in_memory_mode():
+    return settings.TEMPLATE_RENDER_MODE == "memory"
+
+
+def work_root():
+    return settings.TEMPLATE_MEMORY_DIR if in_memory_mode() else settings.TEMPLATE_PROCESSING_DIR
+
+
+def new_work_dir():
+    return scratch_root(work_root()) / str(uuid.uuid4())
+
+
+def acquire_scratch(project, archive_key, outputs=1, timeout=None):
+    """Резервирует место под дерево шаблона и outputs результатов генерации.
+
+    Оценка берется из манифеста архива; без манифеста резервируется ноль
+    и остается только проверка свободного места на диске.
+    """
+    try:
+        size = load_manifest(project, archive_key)['total_size']
+    except Exception as e:
+        print(f"Scratch estimate unavailable for project {project.id}: {e}")
+        size = 0
+    return scratch_space.acquire(size * (1 + outputs), work_root(), timeout)
+
+
+def _read_archive(project, archive_key):
+    data = archive_memory_cache.get(archive_key)
+    if data is None:
+        response = minio_client.get_object(settings.MINIO_BUCKET_NAME, archive_object_name(project))
+        try:
+            with stage("download"):
+                data = response.read()
+        finally:
+            response.close()
+            response.release_conn()
+        archive_memory_cache.put(archive_key, data)
+    return data
+
+
+def checkout_template(project, dest, archive_key=None):
+    """Разворачивает дерево шаблона в dest.
+
+    В режиме "memory" архив читается из MinIO в память (или берется из
+    ArchiveMemoryCache) и распаковывается прямо в dest на tmpfs, минуя
+    дисковый кэш и временный файл архива.
+    """
+    if archive_key is None:
+        archive_key = template_cache.archive_key(project)
+    with stage("checkout"):
+        if not in_memory_mode():
+            return template_cache.checkout(project, dest, archive_key)
+
+        with ZipFile(io.BytesIO(_read_archive(project, archive_key))) as zip_ref, stage("extract"):
+            zip_ref.extractall(dest)
+        return dest
+
+
+def open_archive_source(project, archive_key):
+    """Исходный архив шаблона для переноса статических файлов в результат без пересжатия.
+
+    Возвращает None, если архива нет под рукой (запись кэша вытеснена):
+    тогда все файлы результата просто сжимаются заново.
+    """
+    if in_memory_mode():
+        data = archive_memory_cache.get(archive_key)
+        archive = io.BytesIO(data) if data is not None else None
+    else:
+        archive = template_cache.open_archive(archive_key)
+    if archive is None:
+        return None
+    try:
+        return ArchiveSource(archive, load_manifest(project, archive_key))
+    except Exception as e:
+        archive.close()
+        print(f"Static passthrough disabled for {archive_key}: {e}")
+        return None
+
+
+def iter_render_archive(output_dir, project, archive_key, options=None):
+    """Архив результата генерации; в zip статические файлы шаблона переносятся из исходного архива"""
+    if options is None:
+        options = OutputOptions.default()
+    source = open_archive_source(project, archive_key) if options.format == "zip" else None
+    try:
+        yield from timed_iter("archive", iter_directory_archive(output_dir, options, source=source))
+    finally:
+        if source is not None:
+            source.close()
+
+
+def _render_in(work_dir, context_data):
+    # Файл может быть жесткой ссылкой на запись кэша, поэтому не перезаписываем его на месте
+    context_file_path = work_dir / CONTEXT_FILE
+    context_file_path.unlink(missing_ok=True)
+    with open(context_file_path, "wb") as f:
+        f.write(json.dumps(context_data).encode())
+
+    # Движок импортируется при первой генерации, а не при старте процесса
+    from py_templating_engine.py_templating_engine.environment.templates_environment import TemplatesEnvironment
+
+    templates_env = TemplatesEnvironment(work_dir)
+    return templates_env.render_project()
+
+
+def render_project(project, context_data, archive_key=None):
+    """Генерирует проект по шаблону и контексту.
+
+    Возвращает пару (output_dir, work_dir); оба каталога удаляет вызывающий,
+    когда результат больше не нужен (см. cleanup_render). Если архив уже
+    скомпилирован в этом процессе, шаблон даже не распаковывается.
+    """
+    if archive_key is None:
+        archive_key = template_cache.archive_key(project)
+    work_dir = new_work_dir()
+    try:
+        if compiled_templates is None:
+            checkout_template(project, work_dir, archive_key)
+            return _render(work_dir, context_data), work_dir
+
+        template = compiled_templates.lookup(archive_key)
+        if template is None:
+            checkout_template(project, work_dir, archive_key)
+            with stage("compile"):
+                template = compiled_templates.compile(archive_key, work_dir, _engine_snapshot)
+        output_dir = compiled_templates.render(template, context_data, new_work_dir())
+        if output_dir is not None:
+            return output_dir, work_dir
+        if not work_dir.exists():
+            checkout_template(project, work_dir, archive_key)
+        return _render(work_dir, context_data), work_dir
+    except Exception:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+
+
+def render_tree(source_dir, context_data, archive_key=None):
+    """Генерирует проект из уже распакованного дерева шаблона, не изменяя его.
+
+    С archive_key используется и пополняется кэш скомпилированных шаблонов.
+    """
+    if archive_key is not None and compiled_templates is not None:
+        template = compiled_templates.lookup(archive_key)
+        if template is None:
+            template = compiled_templates.compile(archive_key, source_dir, _engine_snapshot)
+        output_dir = compiled_templates.render(template, context_data, new_work_dir())
+        if output_dir is not None:
+            return output_dir, new_work_dir()
+
+    work_dir = new_work_dir()
+    try:
+        shutil.copytree(source_dir, work_dir, copy_function=link_or_copy)
+        return _render(work_dir, context_data), work_dir
+    except Exception:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+
+
+def _engine_snapshot(source_dir, context_data):
+    """Результат движка для дерева шаблона в формате CompiledTemplate.render"""
+    output_dir, work_dir = render_tree(source_dir, context_data)
+    try:
+        return {
+            path.relative_to(output_dir).as_posix(): None if path.is_dir() else path.read_bytes()
+            for path in output_dir.rglob("*")
+        }
+    finally:
+        cleanup_render(output_dir, work_dir)
+
+
+def parallel_rendering():
+    """Включена ли параллельная генерация в этом процессе.
+
+    В воркерах пулов генерация всегда последовательная: вложенные пулы
+    только умножают число процессов.
+    """
+    return settings.RENDER_PARALLEL_WORKERS > 1 and not pool_worker.in_pool_worker
+
+
+def _render(work_dir, context_data):
+    if parallel_rendering():
+        files = _template_files(work_dir)
+        if len(files) >= settings.RENDER_PARALLEL_MIN_FILES:
+            return _render_parallel(work_dir, files, context_data)
+    return _render_in(work_dir, context_data)
+
+
+def _template_files(work_dir):
+    return sorted(
+        path.relative_to(work_dir)
+        for path in work_dir.rglob("*")
+        if path.is_file() and path.relative_to(work_dir) != Path(CONTEXT_FILE)
+    )
+
+
+def _partition(work_dir, files, count):
+    """Делит файлы на count частей близкого суммарного размера; результат детерминирован"""
+    sizes = {path: (work_dir / path).stat().st_size for path in files}
+    parts = [[] for _ in range(count)]
+    totals = [0] * count
+    for path in sorted(files, key=lambda path: (-sizes[path], str(path))):
+        index = totals.index(min(totals))
+        parts[index].append(path)
+        totals[index] += sizes[path]
+    return [sorted(part) for part in parts if part]
+
+
+def _render_part(work_dir, part_dir, directories, files, context_data):
+    """Генерирует подмножество файлов шаблона в отдельном рабочем каталоге.
+
+    Каталоги создаются все, чтобы пустые каталоги шаблона попали в результат
+    так же, как при последовательной генерации.
+    """
+    for directory in directories:
+        (part_dir / directory).mkdir(parents=True, exist_ok=True)
+    for path in files:
+        link_or_copy(work_dir / path, part_dir / path)
+    return _render_in(part_dir, context_data)
+
+
+def _files_under(root):
+    return {path.relative_to(root) for path in root.rglob("*") if not path.is_dir()}
+
+
+def _render_parallel(work_dir, files, context_data):
+    """Генерирует файлы шаблона частями в пуле и сливает результаты в один каталог.
+
+    Каждая часть рендерится самим движком, поэтому пути и содержимое файлов
+    совпадают с последовательной генерацией. Если два файла из разных частей
+    дают один и тот же путь, порядок записи стал бы недетерминированным —
+    тогда проект генерируется последовательно.
+    """
+    parts_root = work_dir / ".parts"
+    directories = sorted(
+        path.relative_to(work_dir) for path in work_dir.rglob("*") if path.is_dir()
+    )
+    parts = _partition(work_dir, files, settings.RENDER_PARALLEL_WORKERS)
+    executor = _get_parallel_pool() if settings.RENDER_PARALLEL_EXECUTOR == "process" else _get_thread_pool()
+    futures = [
+        executor.submit(_render_part, work_dir, parts_root / str(index), directories, part, context_data)
+        for index, part in enumerate(parts)
+    ]
+    output_dirs = []
+    try:
+        for future in futures:
+            output_dirs.append(future.result())
+
+        rendered = [_files_under(output_dir) for output_dir in output_dirs]
+        if sum(len(paths) for paths in rendered) != len(set().union(*rendered)):
+            for output_dir in output_dirs:
+                shutil.rmtree(output_dir, ignore_errors=True)
+            output_dirs = []
+            shutil.rmtree(parts_root, ignore_errors=True)
+            return _render_in(work_dir, context_data)
+
+        base, *others = output_dirs
+        for output_dir, paths in zip(others, rendered[1:]):
+            for path in sorted(paths):
+                (base / path).parent.mkdir(parents=True, exist_ok=True)
+                os.replace(output_dir / path, base / path)
+            shutil.rmtree(output_dir, ignore_errors=True)
+        return base
+    except Exception:
+        for future in futures:
+            future.cancel()
+        for output_dir in output_dirs:
+            shutil.rmtree(output_dir, ignore_errors=True)
+        raise
+
+
+def cleanup_render(output_dir, work_dir):
+    try:
+        shutil.rmtree(output_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    except Exception as e:
+        print(f"Error cleaning up output directory: {e}")
+
+
+def get_batch_pool():
+    """Общий для процесса пул, в котором пакетная генерация занимает все ядра.
+
+    Дочерние процессы инициализируют Django, чтобы принимать экземпляры моделей.
+    """
+    global _batch_pool
+    if _batch_pool is None:
+        _batch_pool = ProcessPoolExecutor(
+            max_workers=settings.RENDER_BATCH_WORKERS,
+            mp_context=get_context('spawn'),
+            initializer=init_pool_worker,
+        )
+    return _batch_pool
+
+
+def _get_parallel_pool():
+    """Пул частей одного проекта, отдельный от пакетного.
+
+    Части одиночной генерации не ждут в очереди за пакетами, а пакет не
+    занимает воркеры, которые нужны одиночным генерациям.
+    """
+    global _parallel_pool
+    if _parallel_pool is None:
+        _parallel_pool = ProcessPoolExecutor(
+            max_workers=settings.RENDER_PARALLEL_WORKERS,
+            mp_context=get_context('spawn'),
+            initializer=init_pool_worker,
+        )
+    return _parallel_pool
+
+
+def _get_thread_pool():
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(
+            max_workers=settings.RENDER_PARALLEL_WORKERS, thread_name_prefix="render"
+        )
+    return _thread_pool
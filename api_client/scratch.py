@@ -0,0 +1,321 @@
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+import weakref
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.http import JsonResponse
+
+# Рабочие каталоги генерации лежат отдельно от кэшей, чтобы сборщик не трогал их записи
+SCRATCH_SUBDIR = "scratch"
+# Записи о резервах всех процессов хоста: по файлу на резерв, с pid владельца и его каталогами
+LEDGER_SUBDIR = ".leases"
+# Как часто ожидающая генерация перечитывает резервы других процессов
+LEDGER_POLL_INTERVAL = 0.5
+
+
+class ScratchQuotaExceeded(Exception):
+    pass
+
+
+def scratch_unavailable(error):
+    """Ответ 503 на отказ в месте: клиент может повторить запрос позже"""
+    response = JsonResponse({"error": str(error)}, status=503)
+    response["Retry-After"] = str(settings.SCRATCH_ADMISSION_TIMEOUT)
+    return response
+
+
+def scratch_root(root):
+    return Path(root) / SCRATCH_SUBDIR
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def remove_path(path):
+    path = Path(path)
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+class ScratchLease:
+    """Резерв места под одну генерацию и все созданные под него каталоги.
+
+    release() удаляет каталоги и возвращает резерв; он вызывается один раз —
+    явно, при закрытии ответа или при сборке мусора самого резерва.
+    """
+
+    def __init__(self, space, nbytes, record):
+        self.nbytes = nbytes
+        self.record = record
+        self._space = space
+        self._paths = []
+        self._finalizer = weakref.finalize(self, space._release, self._paths, nbytes, record)
+
+    @property
+    def released(self):
+        return not self._finalizer.alive
+
+    def adopt(self, *paths):
+        """Передает резерву каталоги, созданные в другом месте (например, в пуле процессов)"""
+        if self.released:
+            for path in paths:
+                remove_path(path)
+            return
+        paths = [Path(path) for path in paths]
+        self._paths.extend(paths)
+        self._space._track(paths, self.record, self.nbytes, self._paths)
+
+    def adopt_result(self, future):
+        """Колбэк future, возвращающего пути; результат, готовый уже после release(), удаляется сразу"""
+        if not future.cancelled() and future.exception() is None:
+            self.adopt(*future.result())
+
+    def release(self):
+        self._finalizer()
+
+    def stream(self, chunks):
+        return LeasedStream(self, chunks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class LeasedStream:
+    """Итератор ответа, освобождающий резерв при закрытии.
+
+    Django закрывает содержимое StreamingHttpResponse в конце запроса и при
+    обрыве соединения — в том числе если отдача так и не началась, когда
+    finally в генераторе не выполняется.
+    """
+
+    def __init__(self, lease, chunks):
+        self.lease = lease
+        self.chunks = chunks
+
+    def __iter__(self):
+        try:
+            yield from self.chunks
+        finally:
+            self.close()
+
+    def close(self):
+        try:
+            close = getattr(self.chunks, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self.lease.release()
+
+
+class ScratchSpace:
+    """Учет рабочих каталогов генерации всех процессов хоста.
+
+    Генерация резервирует оценку нужного места и записывает резерв в общий
+    каталог записей под flock. Пока суммарный резерв всех живых процессов
+    превышает квоту или на диске меньше SCRATCH_MIN_FREE_BYTES, новые
+    генерации ждут освобождения, а по таймауту получают отказ. Записи
+    завершившихся процессов не учитываются и удаляются.
+
+    Сборщик в фоне удаляет каталоги, оставшиеся от упавших процессов; каталоги,
+    переданные живому резерву любого процесса, он не трогает.
+    """
+
+    def __init__(self, roots, quota_bytes, min_free_bytes):
+        self.roots = [scratch_root(root) for root in dict.fromkeys(roots)]
+        self.ledger_dir = self.roots[0] / LEDGER_SUBDIR
+        self.quota_bytes = quota_bytes
+        self.min_free_bytes = min_free_bytes
+        self._reserved = 0
+        self._active = 0
+        # Каталоги живых резервов процесса; сборщик их не удаляет, сколько бы ни шла отдача
+        self._leased = set()
+        self._condition = threading.Condition()
+        self._janitor = None
+        self.admitted = 0
+        self.rejected = 0
+        self.waited_seconds = 0.0
+        self.swept = 0
+
+    @contextmanager
+    def _ledger_lock(self):
+        self.ledger_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.ledger_dir / ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _leases(self):
+        """Записи резервов живых процессов; записи завершившихся удаляются"""
+        leases = []
+        if not self.ledger_dir.is_dir():
+            return leases
+        for record in self.ledger_dir.glob("*.json"):
+            try:
+                lease = json.loads(record.read_text())
+            except (FileNotFoundError, ValueError):
+                continue
+            if not process_alive(lease["pid"]):
+                record.unlink(missing_ok=True)
+                continue
+            leases.append(lease)
+        return leases
+
+    def _write_record(self, record, nbytes, paths):
+        # Запись заменяется целиком: читатель не увидит ее наполовину
+        data = json.dumps({"pid": os.getpid(), "nbytes": nbytes, "paths": [str(path) for path in paths]})
+        partial = record.with_suffix(".tmp")
+        partial.write_text(data)
+        os.replace(partial, record)
+
+    def _free_bytes(self, root):
+        root.mkdir(parents=True, exist_ok=True)
+        return shutil.disk_usage(root).free
+
+    def _fits(self, nbytes, root, leases):
+        if not leases:
+            # Одну генерацию пускаем всегда, даже если ее оценка больше квоты
+            return True
+        if sum(lease["nbytes"] for lease in leases) + nbytes > self.quota_bytes:
+            return False
+        return self._free_bytes(root) - nbytes >= self.min_free_bytes
+
+    def _try_admit(self, nbytes, root):
+        """Записывает резерв, если он помещается; возвращает путь записи или None"""
+        with self._ledger_lock():
+            if not self._fits(nbytes, root, self._leases()):
+                return None
+            record = self.ledger_dir / f"{os.getpid()}-{uuid.uuid4().hex}.json"
+            self._write_record(record, nbytes, [])
+            return record
+
+    def acquire(self, nbytes, root, timeout=None):
+        """Резервирует nbytes под генерацию в root; timeout=None — ждать без ограничения"""
+        self.start_janitor()
+        root = scratch_root(root)
+        started = time.monotonic()
+        with self._condition:
+            while True:
+                record = self._try_admit(nbytes, root)
+                if record is not None:
+                    break
+                wait = LEDGER_POLL_INTERVAL
+                if timeout is not None:
+                    wait = min(wait, started + timeout - time.monotonic())
+                    if wait <= 0:
+                        break
+                # Место освобождают и другие процессы, поэтому ожидание ограничено интервалом опроса
+                self._condition.wait(wait)
+            self.waited_seconds += time.monotonic() - started
+            if record is None:
+                self.rejected += 1
+                raise ScratchQuotaExceeded(
+                    f"Not enough scratch space for {nbytes} bytes, try again later"
+                )
+            self._reserved += nbytes
+            self._active += 1
+            self.admitted += 1
+        return ScratchLease(self, nbytes, record)
+
+    def _track(self, paths, record, nbytes, all_paths):
+        with self._condition:
+            self._leased.update(paths)
+            # Запись уже удалена release() из другого потока — восстанавливать ее нельзя
+            if record.exists():
+                self._write_record(record, nbytes, all_paths)
+
+    def _release(self, paths, nbytes, record):
+        for path in paths:
+            remove_path(path)
+        with self._condition:
+            record.unlink(missing_ok=True)
+            self._leased.difference_update(paths)
+            self._reserved -= nbytes
+            self._active -= 1
+            self._condition.notify_all()
+
+    def sweep(self, max_age):
+        """Удаляет элементы рабочих каталогов старше max_age секунд, не занятые живыми резервами"""
+        deadline = time.time() - max_age
+        with self._ledger_lock():
+            leased = {Path(path) for lease in self._leases() for path in lease["paths"]}
+        removed = 0
+        for root in self.roots:
+            if not root.is_dir():
+                continue
+            for path in root.iterdir():
+                if path == self.ledger_dir or path in leased:
+                    continue
+                with self._condition:
+                    if path in self._leased:
+                        continue
+                try:
+                    if path.lstat().st_mtime >= deadline:
+                        continue
+                except FileNotFoundError:
+                    continue
+                remove_path(path)
+                removed += 1
+        with self._condition:
+            self.swept += removed
+        return removed
+
+    def _janitor_loop(self):
+        while True:
+            try:
+                self.sweep(settings.SCRATCH_ORPHAN_AGE)
+            except Exception as e:
+                print(f"Scratch janitor failed: {e}")
+            time.sleep(settings.SCRATCH_JANITOR_INTERVAL)
+
+    def start_janitor(self):
+        if self._janitor is not None or not settings.SCRATCH_JANITOR_INTERVAL:
+            return
+        with self._condition:
+            if self._janitor is None:
+                self._janitor = threading.Thread(target=self._janitor_loop, name="scratch-janitor", daemon=True)
+                self._janitor.start()
+
+    def stats(self):
+        with self._ledger_lock():
+            leases = self._leases()
+        with self._condition:
+            return {
+                'active': self._active,
+                'reserved_bytes': self._reserved,
+                'host_active': len(leases),
+                'host_reserved_bytes': sum(lease["nbytes"] for lease in leases),
+                'quota_bytes': self.quota_bytes,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'waited_seconds': self.waited_seconds,
+                'swept': self.swept,
+                'free_bytes': {str(root): shutil.disk_usage(root).free for root in self.roots if root.is_dir()},
+            }
+
+
+scratch_space = ScratchSpace(
+    [settings.TEMPLATE_PROCESSING_DIR, settings.TEMPLATE_MEMORY_DIR],
+    settings.SCRATCH_QUOTA_BYTES,
+    settings.SCRATCH_MIN_FREE_BYTES,
+)
@@ -0,0 +1,180 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+_current = ContextVar("stage_timings", default=None)
+
+
+class StageHistograms:
+    """Гистограммы длительности этапов обработки в процессе, в формате Prometheus"""
+
+    def __init__(self, buckets):
+        self.buckets = sorted(buckets)
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._errors = {}
+
+    def observe(self, stage, seconds, error=None):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0}
+            histogram["counts"][bisect_left(self.buckets, seconds)] += 1
+            histogram["sum"] += seconds
+            if error is not None:
+                self._errors[(stage, error)] = self._errors.get((stage, error), 0) + 1
+
+    def prometheus(self):
+        """Текстовый формат Prometheus 0.0.4"""
+        with self._lock:
+            stages = {name: (list(h["counts"]), h["sum"]) for name, h in self._stages.items()}
+            errors = dict(self._errors)
+
+        lines = [
+            "# HELP codegen_stage_duration_seconds Duration of request processing stages",
+            "# TYPE codegen_stage_duration_seconds histogram",
+        ]
+        for name in sorted(stages):
+            counts, total = stages[name]
+            cumulative = 0
+            for bound, count in zip([*self.buckets, "+Inf"], counts):
+                cumulative += count
+                le = bound if bound == "+Inf" else repr(float(bound))
+                lines.append(f'codegen_stage_duration_seconds_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'codegen_stage_duration_seconds_sum{{stage="{name}"}} {total!r}')
+            lines.append(f'codegen_stage_duration_seconds_count{{stage="{name}"}} {cumulative}')
+        lines += [
+            "# HELP codegen_stage_errors_total Stages that ended with an exception",
+            "# TYPE codegen_stage_errors_total counter",
+        ]
+        for (name, error), count in sorted(errors.items()):
+            lines.append(f'codegen_stage_errors_total{{stage="{name}",error="{error}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+class StageTimings:
+    """Этапы одного запроса для заголовка Server-Timing"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.failed_stage = None
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def add(self, stage, seconds, failed):
+        with self._lock:
+            total, count = self._stages.get(stage, (0.0, 0))
+            self._stages[stage] = (total + seconds, count + 1)
+            # Первым завершается с ошибкой самый вложенный этап — он и есть источник
+            if failed and self.failed_stage is None:
+                self.failed_stage = stage
+
+    def header(self):
+        with self._lock:
+            stages = dict(self._stages)
+        items = []
+        for stage, (seconds, count) in stages.items():
+            item = f"{stage};dur={seconds * 1000:.1f}"
+            if count > 1:
+                item += f';desc="{count} calls"'
+            items.append(item)
+        items.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(items)
+
+
+@contextmanager
+def stage(name):
+    """Замер этапа: в гистограмму процесса и в Server-Timing текущего запроса"""
+    started = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        stage_histograms.observe(name, seconds, error)
+        timings = _current.get()
+        if timings is not None:
+            timings.add(name, seconds, error is not None)
+
+
+def timed_iter(name, iterable):
+    """Итератор, время внутри которого (без ожидания потребителя) считается одним этапом.
+
+    Тело потокового ответа формируется после отправки заголовков, поэтому
+    такой этап попадает только в гистограммы.
+    """
+    iterator = iter(iterable)
+    spent = 0.0
+    error = None
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            except BaseException as e:
+                error = type(e).__name__
+                raise
+            finally:
+                spent += time.perf_counter() - started
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+        stage_histograms.observe(name, spent, error)
+
+
+def failed_stage():
+    """Этап текущего запроса, на котором возникла ошибка, или None"""
+    timings = _current.get()
+    return timings.failed_stage if timings is not None else None
+
+
+class ServerTimingMiddleware:
+    """Собирает этапы запроса и отдает их в заголовке Server-Timing"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = StageTimings()
+        token = _current.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(response, timings)
+
+    async def __acall__(self, request):
+        timings = StageTimings()
+        token = _current.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(response, timings)
+
+    def finish(self, response, timings):
+        if settings.SERVER_TIMING_HEADER:
+            response["Server-Timing"] = timings.header()
+        return response
+
+
+stage_histograms = StageHistograms(settings.STAGE_TIMING_BUCKETS)
@@ -0,0 +1,165 @@
+import fcntl
+import os
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from zipfile import ZipFile
+
+from django.conf import settings
+
+from .blobs import archive_object_name
+from .minio_client import minio_client
+from .stage_timing import stage
+
+
+def link_or_copy(src, dst):
+    # Жесткие ссылки не копируют данные; между файловыми системами — обычная копия
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+@contextmanager
+def _flock(path, mode):
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, mode)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class TemplateArchiveCache:
+    """Кэш распакованных архивов шаблонов на локальном диске.
+
+    Запись идентифицируется id проекта и ETag объекта в MinIO, поэтому после
+    перезаливки архива старая запись перестает использоваться и со временем
+    вытесняется. Каталог кэша может использоваться несколькими процессами:
+    распаковка идет во временный каталог с атомарным переименованием,
+    выдача копий держит разделяемую блокировку, а вытеснение — эксклюзивную.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def archive_key(self, project):
+        """Идентичность хранимого архива проекта.
+
+        Для блоба — SHA-256 содержимого, без обращения к MinIO; проекты с
+        одинаковым архивом делят записи кэшей. У старых проектов — id и ETag объекта.
+        """
+        if project.file_id:
+            return project.file_id
+        stat = minio_client.stat_object(settings.MINIO_BUCKET_NAME, str(project.id))
+        etag = stat.etag.strip('"')
+        return f"{project.id}-{etag}"
+
+    def checkout(self, project, dest, key=None):
+        """Разворачивает дерево шаблона проекта в каталог dest"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        if key is None:
+            key = self.archive_key(project)
+        entry = self.root / key
+
+        with _flock(self.root / ".lock", fcntl.LOCK_SH):
+            if (entry / "tree").is_dir():
+                self._count("hits")
+            else:
+                with _flock(self.root / f".{key}.lock", fcntl.LOCK_EX):
+                    # Пока ждали блокировку, запись мог заполнить другой процесс
+                    if (entry / "tree").is_dir():
+                        self._count("hits")
+                    else:
+                        self._count("misses")
+                        self._fill(project, entry)
+            os.utime(entry)
+            shutil.copytree(entry / "tree", dest, copy_function=link_or_copy, dirs_exist_ok=True)
+
+        self._evict(keep=key)
+        return dest
+
+    def open_archive(self, key):
+        """Открытый архив записи или None, если записи (уже) нет"""
+        try:
+            return open(self.root / key / "archive.zip", "rb")
+        except FileNotFoundError:
+            return None
+
+    def _fill(self, project, entry):
+        tmp_dir = self.root / f".tmp-{uuid.uuid4()}"
+        archive_path = tmp_dir / "archive.zip"
+        tmp_dir.mkdir()
+        try:
+            minio_client.fget_object(settings.MINIO_BUCKET_NAME, archive_object_name(project), str(archive_path))
+            with ZipFile(archive_path, 'r') as zip_ref, stage("extract"):
+                zip_ref.extractall(tmp_dir / "tree")
+                size = sum(info.file_size for info in zip_ref.infolist())
+            # Архив остается в записи: из него берутся сжатые данные статических файлов
+            size += archive_path.stat().st_size
+            (tmp_dir / "size").write_text(str(size))
+            os.rename(tmp_dir, entry)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    def _entries(self):
+        entries = []
+        for path in self.root.iterdir():
+            if path.name.startswith(".") or not path.is_dir():
+                continue
+            try:
+                size = int((path / "size").read_text())
+                entries.append((path.stat().st_mtime, size, path))
+            except (OSError, ValueError):
+                continue
+        return entries
+
+    def _evict(self, keep=None):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+
+        with _flock(self.root / ".lock", fcntl.LOCK_EX):
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if path.name == keep:
+                    continue
+                trash = self.root / f".trash-{uuid.uuid4()}"
+                os.rename(path, trash)
+                shutil.rmtree(trash, ignore_errors=True)
+                (self.root / f".{path.name}.lock").unlink(missing_ok=True)
+                total -= size
+                self._count("evictions")
+
+    def _count(self, name):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self):
+        entries = self._entries() if self.root.is_dir() else []
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else None,
+                'entries': len(entries),
+                'size_bytes': sum(size for _, size, _ in entries),
+                'max_bytes': self.max_bytes,
+            }
+
+
+template_cache = TemplateArchiveCache(settings.TEMPLATE_CACHE_DIR, settings.TEMPLATE_CACHE_MAX_BYTES)
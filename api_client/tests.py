@@ -1,3 +1,1102 @@
-from django.test import TestCase
+import base64
+import hashlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.migrations.loader import MigrationLoader
+from django.test import SimpleTestCase, TestCase, override_settings
+from minio.error import S3Error
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from . import async_views, render_jobs, rendering, uploads, views
+from .authentication import authenticate_token_key
+from .blobs import blob_manifest_name, blob_object_name, collect_blob, reserve_blob
+from .compiled_templates import CompiledTemplate, CompiledTemplateCache
+from .fake_minio import InMemoryMinio
+from .minio_client import minio_client
+from .models import ClientToken, Project, RenderJob, TemplateBlob, UserProjectSummary, count_created_project
+from .object_streaming import parse_range
+from .render_cache import LocalRenderCache, MinioRenderCache
+from .scratch import ScratchQuotaExceeded, ScratchSpace
+from .stage_timing import StageHistograms, stage, timed_iter
+from .template_cache import TemplateArchiveCache
+from .token_cache import token_cache
+from .pagination import PaginationError, decode_cursor, encode_cursor
+from .uploads import UploadValidationError, upload_template
+from .zip_stream import ZipStream
+
+
+def write_tree(root, members):
+    """Создает дерево из {путь: байты, для пустого каталога — None}"""
+    for name, data in members.items():
+        path = root / name
+        if data is None:
+            path.mkdir(parents=True, exist_ok=True)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+    return root
+
+
+def build_zip(members, compression=zipfile.ZIP_DEFLATED):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression) as zip_ref:
+        for name, data in members.items():
+            zip_ref.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+class TrackingMinio(InMemoryMinio):
+    """Хранилище в памяти, которое считает открытые и возвращенные в пул ответы get_object"""
+
+    def __init__(self):
+        super().__init__()
+        self.opened = 0
+        self.released = 0
+
+    def get_object(self, *args, **kwargs):
+        response = super().get_object(*args, **kwargs)
+        self.opened += 1
+        release_conn = response.release_conn
+
+        def release():
+            self.released += 1
+            release_conn()
+
+        response.release_conn = release
+        return response
+
+
+class StorageMixin:
+    """MinIO в памяти, пользователь с токеном и загрузка проектов"""
+
+    archive_members = {'index.html': b'<h1>{{ templater.title }}</h1>'}
+
+    def setUp(self):
+        super().setUp()
+        self.storage = TrackingMinio()
+        for patcher in [
+            mock.patch.object(minio_client, '_client', self.storage),
+            mock.patch.object(minio_client, '_bucket_ready', False),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.user = get_user_model().objects.create_user(
+            username='user@example.com', email='user@example.com', password='password',
+        )
+        self.token = Token.objects.get_or_create(user=self.user)[0].key
+        self.archive = build_zip(self.archive_members).getvalue()
+        self.sha256 = hashlib.sha256(self.archive).hexdigest()
+
+    def headers(self):
+        return {'authorization': f'Token {self.token}'}
+
+    def upload(self, context=b'{"title": "x"}', **kwargs):
+        file = SimpleUploadedFile('template.zip', self.archive) if 'sha256' not in kwargs else None
+        project, _, uploaded = upload_template(
+            self.user, file, SimpleUploadedFile('context.json', context),
+            'name', 'description', 'type', 'draft', **kwargs,
+        )
+        return project, uploaded
+
+
+class ZipStreamRawTests(SimpleTestCase):
+    def stream(self, source, names, compression=zipfile.ZIP_DEFLATED):
+        stream = ZipStream(compression=compression, chunk_size=1024)
+        chunks = []
+        with zipfile.ZipFile(source) as zip_ref:
+            for name in names:
+                chunks.extend(stream.write_raw(zip_ref.getinfo(name), f"out/{name}", source))
+        chunks.extend(stream.write_bytes("out/extra.txt", b"extra"))
+        chunks.extend(stream.close())
+        return zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+
+    def test_raw_members_produce_valid_zip(self):
+        members = {"a.txt": b"hello " * 5000, "dir/b.bin": bytes(range(256)) * 40, "empty.txt": b""}
+        result = self.stream(build_zip(members), members)
+
+        self.assertIsNone(result.testzip())
+        self.assertEqual(
+            sorted(result.namelist()), ["out/a.txt", "out/dir/b.bin", "out/empty.txt", "out/extra.txt"],
+        )
+        for name, data in members.items():
+            self.assertEqual(result.read(f"out/{name}"), data)
+        self.assertEqual(result.getinfo("out/a.txt").compress_type, zipfile.ZIP_DEFLATED)
+
+    def test_stored_members_keep_compression(self):
+        members = {"a.txt": b"stored " * 1000}
+        result = self.stream(build_zip(members, zipfile.ZIP_STORED), members, compression=zipfile.ZIP_STORED)
+
+        self.assertIsNone(result.testzip())
+        info = result.getinfo("out/a.txt")
+        self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+        self.assertEqual(result.read(info), members["a.txt"])
+
+    def test_member_with_data_descriptor(self):
+        # Элементы, записанные в несохраняемый поток, несут размеры в data descriptor после данных
+        source = ZipStream(chunk_size=1024)
+        archive = io.BytesIO(b"".join([*source.write_bytes("a.txt", b"x" * 10000), *source.close()]))
+        result = self.stream(archive, ["a.txt"])
+
+        self.assertIsNone(result.testzip())
+        self.assertEqual(result.read("out/a.txt"), b"x" * 10000)
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        created_at = datetime(2026, 10, 18, 12, 30, 15, 123456, tzinfo=timezone.utc)
+        cursor = encode_cursor(created_at, 42)
+
+        self.assertNotIn("=", cursor)
+        self.assertEqual(decode_cursor(cursor), (created_at, 42))
+
+    def test_tampered_cursors_are_rejected(self):
+        def encode(value):
+            return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+        valid = encode_cursor(datetime(2026, 1, 1, tzinfo=timezone.utc), 1)
+        for cursor in [
+            "",
+            "not a cursor!",
+            valid[:-3],
+            encode(["2026-01-01T00:00:00+00:00"]),
+            encode(["2026-01-01T00:00:00+00:00", "1"]),
+            encode(["2026-01-01T00:00:00+00:00", 1.5]),
+            encode(["yesterday", 1]),
+            encode([None, 1]),
+            encode({"created_at": "2026-01-01T00:00:00+00:00", "id": 1}),
+        ]:
+            with self.subTest(cursor=cursor), self.assertRaises(PaginationError):
+                decode_cursor(cursor)
+
+
+class TemplateBlobTests(StorageMixin, TestCase):
+    def stored(self, object_name):
+        try:
+            minio_client.stat_object(settings.MINIO_BUCKET_NAME, object_name)
+        except S3Error:
+            return False
+        return True
+
+    def ref_count(self):
+        return TemplateBlob.objects.get(sha256=self.sha256).ref_count
+
+    def test_same_archive_is_stored_once(self):
+        first, first_uploaded = self.upload()
+        second, second_uploaded = self.upload()
+        third, third_uploaded = self.upload(sha256=self.sha256, file_name='template.zip')
+
+        self.assertEqual((first_uploaded, second_uploaded, third_uploaded), (True, False, False))
+        self.assertEqual({first.file_id, second.file_id, third.file_id}, {self.sha256})
+        self.assertEqual(self.ref_count(), 3)
+        self.assertTrue(TemplateBlob.objects.get(sha256=self.sha256).ready)
+        self.assertTrue(self.stored(blob_object_name(self.sha256)))
+        self.assertTrue(self.stored(blob_manifest_name(self.sha256)))
+
+    def test_deleting_last_project_collects_blob(self):
+        first, _ = self.upload()
+        second, _ = self.upload()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.ref_count(), 1)
+        self.assertTrue(self.stored(blob_object_name(self.sha256)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(TemplateBlob.objects.filter(sha256=self.sha256).exists())
+        self.assertFalse(self.stored(blob_object_name(self.sha256)))
+        self.assertFalse(self.stored(blob_manifest_name(self.sha256)))
+
+    def test_collect_keeps_reacquired_blob(self):
+        project, _ = self.upload()
+        with self.captureOnCommitCallbacks() as callbacks:
+            project.delete()
+        self.assertEqual(self.ref_count(), 0)
+
+        # Тот же архив загружен снова до того, как сработал отложенный collect_blob
+        _, uploaded = self.upload()
+        for callback in callbacks:
+            callback()
+
+        self.assertFalse(uploaded)
+        self.assertEqual(self.ref_count(), 1)
+        self.assertTrue(self.stored(blob_object_name(self.sha256)))
+
+    def test_pending_blob_is_not_referenced_or_collected(self):
+        reserve_blob(self.sha256, len(self.archive))
+
+        with self.assertRaises(UploadValidationError):
+            self.upload(sha256=self.sha256, file_name='template.zip')
+        self.assertFalse(collect_blob(self.sha256))
+
+        TemplateBlob.objects.filter(sha256=self.sha256).update(
+            created_at=datetime.now(timezone.utc) - timedelta(seconds=settings.TEMPLATE_BLOB_PENDING_TIMEOUT + 1),
+        )
+        self.assertTrue(collect_blob(self.sha256))
+
+    def test_upload_completes_pending_blob(self):
+        reserve_blob(self.sha256, len(self.archive))
+        _, uploaded = self.upload()
+
+        self.assertTrue(uploaded)
+        self.assertTrue(TemplateBlob.objects.get(sha256=self.sha256).ready)
+        self.assertEqual(self.ref_count(), 1)
+
+    def post_upload(self, headers=None, **fields):
+        data = {
+            'file': SimpleUploadedFile('template.zip', self.archive),
+            'json_file': SimpleUploadedFile('context.json', b'{"title": "x"}'),
+            'project_name': 'name', 'description': 'description', 'project_type': 'type', 'status': 'draft',
+            **fields,
+        }
+        # Хеш считается при приеме запроса: загрузка не перечитывается
+        with mock.patch.object(uploads, 'HashingReader', side_effect=AssertionError):
+            return self.client.post('/api_client/upload-template/', data, headers=headers)
+
+    def test_api_upload_hashes_while_receiving(self):
+        response = self.post_upload(self.headers())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['sha256'], self.sha256)
+        self.assertEqual(TemplateBlob.objects.get(sha256=self.sha256).size, len(self.archive))
+        stored = self.storage.get_object(settings.MINIO_BUCKET_NAME, blob_object_name(self.sha256))
+        self.assertEqual(stored.read(), self.archive)
+
+    def test_client_sha256_is_ignored_with_file(self):
+        response = self.post_upload(self.headers(), sha256='0' * 64)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['sha256'], self.sha256)
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_satisfiable_ranges(self):
+        for header, expected in [
+            ("bytes=0-0", (0, 0)),
+            ("bytes=10-19", (10, 19)),
+            ("bytes=90-", (90, 99)),
+            ("bytes=90-1000", (90, 99)),
+            ("bytes=-10", (90, 99)),
+            ("bytes=-1000", (0, 99)),
+            (" bytes=5-5 ", (5, 5)),
+        ]:
+            with self.subTest(header=header):
+                self.assertEqual(parse_range(header, 100), expected)
+
+    def test_ignored_headers(self):
+        for header in [None, "", "bytes=-", "bytes=0-1,5-6", "items=0-1", "bytes=a-b", "bytes=10-5"]:
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range(header, 100))
+
+    def test_unsatisfiable_ranges(self):
+        for header, size in [("bytes=100-", 100), ("bytes=100-200", 100), ("bytes=-0", 100), ("bytes=0-", 0),
+                             ("bytes=-5", 0)]:
+            with self.subTest(header=header, size=size):
+                self.assertIs(parse_range(header, size), False)
+
+
+class ObjectStreamingTests(StorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.project, _ = self.upload()
+        self.url = f'/api_client/download-template/{self.project.id}/'
+
+    def test_head_does_not_open_object(self):
+        response = self.client.head(self.url, headers=self.headers())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], str(len(self.archive)))
+        self.assertEqual((self.storage.opened, self.storage.released), (0, 0))
+
+    def test_unread_body_does_not_open_object(self):
+        response = self.client.get(self.url, headers=self.headers())
+        response.close()
+
+        self.assertEqual((self.storage.opened, self.storage.released), (0, 0))
+
+    def test_streamed_body_releases_connection(self):
+        full = self.client.get(self.url, headers=self.headers())
+        self.assertEqual(b''.join(full.streaming_content), self.archive)
+
+        partial = self.client.get(self.url, headers={**self.headers(), 'range': 'bytes=2-9'})
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(b''.join(partial.streaming_content), self.archive[2:10])
+        self.assertEqual((self.storage.opened, self.storage.released), (2, 2))
+
+    def test_render_cache_lookup_opens_object_lazily(self):
+        cache = MinioRenderCache('render-cache/', ttl=60, max_bytes=1024 * 1024)
+        cache.store('key', [b'cached ', b'output'])
+
+        chunks, size = cache.lookup('key')
+        self.assertEqual((size, self.storage.opened), (13, 0))
+        self.assertEqual(b''.join(chunks), b'cached output')
+        self.assertEqual((self.storage.opened, self.storage.released), (1, 1))
+
+
+class WorkDirMixin:
+    """Рабочие каталоги генерации во временном каталоге теста"""
+
+    def setUp(self):
+        super().setUp()
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        self.root = Path(scratch.name)
+        override = override_settings(TEMPLATE_PROCESSING_DIR=self.root / 'work', TEMPLATE_RENDER_MODE='disk')
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class TemplateTreeMixin(WorkDirMixin):
+    """Дерево шаблона с подстановками в путях и телах, пустым каталогом и бинарным файлом"""
+
+    template_members = {
+        '{{ templater.name }}/main.py': b'print("{{ templater.title }}")\n',
+        '{{ templater.name }}/{{templater.module}}.txt': b'{{ templater.title }} / {{ templater.name }}',
+        'static/logo.bin': bytes(range(256)) * 8,
+        'static/readme.md': b'no placeholders here',
+        'empty/nested': None,
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.source = write_tree(self.root / 'template', self.template_members)
+
+
+class CompiledTemplateTests(TemplateTreeMixin, SimpleTestCase):
+    contexts = [
+        {'name': 'app', 'title': 'Hello', 'module': 'core'},
+        {'name': 'app', 'title': '', 'module': 'core'},
+        {'name': 'проект', 'title': '<&"\'é>', 'module': 'mod ule'},
+        {'name': 'app', 'title': '{{ templater.name }}', 'module': '{{x}}'},
+        {'name': 'app', 'title': 'x' * 10000, 'module': 'core', 'unused': 'value'},
+    ]
+
+    def compile(self):
+        cache = CompiledTemplateCache(1024 * 1024)
+        return cache, cache.compile('key', self.source, rendering._engine_snapshot)
+
+    def test_compiled_output_matches_engine(self):
+        cache, template = self.compile()
+        self.assertIsInstance(template, CompiledTemplate)
+        for index, context in enumerate(self.contexts):
+            with self.subTest(context=context):
+                self.assertTrue(template.accepts(context))
+                self.assertEqual(template.render(context), rendering._engine_snapshot(self.source, context))
+                output_dir = cache.render(template, context, self.root / f'out{index}')
+                self.assertEqual(
+                    {path.relative_to(output_dir).as_posix(): None if path.is_dir() else path.read_bytes()
+                     for path in output_dir.rglob('*')},
+                    rendering._engine_snapshot(self.source, context),
+                )
+
+    def test_unsupported_contexts_fall_back_to_engine(self):
+        cache, template = self.compile()
+        for context in [
+            {'name': 'app', 'title': 1, 'module': 'core'},
+            {'name': 'app', 'title': None, 'module': 'core'},
+            {'name': 'app', 'module': 'core'},
+            {'name': '', 'title': 'x', 'module': 'core'},
+            {'name': 'a/b', 'title': 'x', 'module': 'core'},
+            {'name': '..', 'title': 'x', 'module': 'core'},
+            ['app'],
+        ]:
+            with self.subTest(context=context):
+                self.assertFalse(template.accepts(context))
+                self.assertIsNone(cache.render(template, context, self.root / 'fallback'))
+        self.assertEqual(cache.stats()['engine_fallbacks'], 7)
+
+    def test_other_constructs_are_not_compiled(self):
+        (self.source / 'filtered.txt').write_bytes(b'{{ templater.title | upper }}')
+        cache, template = self.compile()
+
+        self.assertIsNone(cache.render(template, self.contexts[0], self.root / 'out'))
+        self.assertEqual(cache.stats()['unsupported'], 1)
+
+
+def tree_snapshot(root):
+    return {path.relative_to(root).as_posix(): None if path.is_dir() else path.read_bytes() for path in root.rglob('*')}
+
+
+class ParallelRenderingTests(TemplateTreeMixin, SimpleTestCase):
+    template_members = {
+        **TemplateTreeMixin.template_members,
+        **{f'pages/{{{{ templater.name }}}}_{index}.html': b'<p>{{ templater.title }} %d</p>' % index
+           for index in range(20)},
+        'pages/empty': None,
+        'assets/image.bin': bytes(range(256)) * 64,
+    }
+    context = {'name': 'app', 'title': 'Hello', 'module': 'core'}
+
+    def render(self, **overrides):
+        with override_settings(**overrides):
+            output_dir, work_dir = rendering.render_tree(self.source, self.context)
+        try:
+            return tree_snapshot(output_dir)
+        finally:
+            rendering.cleanup_render(output_dir, work_dir)
+
+    def render_both(self, executor):
+        serial = self.render(RENDER_PARALLEL_WORKERS=1)
+        with mock.patch.object(rendering, '_render_parallel', wraps=rendering._render_parallel) as parallel:
+            result = self.render(
+                RENDER_PARALLEL_WORKERS=3, RENDER_PARALLEL_EXECUTOR=executor, RENDER_PARALLEL_MIN_FILES=1,
+            )
+        self.assertTrue(parallel.called)
+        return serial, result
+
+    def test_thread_parallel_output_matches_serial(self):
+        serial, parallel = self.render_both('thread')
+
+        self.assertEqual(parallel, serial)
+        self.assertIn('app/core.txt', parallel)
+        self.assertIsNone(parallel['pages/empty'])
+        self.assertIsNone(parallel['empty/nested'])
+        self.assertEqual(parallel['assets/image.bin'], self.template_members['assets/image.bin'])
+
+    def test_process_parallel_output_matches_serial(self):
+        serial, parallel = self.render_both('process')
+
+        self.assertEqual(parallel, serial)
+
+    def test_colliding_paths_fall_back_to_serial(self):
+        write_tree(self.source, {'app/main.py': b'static'})
+        serial, parallel = self.render_both('thread')
+
+        self.assertEqual(parallel, serial)
+
+
+class RenderJobTests(WorkDirMixin, StorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.project, _ = self.upload()
+
+    def create_job(self, **kwargs):
+        return RenderJob.objects.create(user=self.user, project=self.project, context={'title': 'x'}, **kwargs)
+
+    def age(self, job, **fields):
+        past = datetime.now(timezone.utc) - timedelta(seconds=settings.RENDER_JOB_TIMEOUT + 1)
+        RenderJob.objects.filter(id=job.id).update(**{name: past for name in fields})
+
+    def test_claim_takes_oldest_queued_job_once(self):
+        first, second = self.create_job(), self.create_job()
+
+        claimed = render_jobs.claim_next_job('host:1')
+        self.assertEqual(claimed.id, first.id)
+        self.assertEqual((claimed.state, claimed.worker), (RenderJob.STATE_RUNNING, 'host:1'))
+        self.assertIsNotNone(claimed.heartbeat_at)
+        self.assertEqual(render_jobs.claim_next_job('host:2').id, second.id)
+        self.assertIsNone(render_jobs.claim_next_job('host:2'))
+
+    def test_requeue_only_jobs_without_heartbeat(self):
+        live, dead = self.create_job(), self.create_job()
+        render_jobs.claim_next_job('live:1')
+        render_jobs.claim_next_job('dead:1')
+        # Обе задачи идут дольше таймаута, но пульс отправляет только живой воркер
+        self.age(live, started_at=True, heartbeat_at=True)
+        self.age(dead, started_at=True, heartbeat_at=True)
+        self.assertEqual(render_jobs.heartbeat_jobs('live:1', [live.id, dead.id]), 1)
+
+        self.assertEqual(render_jobs.requeue_stale_jobs(), 1)
+        live.refresh_from_db()
+        dead.refresh_from_db()
+        self.assertEqual((live.state, live.worker), (RenderJob.STATE_RUNNING, 'live:1'))
+        self.assertEqual((dead.state, dead.worker, dead.heartbeat_at), (RenderJob.STATE_QUEUED, '', None))
+
+    def test_run_job_honors_output_options(self):
+        response = self.client.post(
+            f'/api_client/process-template/?project_id={self.project.id}&mode=async&archive=tar.gz',
+            {'title': 'Hello'}, content_type='application/json', headers=self.headers(),
+        )
+        self.assertEqual(response.status_code, 202)
+        job = render_jobs.claim_next_job('host:1')
+
+        self.assertEqual(render_jobs.run_job(job.id, 'host:1'), RenderJob.STATE_FINISHED)
+        job.refresh_from_db()
+        self.assertTrue(job.result_object.endswith('.tar.gz'))
+
+        download = self.client.get(f'/api_client/render-jobs/{job.id}/download/', headers=self.headers())
+        self.assertEqual(download['Content-Type'], 'application/gzip')
+        self.assertIn('processed_template.tar.gz', download['Content-Disposition'])
+        with tarfile.open(fileobj=io.BytesIO(b''.join(download.streaming_content))) as tar:
+            members = {member.name: member for member in tar.getmembers() if member.isfile()}
+            self.assertEqual(len(members), 1)
+            self.assertEqual(tar.extractfile(next(iter(members.values()))).read(), b'<h1>Hello</h1>')
+
+    def test_failed_and_lost_jobs(self):
+        job = self.create_job()
+        render_jobs.claim_next_job('host:1')
+        with mock.patch.object(render_jobs, 'render_project', side_effect=RuntimeError('engine failed')):
+            self.assertEqual(render_jobs.run_job(job.id, 'host:1'), RenderJob.STATE_FAILED)
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.error), (RenderJob.STATE_FAILED, 'engine failed'))
+
+        # Задача вернулась в очередь и досталась другому воркеру: результат первого не записывается
+        lost = self.create_job()
+        render_jobs.claim_next_job('host:1')
+        self.age(lost, heartbeat_at=True)
+        render_jobs.requeue_stale_jobs()
+        render_jobs.claim_next_job('host:2')
+        self.assertEqual(render_jobs.run_job(lost.id, 'host:1'), 'lost')
+        render_jobs.mark_job_crashed(lost.id, 'host:1', 'killed')
+        lost.refresh_from_db()
+        self.assertEqual((lost.state, lost.worker, lost.error), (RenderJob.STATE_RUNNING, 'host:2', ''))
+
+        render_jobs.mark_job_crashed(lost.id, 'host:2', 'killed')
+        lost.refresh_from_db()
+        self.assertEqual((lost.state, lost.error), (RenderJob.STATE_FAILED, 'killed'))
+
+    def test_expired_jobs_are_removed_with_results(self):
+        job = self.create_job()
+        render_jobs.claim_next_job('host:1')
+        render_jobs.run_job(job.id, 'host:1')
+        job.refresh_from_db()
+        fresh = self.create_job()
+        render_jobs.claim_next_job('host:1')
+        render_jobs.run_job(fresh.id, 'host:1')
+
+        RenderJob.objects.filter(id=job.id).update(
+            finished_at=datetime.now(timezone.utc) - timedelta(seconds=settings.RENDER_JOB_RESULT_TTL + 1),
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(render_jobs.expire_jobs(), 1)
+
+        self.assertEqual(list(RenderJob.objects.values_list('id', flat=True)), [fresh.id])
+        with self.assertRaises(S3Error):
+            minio_client.stat_object(settings.MINIO_BUCKET_NAME, job.result_object)
+
+
+class AsyncViewTests(WorkDirMixin, StorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.project, _ = self.upload()
+        # Процессы пула не видят хранилище в памяти
+        pool = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(pool.shutdown)
+        for patcher in [
+            mock.patch.object(async_views, 'get_batch_pool', return_value=pool),
+            mock.patch.object(async_views, 'render_cache',
+                              LocalRenderCache(self.root / 'render_cache', ttl=60, max_bytes=1024 * 1024)),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def read(self, response):
+        if not response.streaming:
+            return response.content
+        return b''.join([chunk async for chunk in response.streaming_content])
+
+    async def process(self, query='', **headers):
+        return await self.async_client.post(
+            f'/api_client/async/process-template/?project_id={self.project.id}{query}', {'title': 'Hello'},
+            content_type='application/json', headers={**self.headers(), **headers},
+        )
+
+    async def test_token_is_required(self):
+        for headers in [{}, {'authorization': 'Token wrong'}, {'authorization': 'Token a b'}]:
+            with self.subTest(headers=headers):
+                response = await self.async_client.get(
+                    f'/api_client/async/download-template/{self.project.id}/', headers=headers,
+                )
+                self.assertEqual(response.status_code, 401)
+                self.assertEqual(response['WWW-Authenticate'], 'Token')
+
+    async def test_download_and_range(self):
+        url = f'/api_client/async/download-template/{self.project.id}/'
+        response = await self.async_client.get(url, headers=self.headers())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await self.read(response), self.archive)
+        self.assertEqual(response['Content-Length'], str(len(self.archive)))
+
+        partial = await self.async_client.get(url, headers={**self.headers(), 'range': 'bytes=0-9'})
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(await self.read(partial), self.archive[:10])
+        self.assertEqual(self.storage.opened, self.storage.released)
+
+    async def test_context_and_missing_project(self):
+        response = await self.async_client.get(
+            f'/api_client/async/get-template-json/{self.project.id}/', headers=self.headers(),
+        )
+        self.assertEqual((response.status_code, await self.read(response)), (200, b'{"title": "x"}'))
+
+        missing = await self.async_client.get('/api_client/async/get-template-json/0/', headers=self.headers())
+        self.assertEqual(missing.status_code, 404)
+
+    async def test_process_renders_and_caches(self):
+        response = await self.process()
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(await self.read(response))) as zip_ref:
+            self.assertEqual(zip_ref.read('index.html'), b'<h1>Hello</h1>')
+        self.assertEqual(list((self.root / 'work' / 'scratch').iterdir()), [])
+
+        not_modified = await self.process(if_none_match=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        cached = await self.process()
+        self.assertEqual(cached.status_code, 200)
+        self.assertIn('Content-Length', cached)
+
+    async def test_process_in_job_mode(self):
+        response = await self.process('&mode=async')
+
+        self.assertEqual(response.status_code, 202)
+        job = await RenderJob.objects.aget(id=response.json()['job_id'])
+        self.assertEqual((job.project_id, job.context), (self.project.id, {'title': 'Hello'}))
+
+
+class StageHistogramsTests(SimpleTestCase):
+    def test_buckets_are_cumulative(self):
+        histograms = StageHistograms([0.01, 0.1, 1])
+        for seconds in [0.005, 0.05, 0.05, 5]:
+            histograms.observe('render', seconds)
+        histograms.observe('render', 0.5, error='OSError')
+
+        lines = histograms.prometheus().splitlines()
+        self.assertIn('codegen_stage_duration_seconds_bucket{stage="render",le="0.01"} 1', lines)
+        self.assertIn('codegen_stage_duration_seconds_bucket{stage="render",le="0.1"} 3', lines)
+        self.assertIn('codegen_stage_duration_seconds_bucket{stage="render",le="1.0"} 4', lines)
+        self.assertIn('codegen_stage_duration_seconds_bucket{stage="render",le="+Inf"} 5', lines)
+        self.assertIn('codegen_stage_duration_seconds_count{stage="render"} 5', lines)
+        self.assertIn('codegen_stage_errors_total{stage="render",error="OSError"} 1', lines)
+
+    def test_failed_stage_and_iterators_are_recorded(self):
+        histograms = StageHistograms([1])
+        with mock.patch('api_client.stage_timing.stage_histograms', histograms):
+            with self.assertRaises(KeyError), stage('lookup'):
+                raise KeyError('x')
+            self.assertEqual(list(timed_iter('archive', iter([b'a', b'b']))), [b'a', b'b'])
+
+        text = histograms.prometheus()
+        self.assertIn('codegen_stage_errors_total{stage="lookup",error="KeyError"} 1', text)
+        self.assertIn('codegen_stage_duration_seconds_count{stage="archive"} 1', text)
+
+
+class StageMetricsViewTests(WorkDirMixin, StorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.project, _ = self.upload()
+
+    def process(self):
+        response = self.client.post(
+            f'/api_client/process-template/?project_id={self.project.id}', {'title': 'Hello'},
+            content_type='application/json', headers=self.headers(),
+        )
+        b''.join(response.streaming_content)
+        return response
+
+    def test_server_timing_lists_request_stages(self):
+        stages = {item.split(';')[0] for item in self.process()['Server-Timing'].split(', ')}
+
+        self.assertTrue({'project_lookup', 'render', 'total'} <= stages, stages)
+        with override_settings(SERVER_TIMING_HEADER=False):
+            self.assertNotIn('Server-Timing', self.process())
+
+    def test_metrics_are_for_admins(self):
+        self.process()
+        url = '/api_client/metrics/'
+        self.assertEqual(self.client.get(url, headers=self.headers()).status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url, headers=self.headers())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('codegen_stage_duration_seconds_count{stage="render"}', response.content.decode())
+
+
+class ScratchSpaceTests(WorkDirMixin, StorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.space = ScratchSpace([self.root / 'work'], quota_bytes=1000, min_free_bytes=0)
+        patcher = mock.patch.object(rendering, 'scratch_space', self.space)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def foreign_lease(self, nbytes, pid=None, paths=()):
+        """Запись резерва другого процесса; по умолчанию — живого родителя теста"""
+        self.space.ledger_dir.mkdir(parents=True, exist_ok=True)
+        record = self.space.ledger_dir / f'foreign-{nbytes}.json'
+        record.write_text(json.dumps({'pid': pid or os.getppid(), 'nbytes': nbytes, 'paths': list(map(str, paths))}))
+        return record
+
+    def dead_pid(self):
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        return process.pid
+
+    def test_quota_counts_other_processes(self):
+        self.foreign_lease(800)
+        with self.assertRaises(ScratchQuotaExceeded):
+            self.space.acquire(300, self.root / 'work', timeout=0)
+
+        with self.space.acquire(200, self.root / 'work', timeout=0):
+            self.assertEqual(self.space.stats()['host_reserved_bytes'], 1000)
+        self.assertEqual(self.space.stats()['host_reserved_bytes'], 800)
+        self.assertEqual((self.space.admitted, self.space.rejected), (1, 1))
+
+    def test_dead_process_leases_are_dropped(self):
+        record = self.foreign_lease(800, pid=self.dead_pid())
+        with self.space.acquire(300, self.root / 'work', timeout=0):
+            pass
+        self.assertFalse(record.exists())
+
+    def test_single_render_is_admitted_over_quota(self):
+        with self.space.acquire(5000, self.root / 'work', timeout=0):
+            with self.assertRaises(ScratchQuotaExceeded):
+                self.space.acquire(1, self.root / 'work', timeout=0)
+
+    def test_release_removes_directories_and_record(self):
+        lease = self.space.acquire(100, self.root / 'work', timeout=0)
+        work_dir = write_tree(self.space.roots[0] / 'job', {'a.txt': b'a'})
+        lease.adopt(work_dir)
+        self.assertEqual(json.loads(lease.record.read_text())['paths'], [str(work_dir)])
+
+        stream = lease.stream(iter([b'chunk']))
+        self.assertEqual(list(stream), [b'chunk'])
+        self.assertTrue(lease.released)
+        self.assertFalse(work_dir.exists())
+        self.assertFalse(lease.record.exists())
+        self.assertEqual(self.space.stats()['host_active'], 0)
+
+    def test_janitor_skips_directories_of_live_leases(self):
+        root = self.space.roots[0]
+        live = write_tree(root / 'live', {'a.txt': b'a'})
+        orphan = write_tree(root / 'orphan', {'a.txt': b'a'})
+        dead = write_tree(root / 'dead', {'a.txt': b'a'})
+        self.foreign_lease(10, paths=[live])
+        self.foreign_lease(20, pid=self.dead_pid(), paths=[dead])
+        old = datetime.now().timestamp() - 3600
+        for path in (live, orphan, dead):
+            os.utime(path, (old, old))
+
+        self.assertEqual(self.space.sweep(60), 2)
+        self.assertTrue(live.exists())
+        self.assertFalse(orphan.exists())
+        self.assertFalse(dead.exists())
+        self.assertTrue(self.space.ledger_dir.exists())
+
+    @override_settings(SCRATCH_ADMISSION_TIMEOUT=0)
+    def test_view_answers_503_when_scratch_is_full(self):
+        project, _ = self.upload()
+        self.foreign_lease(1000)
+        response = self.client.post(
+            f'/api_client/process-template/?project_id={project.id}', {'title': 'x'},
+            content_type='application/json', headers=self.headers(),
+        )
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '0')
+
+
+class TemplateArchiveCacheTests(WorkDirMixin, StorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.project, _ = self.upload()
+        self.cache = TemplateArchiveCache(self.root / 'cache', max_bytes=1024 * 1024)
+
+    def checkout(self, project, name='dest'):
+        with mock.patch.object(self.storage, 'fget_object', wraps=self.storage.fget_object) as fetched:
+            dest = self.cache.checkout(project, self.root / name)
+        return tree_snapshot(dest), fetched.call_count
+
+    def legacy_project(self, archive):
+        project = Project.objects.create(
+            user=self.user, project_name='legacy', description='description', project_type='type',
+            status='draft', file_name='template.zip',
+        )
+        minio_client.put_object(settings.MINIO_BUCKET_NAME, str(project.id), io.BytesIO(archive), len(archive))
+        return project
+
+    def test_second_checkout_is_served_from_disk(self):
+        first, first_fetches = self.checkout(self.project, 'first')
+        second, second_fetches = self.checkout(self.project, 'second')
+
+        self.assertEqual(first, {'index.html': self.archive_members['index.html']})
+        self.assertEqual(second, first)
+        self.assertEqual((first_fetches, second_fetches), (1, 0))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(self.cache.archive_key(self.project), self.sha256)
+
+    def test_projects_with_same_archive_share_entry(self):
+        other, _ = self.upload()
+        self.checkout(self.project, 'first')
+        _, fetches = self.checkout(other, 'second')
+
+        self.assertEqual(fetches, 0)
+        self.assertEqual(self.cache.stats()['entries'], 1)
+
+    def test_reuploaded_legacy_archive_gets_new_entry(self):
+        project = self.legacy_project(self.archive)
+        key = self.cache.archive_key(project)
+        self.checkout(project, 'first')
+
+        changed = build_zip({'index.html': b'changed'}).getvalue()
+        minio_client.put_object(settings.MINIO_BUCKET_NAME, str(project.id), io.BytesIO(changed), len(changed))
+        tree, fetches = self.checkout(project, 'second')
+
+        self.assertNotEqual(self.cache.archive_key(project), key)
+        self.assertTrue(self.cache.archive_key(project).startswith(f'{project.id}-'))
+        self.assertEqual((tree, fetches), ({'index.html': b'changed'}, 1))
+
+    def test_eviction_keeps_entry_in_use(self):
+        self.cache.max_bytes = 1
+        other = self.legacy_project(build_zip({'other.txt': b'x' * 1000}).getvalue())
+        self.checkout(self.project, 'first')
+        tree, _ = self.checkout(other, 'second')
+
+        self.assertEqual(tree, {'other.txt': b'x' * 1000})
+        self.assertEqual(self.cache.evictions, 1)
+        self.assertEqual([path.name for path in (self.root / 'cache').iterdir() if not path.name.startswith('.')],
+                         [self.cache.archive_key(other)])
+
+    def test_concurrent_checkouts_fill_entry_once(self):
+        errors = []
+
+        def checkout(index):
+            try:
+                self.cache.checkout(self.project, self.root / f'dest-{index}', self.sha256)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=checkout, args=(index,)) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual((self.cache.hits, self.cache.misses), (7, 1))
+        for index in range(8):
+            self.assertEqual(tree_snapshot(self.root / f'dest-{index}'), {'index.html': self.archive_members['index.html']})
+
+
+class RenderCacheViewTests(WorkDirMixin, StorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.project, _ = self.upload()
+        self.use_cache(LocalRenderCache(self.root / 'render_cache', ttl=60, max_bytes=1024 * 1024))
+
+    def use_cache(self, cache):
+        self.cache = cache
+        patcher = mock.patch.object(views, 'render_cache', cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, query='', **headers):
+        with mock.patch.object(views, 'render_project', wraps=views.render_project) as render:
+            response = self.client.post(
+                f'/api_client/process-template/?project_id={self.project.id}{query}', {'title': 'Hello'},
+                content_type='application/json', headers={**self.headers(), **headers},
+            )
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body, render.called
+
+    def test_etag_and_not_modified(self):
+        first, body, rendered = self.post()
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(rendered)
+        etag = first['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+
+        not_modified, body_304, rendered = self.post(if_none_match=etag)
+        self.assertEqual((not_modified.status_code, body_304, rendered), (304, b'', False))
+        self.assertEqual(not_modified['ETag'], etag)
+
+        cached, cached_body, rendered = self.post()
+        self.assertEqual((cached.status_code, rendered), (200, False))
+        self.assertEqual(cached['Content-Length'], str(len(body)))
+        self.assertEqual(cached_body, body)
+
+    def test_no_cache_renders_again(self):
+        self.post()
+        response, _, rendered = self.post(cache_control='no-cache')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(rendered)
+
+    def test_variants_have_own_etag_and_extension(self):
+        self.use_cache(MinioRenderCache('render-cache/', ttl=60, max_bytes=1024 * 1024))
+        zip_response, _, _ = self.post()
+        tar_response, body, _ = self.post('&archive=tar.gz')
+
+        self.assertNotEqual(zip_response['ETag'], tar_response['ETag'])
+        self.assertEqual(tar_response['Content-Type'], 'application/gzip')
+        names = sorted(obj.object_name for obj in minio_client.list_objects(
+            settings.MINIO_BUCKET_NAME, prefix='render-cache/', recursive=True,
+        ))
+        self.assertEqual(sorted(name.endswith('.tar.gz') for name in names), [False, True])
+        self.assertTrue(all(name.endswith(('.zip', '.tar.gz')) for name in names))
+        tar_object = next(name for name in names if name.endswith('.tar.gz'))
+        self.assertEqual(minio_client.stat_object(settings.MINIO_BUCKET_NAME, tar_object).size, len(body))
+
+    def test_minio_eviction_lists_prefix_at_most_once_per_interval(self):
+        cache = MinioRenderCache('render-cache/', ttl=60, max_bytes=10, evict_interval=60)
+        with mock.patch.object(self.storage, 'list_objects', wraps=self.storage.list_objects) as listed:
+            cache.store('a.zip', [b'x' * 8])
+            cache.store('b.zip', [b'y' * 8])
+        self.assertEqual(listed.call_count, 1)
+        self.assertTrue(cache.exists('b.zip'))
+
+        cache._next_evict = 0
+        cache.store('c.zip', [b'z' * 8])
+        self.assertEqual([cache.exists(key) for key in ('a.zip', 'b.zip', 'c.zip')], [False, False, True])
+
+
+class UserProjectSummaryTests(StorageMixin, TestCase):
+    def summary(self):
+        summary = UserProjectSummary.objects.get(user=self.user)
+        return summary.project_count, summary.latest_created_at
+
+    def create_projects(self, count):
+        now = datetime.now(timezone.utc)
+        projects = []
+        for index in range(count):
+            # auto_now_add берет время из timezone.now: проекты создаются с шагом в минуту
+            with mock.patch('django.utils.timezone.now', return_value=now - timedelta(minutes=count - index)):
+                projects.append(Project.objects.create(
+                    user=self.user, project_name=f'project-{index}', description='', project_type='type',
+                    status='draft', file_name='template.zip', file_id=f'file-{index}',
+                ))
+        return projects
+
+    def test_create_counts_and_tracks_latest(self):
+        _, newest = self.create_projects(2)
+        self.assertEqual(self.summary(), (2, newest.created_at))
+
+    def test_deleting_newest_recalculates_latest(self):
+        oldest, middle, newest = self.create_projects(3)
+
+        middle.delete()
+        self.assertEqual(self.summary(), (2, newest.created_at))
+        newest.delete()
+        self.assertEqual(self.summary(), (1, oldest.created_at))
+        oldest.delete()
+        self.assertEqual(self.summary(), (0, None))
+
+    def test_raw_save_is_not_counted(self):
+        project, = self.create_projects(1)
+        count_created_project(Project, project, created=True, raw=True)
+        count_created_project(Project, project, created=False)
+
+        self.assertEqual(self.summary(), (1, project.created_at))
+
+    def test_summary_endpoint(self):
+        self.create_projects(2)
+        response = self.client.get('/api_client/user-projects/user@example.com/summary/', headers=self.headers())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['project_count'], 2)
+
+
+class UserEmailIndexMigrationTests(SimpleTestCase):
+    def test_index_is_in_migration_state(self):
+        state = MigrationLoader(None, ignore_no_migrations=True).project_state(
+            ('api_client', '0004_userprojectsummary'),
+        )
+        model = state.models['api_client', 'useremailindex']
+        self.assertEqual(model.options['db_table'], 'auth_user')
+        self.assertEqual([index.name for index in model.options['indexes']], ['api_client_user_email_idx'])
+
+
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='user@example.com', email='user@example.com', password='password',
+        )
+        self.token = Token.objects.get(user=self.user).key
+        self.addCleanup(token_cache.invalidate, self.token)
+
+    def cached_user(self, key):
+        user = authenticate_token_key(key)
+        with self.assertNumQueries(0):
+            self.assertEqual(authenticate_token_key(key), user)
+        return user
+
+    def test_password_change_invalidates(self):
+        self.cached_user(self.token)
+        self.user.set_password('changed')
+        self.user.save()
+
+        with self.assertNumQueries(1):
+            user = authenticate_token_key(self.token)
+        self.assertTrue(user.check_password('changed'))
+
+    def test_deactivation_invalidates(self):
+        self.cached_user(self.token)
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+
+        with self.assertRaises(AuthenticationFailed):
+            authenticate_token_key(self.token)
+
+    def test_token_delete_invalidates(self):
+        self.cached_user(self.token)
+        Token.objects.filter(key=self.token).delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            authenticate_token_key(self.token)
+
+    def test_client_token_delete_invalidates(self):
+        token = ClientToken.objects.create(
+            key='c' * 40, user=self.user, client='cli',
+            expires_at=datetime.now(timezone.utc) + timedelta(hours=1),
+        )
+        self.addCleanup(token_cache.invalidate, token.key)
+        self.cached_user(token.key)
+        token.delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            authenticate_token_key(token.key)
+
+
+class LoginTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='user@example.com', email='user@example.com', password='password',
+        )
+        self.token = Token.objects.get(user=self.user).key
+        self.addCleanup(token_cache.invalidate, self.token)
+
+    def login(self):
+        response = self.client.post(
+            '/api_client/login/', {'email': 'user@example.com', 'password': 'password'}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.addCleanup(token_cache.invalidate, response.json()['token'])
+        return response.json()['token']
+
+    def projects(self, token):
+        return self.client.get('/api_client/user-projects/user@example.com/', headers={'authorization': f'Token {token}'})
+
+    def test_default_login_rotates_token_and_creates_session(self):
+        self.assertEqual(self.projects(self.token).status_code, 200)
+        token = self.login()
+
+        self.assertNotEqual(token, self.token)
+        self.assertEqual(self.client.session['_auth_user_id'], str(self.user.id))
+        self.assertEqual(self.projects(self.token).status_code, 401)
+        self.assertEqual(self.projects(token).status_code, 200)
+
+    @override_settings(LOGIN_TOKEN_MODE='reuse', LOGIN_CREATE_SESSION=False)
+    def test_reuse_login_keeps_token_without_session(self):
+        token = self.login()
+
+        self.assertEqual(token, self.token)
+        self.assertNotIn('_auth_user_id', self.client.session)
@@ -0,0 +1,117 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils import timezone
+
+
+class TokenUserCache:
+    """Пользователи по ключу токена: LRU в памяти процесса и, опционально, общий кэш Django.
+
+    Запись удаляется при удалении токена и при сохранении пользователя
+    (см. сигналы в models.py), поэтому замененный токен, смена пароля,
+    is_active или is_staff действуют сразу в этом процессе и в общем кэше.
+    Локальные записи других процессов живут не дольше ttl. В общем кэше
+    хранится только id пользователя: сам пользователь (с хешем пароля)
+    читается из БД при попадании.
+    """
+
+    def __init__(self, max_entries, ttl, backend=None, shared_ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.backend = backend
+        self.shared_ttl = shared_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def shared(self):
+        return caches[self.backend] if self.backend else None
+
+    @staticmethod
+    def shared_key(key):
+        # Сами токены в общий кэш не попадают
+        return "auth-token:" + hashlib.sha256(key.encode()).hexdigest()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                user, expires = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return user
+                del self._entries[key]
+
+        if self.shared is not None:
+            user_id = self.shared.get(self.shared_key(key))
+            user = get_user_model().objects.filter(pk=user_id).first() if user_id is not None else None
+            if user is not None:
+                self._put(key, user, self.ttl)
+                with self._lock:
+                    self.shared_hits += 1
+                return user
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _put(self, key, user, ttl):
+        with self._lock:
+            self._entries[key] = (user, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def set(self, key, user, expires_at=None):
+        """expires_at — срок действия токена: запись не переживает сам токен"""
+        ttl, shared_ttl = self.ttl, self.shared_ttl
+        if expires_at is not None:
+            remaining = (expires_at - timezone.now()).total_seconds()
+            ttl = min(ttl, remaining)
+            shared_ttl = remaining if shared_ttl is None else min(shared_ttl, remaining)
+            if remaining <= 0:
+                return
+        self._put(key, user, ttl)
+        if self.shared is not None:
+            self.shared.set(self.shared_key(key), user.pk, shared_ttl)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self.invalidations += 1
+        if self.shared is not None:
+            self.shared.delete(self.shared_key(key))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_ratio': (self.hits + self.shared_hits) / lookups if lookups else None,
+                'invalidations': self.invalidations,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'backend': self.backend,
+            }
+
+
+token_cache = TokenUserCache(
+    settings.AUTH_TOKEN_CACHE_SIZE,
+    settings.AUTH_TOKEN_CACHE_TTL,
+    settings.AUTH_TOKEN_CACHE_BACKEND,
+    settings.AUTH_TOKEN_SHARED_CACHE_TTL,
+)
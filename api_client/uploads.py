@@ -0,0 +1,221 @@
+import hashlib
+import io
+import json
+import re
+import zipfile
+import zlib
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db import transaction
+
+from .blobs import UnknownBlob, acquire_blob, blob_manifest_name, blob_object_name, blob_ready, reserve_blob
+from .manifests import build_manifest, store_manifest
+from .minio_client import minio_client
+from .models import Project
+from .zip_stream import CHUNK_SIZE
+
+
+SHA256_RE = re.compile(r'[0-9a-f]{64}')
+
+
+class UploadValidationError(Exception):
+    pass
+
+
+class HashingReader:
+    """Считает SHA-256 и размер архива по мере того, как его читает ZipFile.
+
+    build_manifest читает элементы архива подряд, поэтому тело архива
+    хешируется в том же проходе. Небольшие пропуски (заголовки каталогов,
+    дескрипторы данных) дочитываются сразу, остаток — центральный каталог —
+    в hexdigest().
+    """
+
+    MAX_GAP = 64 * 1024
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._sha256 = hashlib.sha256()
+        self._pos = 0
+        self.size = 0  # Сколько байт от начала уже в хеше
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._stream.seek(offset, whence)
+        self._pos = self._stream.tell()
+        return self._pos
+
+    def read(self, size=-1):
+        if self.size < self._pos <= self.size + self.MAX_GAP:
+            self._stream.seek(self.size)
+            gap = self._stream.read(self._pos - self.size)
+            self._sha256.update(gap)
+            self.size += len(gap)
+        data = self._stream.read(size)
+        start = self._pos
+        self._pos += len(data)
+        if start <= self.size < self._pos:
+            self._sha256.update(data[self.size - start:])
+            self.size = self._pos
+        return data
+
+    def hexdigest(self):
+        """Дочитывает непрочитанный хвост; позиция чтения возвращается в начало"""
+        self.seek(self.size)
+        while self.read(CHUNK_SIZE):
+            pass
+        self.seek(0)
+        return self._sha256.hexdigest()
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """Считает SHA-256 файлов запроса, пока Django их принимает.
+
+    Стоит первым в request.upload_handlers и передает данные дальше без
+    изменений, так что сохраненную загрузку не нужно перечитывать ради хеша.
+    """
+
+    def __init__(self, request=None, field_names=('file',)):
+        super().__init__(request)
+        self.field_names = field_names
+        self.digests = {}  # Имя поля -> SHA-256
+        self._sha256 = None
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self._sha256 = hashlib.sha256() if field_name in self.field_names else None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self._sha256 is not None:
+            self._sha256.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self._sha256 is not None:
+            self.digests[self.field_name] = self._sha256.hexdigest()
+            self._sha256 = None
+        return None  # Сам файл создает следующий обработчик
+
+
+def validate_archive(file):
+    """Проверяет центральный каталог zip.
+
+    ZipFile читает только конец файла (EOCD и центральный каталог), так что
+    битый архив отклоняется до чтения его тела.
+    """
+    try:
+        with zipfile.ZipFile(file) as zip_ref:
+            members = zip_ref.infolist()
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, OSError):
+        raise UploadValidationError('Provided file is not a valid archive')
+    if not members:
+        raise UploadValidationError('Provided archive is empty')
+    file.seek(0)
+    return members
+
+
+def read_context(json_file):
+    data = json_file.read()
+    try:
+        json.loads(data)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise UploadValidationError('Provided file is not a valid JSON')
+    return data
+
+
+def put_archive(file, sha256, size, manifest):
+    """Загружает блоб архива и его манифест вне транзакции (см. reserve_blob)"""
+    reserve_blob(sha256, size)
+    minio_client.put_object(
+        settings.MINIO_BUCKET_NAME,
+        blob_object_name(sha256),
+        file,
+        length=size,
+        content_type='application/zip',
+        part_size=settings.MINIO_UPLOAD_PART_SIZE,
+        num_parallel_uploads=settings.MINIO_UPLOAD_PARALLEL,
+    )
+    store_manifest(blob_manifest_name(sha256), dict(manifest, archive_sha256=sha256))
+
+
+def upload_template(user, file, json_file, project_name, description, project_type, project_status,
+                    sha256=None, file_name=None, file_sha256=None):
+    """Загружает архив и контекст шаблона и создает проект.
+
+    Архив хранится как блоб по SHA-256 содержимого: если такой архив уже
+    есть, он не загружается повторно. Без file проект ссылается на уже
+    сохраненный блоб sha256 — клиент не передает байты. file_sha256 — хеш
+    file, посчитанный при приеме запроса (HashingUploadHandler); без него
+    хеш считается в том же проходе, что и манифест (см. HashingReader).
+
+    Новый архив (multipart загрузкой) и манифест загружаются до транзакции,
+    без блокировок. В транзакции создаются строка Project и контекст, а
+    последним шагом блоб получает ссылку (acquire_blob), так что строка
+    блоба заблокирована только до фиксации. При ошибке контекст удаляется;
+    незавершенный блоб удаляет collect_template_blobs.
+
+    Возвращает (project, sha256, uploaded): uploaded ложно, если архив уже был.
+    """
+    manifest = size = None
+    if file is not None:
+        validate_archive(file)
+        archive = file if file_sha256 else HashingReader(file)
+        try:
+            manifest = build_manifest(archive)
+        except (zipfile.BadZipFile, zlib.error, NotImplementedError, RuntimeError):
+            # Поврежденные данные элементов, неподдерживаемое сжатие или шифрование
+            raise UploadValidationError('Provided file is not a valid archive')
+        if file_sha256:
+            sha256, size = file_sha256, file.size
+        else:
+            sha256, size = archive.hexdigest(), archive.size
+        file_name = file.name
+    elif not SHA256_RE.fullmatch(sha256 or ''):
+        raise UploadValidationError('sha256 must be 64 lowercase hex characters')
+    context_data = read_context(json_file)
+
+    uploaded = False
+    if file is not None and not blob_ready(sha256):
+        put_archive(file, sha256, size, manifest)
+        uploaded = True
+
+    while True:
+        context_name = None
+        try:
+            with transaction.atomic():
+                project = Project.objects.create(
+                    user=user,
+                    project_name=project_name,
+                    description=description,
+                    project_type=project_type,
+                    status=project_status,
+                    file_name=file_name,  # Сохраняем только имя файла
+                    file_id=sha256,
+                )
+                context_name = f"{project.id}_context.json"
+                minio_client.put_object(
+                    settings.MINIO_BUCKET_NAME,
+                    context_name,
+                    io.BytesIO(context_data),
+                    length=len(context_data),
+                    content_type='application/json',
+                )
+                acquire_blob(sha256, uploaded)
+            return project, sha256, uploaded
+        except Exception as e:
+            if context_name is not None:
+                minio_client.remove_object(settings.MINIO_BUCKET_NAME, context_name)
+            if not isinstance(e, UnknownBlob):
+                raise
+            if file is None:
+                raise UploadValidationError('Archive with this sha256 is not stored; upload the file')
+        # Блоб удалили, пока создавался проект: загружаем архив сами
+        file.seek(0)
+        put_archive(file, sha256, size, manifest)
+        uploaded = True
@@ -1,24 +1,51 @@
 from django.urls import path
+from .async_views import AsyncDownloadTemplateView, AsyncGetTemplateJsonView, AsyncProcessTemplateView
 from .views import (
     UserLoginView,
     ProcessTemplateView,
+    BatchProcessTemplateView,
     UserProjectsView,
+    UserProjectSummaryView,
     CreateUserView,
     UploadTemplateView,
     DownloadTemplateView,
     AdminOnlyView,
     ListTemplatesView,
-    GetTemplateJsonView
+    GetTemplateJsonView,
+    GetTemplateManifestView,
+    TemplateCacheStatsView,
+    RenderJobStatusView,
+    RenderJobDownloadView,
+    MinioMetricsView,
+    AuthCacheStatsView,
+    StageMetricsView,
+    TemplateBlobView
 )
 
 urlpatterns = [
     path('login/', UserLoginView.as_view(), name='login'),
     path('process-template/', ProcessTemplateView.as_view(), name='process-template'),
+    path('process-template-batch/', BatchProcessTemplateView.as_view(), name='process-template-batch'),
     path('user-projects/<str:email>/', UserProjectsView.as_view(), name='user-projects'),
+    path('user-projects/<str:email>/summary/', UserProjectSummaryView.as_view(), name='user-project-summary'),
     path('create-user/', CreateUserView.as_view(), name='create-user'),
     path('upload-template/', UploadTemplateView.as_view(), name='upload-template'),
+    path('template-blobs/<str:sha256>/', TemplateBlobView.as_view(), name='template-blob'),
     path('download-template/<int:project_id>/', DownloadTemplateView.as_view(), name='download-template'),
     path('admin-only/', AdminOnlyView.as_view(), name='admin-only'),
     path('list-templates/', ListTemplatesView.as_view(), name='list-templates'),
     path('get-template-json/<int:project_id>/', GetTemplateJsonView.as_view(), name='get-template-json'),
+    path('get-template-manifest/<int:project_id>/', GetTemplateManifestView.as_view(),
+         name='get-template-manifest'),
+    path('template-cache-stats/', TemplateCacheStatsView.as_view(), name='template-cache-stats'),
+    path('minio-metrics/', MinioMetricsView.as_view(), name='minio-metrics'),
+    path('auth-cache-stats/', AuthCacheStatsView.as_view(), name='auth-cache-stats'),
+    path('metrics/', StageMetricsView.as_view(), name='stage-metrics'),
+    path('render-jobs/<uuid:job_id>/', RenderJobStatusView.as_view(), name='render-job-status'),
+    path('render-jobs/<uuid:job_id>/download/', RenderJobDownloadView.as_view(), name='render-job-download'),
+    path('async/process-template/', AsyncProcessTemplateView.as_view(), name='async-process-template'),
+    path('async/download-template/<int:project_id>/', AsyncDownloadTemplateView.as_view(),
+         name='async-download-template'),
+    path('async/get-template-json/<int:project_id>/', AsyncGetTemplateJsonView.as_view(),
+         name='async-get-template-json'),
 ]
@@ -1,30 +1,81 @@
-import io
-import shutil
 import json
-import uuid
-import zipfile
-from pathlib import Path
-from zipfile import ZipFile
 
 from django.conf import settings
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse, StreamingHttpResponse, JsonResponse
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from drf_spectacular.types import OpenApiTypes
-from py_templating_engine.py_templating_engine.environment.templates_environment import TemplatesEnvironment
+from minio.error import S3Error
 from rest_framework import status
-from rest_framework.authtoken.models import Token
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from .authentication import issue_login_token
+from .blobs import archive_object_name
+from .compiled_templates import compiled_templates
+from .manifests import ensure_manifest, manifest_object_name
 from .minio_client import minio_client
-from .models import Project
+from .models import Project, RenderJob, TemplateBlob, UserProjectSummary
+from .object_streaming import object_response
+from .pagination import PaginationError, keyset_response
+from .output_options import OutputOptions, OutputOptionsError
 from .permissions import IsAdminUser
+from .presigned import presigned_urls, wants_redirect
+from .render_cache import MinioRenderCache, etag_matches, make_render_key, render_cache, render_etag
+from .render_jobs import job_status
+from .rendering import (
+    acquire_scratch,
+    checkout_template,
+    cleanup_render,
+    get_batch_pool,
+    iter_render_archive,
+    new_work_dir,
+    open_archive_source,
+    render_project,
+    render_tree,
+)
+from .scratch import ScratchQuotaExceeded, scratch_space, scratch_unavailable
+from .stage_timing import failed_stage, stage, stage_histograms
+from .template_cache import template_cache
+from .token_cache import token_cache
+from .uploads import HashingUploadHandler, UploadValidationError, upload_template
+
+# Поля ответа списков проектов и соответствующие им колонки Project
+USER_PROJECT_FIELDS = {
+    'project_name': 'project_name',
+    'description': 'description',
+    'project_type': 'project_type',
+    'status': 'status',
+    'file_name': 'file_name',
+    'file_id': 'id',
+    'created_at': 'created_at',
+}
+
+TEMPLATE_LIST_FIELDS = {
+    'project_id': 'id',
+    'project_name': 'project_name',
+    'description': 'description',
+    'project_type': 'project_type',
+    'status': 'status',
+    'file_name': 'file_name',
+    'created_at': 'created_at',
+}
+
+def valid_client(client):
+    return client is None or (isinstance(client, str) and len(client) <= 64)
+
+def token_response(data, user, client=None):
+    """Тело ответа входа и регистрации с токеном; expires_at — только у токенов клиентов"""
+    key, expires_at = issue_login_token(user, client)
+    data['token'] = key
+    if expires_at is not None:
+        data['expires_at'] = expires_at
+    return data
 
 @extend_schema(
     summary="Авторизация пользователя",
@@ -35,6 +86,7 @@ from .permissions import IsAdminUser
             'properties': {
                 'email': {'type': 'string', 'format': 'email'},
                 'password': {'type': 'string', 'format': 'password'},
+                'client': {'type': 'string', 'description': 'Идентификатор клиента для LOGIN_TOKEN_MODE = "client"'},
             },
             'required': ['email', 'password'],
         }
@@ -48,16 +100,44 @@ class UserLoginView(APIView):
     def post(self, request, *args, **kwargs):
         email = request.data.get("email")
         password = request.data.get("password")
+        client = request.data.get("client")
+        if not valid_client(client):
+            return Response({"error": "client must be a string of at most 64 characters"},
+                            status=status.HTTP_400_BAD_REQUEST)
         user = authenticate(request, username=email, password=password)
 
         if user is not None:
-            login(request, user)
-            Token.objects.filter(user=user).delete()
-            token = Token.objects.create(user=user)
-            return Response({"message": "Login successful", "token": token.key}, status=status.HTTP_200_OK)
+            if settings.LOGIN_CREATE_SESSION:
+                login(request, user)
+            return Response(token_response({"message": "Login successful"}, user, client), status=status.HTTP_200_OK)
         else:
             return Response({"error": "Invalid email or password"}, status=status.HTTP_400_BAD_REQUEST)
 
+# Параметры формата архива результата
+OUTPUT_PARAMETERS = [
+    OpenApiParameter(
+        name="archive",
+        type=OpenApiTypes.STR,
+        location=OpenApiParameter.QUERY,
+        description="Формат архива: zip, tar.gz или tar.zst",
+        required=False,
+    ),
+    OpenApiParameter(
+        name="compression",
+        type=OpenApiTypes.STR,
+        location=OpenApiParameter.QUERY,
+        description="Метод сжатия zip: store, deflate, bzip2 или lzma",
+        required=False,
+    ),
+    OpenApiParameter(
+        name="level",
+        type=OpenApiTypes.INT,
+        location=OpenApiParameter.QUERY,
+        description="Уровень сжатия",
+        required=False,
+    ),
+]
+
 @extend_schema(
     summary="Обработка шаблона",
     description="Генерация кода на основе шаблона и контекста",
@@ -69,6 +149,21 @@ class UserLoginView(APIView):
             description="ID проекта для обработки",
             required=True,
         ),
+        OpenApiParameter(
+            name="mode",
+            type=OpenApiTypes.STR,
+            location=OpenApiParameter.QUERY,
+            description="async — поставить генерацию в очередь и сразу вернуть id задачи",
+            required=False,
+        ),
+        OpenApiParameter(
+            name="redirect",
+            type=OpenApiTypes.BOOL,
+            location=OpenApiParameter.QUERY,
+            description="Ответить 302 на presigned URL MinIO вместо передачи байтов через сервер",
+            required=False,
+        ),
+        *OUTPUT_PARAMETERS,
     ],
     request={
         'application/json': {
@@ -76,7 +171,7 @@ class UserLoginView(APIView):
             'description': 'Контекст для шаблона'
         }
     },
-    responses={200: None, 400: None, 404: None, 500: None},
+    responses={200: None, 302: None, 202: None, 304: None, 400: None, 404: None, 500: None},
 )
 @method_decorator(csrf_exempt, name='dispatch')
 class ProcessTemplateView(APIView):
@@ -96,61 +191,193 @@ class ProcessTemplateView(APIView):
             return JsonResponse({"error": f"Invalid JSON: {str(e)}"}, status=400)
 
         try:
-            project = Project.objects.get(id=project_id)
-            file_path = str(project.id)
-
-            template_response = minio_client.get_object(settings.MINIO_BUCKET_NAME, file_path)
-            template_data = template_response.read()
-            template_response.close()
-            template_response.release_conn()
+            self.options = OutputOptions.from_request(request)
+        except OutputOptionsError as e:
+            return JsonResponse({"error": str(e)}, status=400)
 
-            template_dir = Path("/tmp/template_processing")
-            template_dir.mkdir(parents=True, exist_ok=True)
-            template_file_path = template_dir / project.file_name
+        try:
+            with stage("project_lookup"):
+                project = Project.objects.get(id=project_id)
+
+            if request.query_params.get("mode") == "async":
+                job = RenderJob.objects.create(
+                    user=request.user, project=project, context=context_data, output=self.options.to_dict(),
+                )
+                return JsonResponse({
+                    "job_id": str(job.id),
+                    "status_url": f"/api_client/render-jobs/{job.id}/",
+                }, status=202)
+
+            archive_key = template_cache.archive_key(project)
+            # Presigned redirect возможен, только если результат лежит в MinIO
+            redirect = wants_redirect(request) and isinstance(render_cache, MinioRenderCache)
+
+            render_key = None
+            if render_cache is not None:
+                render_key = make_render_key(archive_key, context_data, self.options)
+                if etag_matches(request, render_key):
+                    response = HttpResponse(status=304)
+                    response["ETag"] = render_etag(render_key)
+                    return response
+                if "no-cache" not in request.headers.get("Cache-Control", ""):
+                    with stage("render_cache_lookup"):
+                        if redirect and render_cache.exists(render_key):
+                            return self.redirect_response(render_key)
+                        cached = None if redirect else render_cache.lookup(render_key)
+                    if cached is not None:
+                        chunks, size = cached
+                        response = self.archive_response(chunks, render_key)
+                        response["Content-Length"] = str(size)
+                        return response
+
+            with stage("scratch_admission"):
+                lease = acquire_scratch(project, archive_key, timeout=settings.SCRATCH_ADMISSION_TIMEOUT)
+            try:
+                with stage("render"):
+                    self.output_dir, work_dir = render_project(project, context_data, archive_key)
+                lease.adopt(self.output_dir, work_dir)
+                if redirect:
+                    with lease:
+                        render_cache.store(
+                            render_key, iter_render_archive(self.output_dir, project, archive_key, self.options)
+                        )
+                    return self.redirect_response(render_key)
+                chunks = iter_render_archive(self.output_dir, project, archive_key, self.options)
+                return self.stream_archive(chunks, lease, render_key)
+            except Exception:
+                lease.release()
+                raise
 
-            with open(template_file_path, "wb") as f:
-                f.write(template_data)
+        except Project.DoesNotExist:
+            return JsonResponse({"error": "Project not found"}, status=404)
+        except ScratchQuotaExceeded as e:
+            return scratch_unavailable(e)
+        except Exception as e:
+            return JsonResponse({"error": str(e), "error_type": type(e).__name__, "stage": failed_stage()},
+                                status=500)
+
+    def stream_archive(self, chunks, lease, render_key=None):
+        if render_key is not None:
+            chunks = render_cache.tee(render_key, chunks)
+        # Каталоги удаляются при закрытии ответа: после отдачи, при ошибке и при обрыве соединения
+        return self.archive_response(lease.stream(chunks), render_key)
+
+    def redirect_response(self, render_key):
+        url = presigned_urls.get_url(
+            render_cache.object_name(render_key),
+            filename=self.options.filename("processed_template"),
+            content_type=self.options.content_type,
+        )
+        response = HttpResponseRedirect(url)
+        response["ETag"] = render_etag(render_key)
+        return response
 
-            archive_name = str(uuid.uuid4())
-            archive_extract_dir = template_dir / archive_name
-            archive_extract_dir.mkdir(parents=True, exist_ok=True)
+    def archive_response(self, chunks, render_key=None):
+        response = StreamingHttpResponse(chunks, content_type=self.options.content_type)
+        response["Content-Disposition"] = f'attachment; filename="{self.options.filename("processed_template")}"'
+        if render_key is not None:
+            response["ETag"] = render_etag(render_key)
+        return response
 
-            with ZipFile(template_file_path, 'r') as zip_ref:
-                zip_ref.extractall(archive_extract_dir)
+@extend_schema(
+    summary="Пакетная обработка шаблона",
+    description="Генерация одного шаблона для списка контекстов; каждый результат — отдельная папка в архиве",
+    parameters=[
+        OpenApiParameter(
+            name="project_id",
+            type=OpenApiTypes.INT,
+            location=OpenApiParameter.QUERY,
+            description="ID проекта для обработки",
+            required=True,
+        ),
+        *OUTPUT_PARAMETERS,
+    ],
+    request={
+        'application/json': {
+            'type': 'array',
+            'items': {'type': 'object'},
+            'description': 'Список контекстов для шаблона'
+        }
+    },
+    responses={200: None, 400: None, 404: None, 500: None},
+)
+@method_decorator(csrf_exempt, name='dispatch')
+class BatchProcessTemplateView(APIView):
+    permission_classes = [IsAuthenticated]
 
-            context_file_path = archive_extract_dir / "templater.json"
-            with open(context_file_path, "wb") as f:
-                f.write(json.dumps(context_data).encode())
+    def post(self, request):
+        project_id = request.query_params.get("project_id")
+        if not project_id:
+            return JsonResponse({"error": "Project ID is required in query parameters"}, status=400)
 
-            templates_env = TemplatesEnvironment(archive_extract_dir)
-            self.output_dir = templates_env.render_project()
-            return self.stream_zip(self.output_dir)
+        contexts = request.data
+        if not isinstance(contexts, list) or not contexts:
+            return JsonResponse({"error": "A non-empty list of contexts is required in the request body"}, status=400)
+        if len(contexts) > settings.RENDER_BATCH_MAX_CONTEXTS:
+            return JsonResponse(
+                {"error": f"At most {settings.RENDER_BATCH_MAX_CONTEXTS} contexts are allowed per batch"},
+                status=400,
+            )
+        try:
+            options = OutputOptions.from_request(request)
+        except OutputOptionsError as e:
+            return JsonResponse({"error": str(e)}, status=400)
 
+        try:
+            project = Project.objects.get(id=project_id)
+            archive_key = template_cache.archive_key(project)
+            lease = acquire_scratch(
+                project, archive_key, outputs=len(contexts), timeout=settings.SCRATCH_ADMISSION_TIMEOUT
+            )
         except Project.DoesNotExist:
             return JsonResponse({"error": "Project not found"}, status=404)
+        except ScratchQuotaExceeded as e:
+            return scratch_unavailable(e)
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=500)
 
-    def stream_zip(self, output_dir):
-        def zip_generator():
+        try:
+            source_dir = new_work_dir()
+            lease.adopt(source_dir)
+            checkout_template(project, source_dir, archive_key)
+        except Exception as e:
+            lease.release()
+            return JsonResponse({"error": str(e)}, status=500)
+
+        pool = get_batch_pool()
+        futures = [pool.submit(render_tree, source_dir, context, archive_key) for context in contexts]
+        for future in futures:
+            future.add_done_callback(lease.adopt_result)
+
+        def archive_generator():
+            stream = options.open_stream()
+            # Несжатые элементы исходного архива переносятся как есть только в zip
+            source = open_archive_source(project, archive_key) if options.format == "zip" else None
+            errors = {}
             try:
-                with io.BytesIO() as zip_buffer:
-                    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-                        for file in output_dir.rglob("*"):
-                            if file.is_file():
-                                arcname = file.relative_to(output_dir)
-                                zip_file.write(file, arcname=arcname)
-                    zip_buffer.seek(0)
-                    yield zip_buffer.read()
+                # Порядок папок совпадает с порядком контекстов, даже если рендер завершился раньше
+                for index, future in enumerate(futures):
+                    try:
+                        output_dir, work_dir = future.result()
+                    except Exception as e:
+                        errors[str(index)] = str(e)
+                        continue
+                    try:
+                        yield from stream.write_directory(output_dir, prefix=f"{index}/", source=source)
+                    finally:
+                        # Место освобождается по мере отдачи, не дожидаясь конца пакета
+                        cleanup_render(output_dir, work_dir)
+                if errors:
+                    yield from stream.write_bytes("errors.json", json.dumps(errors, ensure_ascii=False, indent=2))
+                yield from stream.close()
             finally:
-                # Clean up after streaming is complete
-                try:
-                    shutil.rmtree(output_dir)
-                except Exception as e:
-                    print(f"Error cleaning up output directory: {e}")
-
-        response = StreamingHttpResponse(zip_generator(), content_type="application/zip")
-        response["Content-Disposition"] = 'attachment; filename="processed_template.zip"'
+                for future in futures:
+                    future.cancel()
+                if source is not None:
+                    source.close()
+
+        response = StreamingHttpResponse(lease.stream(archive_generator()), content_type=options.content_type)
+        response["Content-Disposition"] = f'attachment; filename="{options.filename("processed_templates")}"'
         return response
 
 @extend_schema(
@@ -164,29 +391,80 @@ class ProcessTemplateView(APIView):
             description="Email пользователя",
             required=True,
         ),
+        OpenApiParameter(
+            name="cursor",
+            type=OpenApiTypes.STR,
+            location=OpenApiParameter.QUERY,
+            description="Курсор следующей страницы из заголовка X-Next-Cursor",
+            required=False,
+        ),
+        OpenApiParameter(
+            name="page_size",
+            type=OpenApiTypes.INT,
+            location=OpenApiParameter.QUERY,
+            description="Размер страницы (не больше LIST_MAX_PAGE_SIZE)",
+            required=False,
+        ),
+        OpenApiParameter(
+            name="fields",
+            type=OpenApiTypes.STR,
+            location=OpenApiParameter.QUERY,
+            description="Поля ответа через запятую, например project_id,project_name",
+            required=False,
+        ),
+        OpenApiParameter(
+            name="stream",
+            type=OpenApiTypes.BOOL,
+            location=OpenApiParameter.QUERY,
+            description="Отдать весь список потоково, без разбиения на страницы",
+            required=False,
+        ),
     ],
-    responses={200: None, 404: None},
+    responses={200: None, 400: None, 404: None},
 )
 @method_decorator(csrf_exempt, name='dispatch')
 class UserProjectsView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, email):
-        user = get_object_or_404(get_user_model(), email=email)
-        projects = Project.objects.filter(user=user)
-        projects_data = [
-            {
-                'project_name': project.project_name,
-                'description': project.description,
-                'project_type': project.project_type,
-                'status': project.status,
-                'file_name': project.file_name,
-                'file_id': project.id,
-                'created_at': project.created_at,
-            }
-            for project in projects
-        ]
-        return Response(projects_data)
+        # Один запрос с JOIN по email; существование пользователя проверяем, только если проектов нет
+        projects = Project.objects.filter(user__email=email)
+        try:
+            response = keyset_response(request, projects, USER_PROJECT_FIELDS)
+        except PaginationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if isinstance(response, Response) and not response.data and 'cursor' not in request.query_params:
+            get_object_or_404(get_user_model(), email=email)
+        return response
+
+@extend_schema(
+    summary="Сводка по проектам пользователя",
+    description="Количество проектов пользователя и дата последнего из них",
+    parameters=[
+        OpenApiParameter(
+            name="email",
+            type=OpenApiTypes.EMAIL,
+            location=OpenApiParameter.PATH,
+            description="Email пользователя",
+            required=True,
+        ),
+    ],
+    responses={200: None, 404: None},
+)
+@method_decorator(csrf_exempt, name='dispatch')
+class UserProjectSummaryView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, email):
+        summary = UserProjectSummary.objects.filter(user__email=email).values(
+            'project_count', 'latest_created_at'
+        ).first()
+        if summary is None:
+            # Пользователь без проектов еще не имеет строки сводки
+            get_object_or_404(get_user_model(), email=email)
+            summary = {'project_count': 0, 'latest_created_at': None}
+        return Response({'email': email, **summary})
 
 @extend_schema(
     summary="Создание пользователя",
@@ -217,13 +495,14 @@ class CreateUserView(APIView):
 
         if not email or not firstname or not lastname or not password:
             return Response({'error': 'Missing required fields'}, status=status.HTTP_400_BAD_REQUEST)
+        if not valid_client(request.data.get('client')):
+            return Response({'error': 'client must be a string of at most 64 characters'},
+                            status=status.HTTP_400_BAD_REQUEST)
 
         user = get_user_model().objects.create_user(email=email, username=email, password=password)
-        
-        Token.objects.filter(user=user).delete()
-        token = Token.objects.create(user=user)
 
-        return Response({'message': 'User created successfully', 'user_id': user.id, 'token': token.key},
+        return Response(token_response({'message': 'User created successfully', 'user_id': user.id}, user,
+                                       request.data.get('client')),
                         status=status.HTTP_201_CREATED)
 
 @extend_schema(
@@ -238,6 +517,14 @@ class CreateUserView(APIView):
                     'format': 'binary',
                     'description': 'Архив шаблона'
                 },
+                'sha256': {
+                    'type': 'string',
+                    'description': 'Вместо file: SHA-256 уже сохраненного архива (см. template-blobs)'
+                },
+                'file_name': {
+                    'type': 'string',
+                    'description': 'Имя архива при загрузке по sha256'
+                },
                 'json_file': {
                     'type': 'string',
                     'format': 'binary',
@@ -248,35 +535,31 @@ class CreateUserView(APIView):
                 'project_type': {'type': 'string'},
                 'status': {'type': 'string'},
             },
-            'required': ['file', 'json_file', 'project_name', 'description', 'project_type', 'status'],
+            'required': ['json_file', 'project_name', 'description', 'project_type', 'status'],
         }
     },
-    responses={200: None, 400: None},
+    responses={200: None, 400: None, 500: None},
 )
 @method_decorator(csrf_exempt, name='dispatch')
 class UploadTemplateView(APIView):
     permission_classes = [IsAuthenticated]
 
+    def initialize_request(self, request, *args, **kwargs):
+        # Обработчик добавляется до первого обращения к телу запроса
+        self.upload_hash = HashingUploadHandler(request)
+        request.upload_handlers.insert(0, self.upload_hash)
+        return super().initialize_request(request, *args, **kwargs)
+
     def post(self, request):
-        if 'file' not in request.FILES or 'json_file' not in request.FILES:
+        sha256 = request.data.get('sha256') if settings.TEMPLATE_BLOB_HASH_UPLOADS else None
+        if ('file' not in request.FILES and not sha256) or 'json_file' not in request.FILES:
             return Response({'error': 'Both archive and JSON file must be provided'}, status=status.HTTP_400_BAD_REQUEST)
 
-        file = request.FILES['file']
+        file = request.FILES.get('file')
         json_file = request.FILES['json_file']
-
-        # Проверка, что файл является архивом
-        if not zipfile.is_zipfile(file):
-            return Response({'error': 'Provided file is not a valid archive'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Проверка, что JSON файл действительно JSON
-        try:
-            json_data = json.load(json_file)
-        except json.JSONDecodeError:
-            return Response({'error': 'Provided file is not a valid JSON'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Сбрасываем позицию файлов в начало
-        file.seek(0)
-        json_file.seek(0)
+        file_name = request.data.get('file_name') or 'template.zip'
+        if len(file_name) > 255:
+            return Response({'error': 'file_name is too long'}, status=status.HTTP_400_BAD_REQUEST)
 
         project_name = request.data.get('project_name')
         description = request.data.get('description')
@@ -286,36 +569,50 @@ class UploadTemplateView(APIView):
         if not project_name or not description or not project_type or not project_status:
             return Response({'error': 'Missing required fields'}, status=status.HTTP_400_BAD_REQUEST)
 
-        project = Project.objects.create(
-            user=request.user,
-            project_name=project_name,
-            description=description,
-            project_type=project_type,
-            status=project_status,
-            file_name=file.name  # Сохраняем только имя файла
-        )
-
-        # Загружаем архив в MinIO
-        minio_client.put_object(
-            settings.MINIO_BUCKET_NAME,
-            str(project.id),  # Используем project_id как имя объекта
-            file,
-            length=file.size
-        )
-
-        # Загружаем JSON в MinIO
-        minio_client.put_object(
-            settings.MINIO_BUCKET_NAME,
-            f"{project.id}_context.json",
-            json_file,
-            length=json_file.size
-        )
+        try:
+            project, sha256, uploaded = upload_template(
+                request.user, file, json_file, project_name, description, project_type, project_status,
+                sha256=sha256, file_name=file_name,
+                file_sha256=self.upload_hash.digests.get('file'),
+            )
+        except UploadValidationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         return Response({
             'project_id': project.id,
-            'download_url': f'/api_client/download-template/{project.id}/'
+            'download_url': f'/api_client/download-template/{project.id}/',
+            'sha256': sha256,
+            'deduplicated': not uploaded,
         })
 
+@extend_schema(
+    summary="Проверка архива по хешу",
+    description="Есть ли уже архив с таким SHA-256; если есть, проект можно создать без передачи байтов",
+    parameters=[
+        OpenApiParameter(
+            name="sha256",
+            type=OpenApiTypes.STR,
+            location=OpenApiParameter.PATH,
+            description="SHA-256 архива шаблона",
+            required=True,
+        ),
+    ],
+    responses={200: None, 404: None},
+)
+@method_decorator(csrf_exempt, name='dispatch')
+class TemplateBlobView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, sha256):
+        blob = None
+        if settings.TEMPLATE_BLOB_HASH_UPLOADS:
+            blob = TemplateBlob.objects.filter(sha256=sha256, ready=True).first()
+        if blob is None:
+            return Response({'error': 'Archive not found'}, status=404)
+        return Response({'sha256': blob.sha256, 'size': blob.size})
+
 @extend_schema(
     summary="Скачивание шаблона",
     description="Скачивание архива шаблона",
@@ -327,8 +624,15 @@ class UploadTemplateView(APIView):
             description="ID проекта",
             required=True,
         ),
+        OpenApiParameter(
+            name="redirect",
+            type=OpenApiTypes.BOOL,
+            location=OpenApiParameter.QUERY,
+            description="Ответить 302 на presigned URL MinIO вместо передачи байтов через сервер",
+            required=False,
+        ),
     ],
-    responses={200: None, 404: None},
+    responses={200: None, 302: None, 206: None, 304: None, 404: None, 416: None},
 )
 @method_decorator(csrf_exempt, name='dispatch')
 class DownloadTemplateView(APIView):
@@ -337,16 +641,12 @@ class DownloadTemplateView(APIView):
     def get(self, request, project_id):
         try:
             project = Project.objects.get(id=project_id)
-            
-            response = minio_client.get_object(settings.MINIO_BUCKET_NAME, str(project.id))
-            response_data = response.read()
-            response.close()
-            response.release_conn()
-
-            response = HttpResponse(response_data, content_type='application/zip')
-            response['Content-Disposition'] = f'attachment; filename="{project.file_name}"'
-            return response
-            
+            if wants_redirect(request):
+                return HttpResponseRedirect(
+                    presigned_urls.get_url(archive_object_name(project), filename=project.file_name)
+                )
+            return object_response(request, archive_object_name(project), 'application/zip', filename=project.file_name)
+
         except Project.DoesNotExist:
             return Response({"error": "Project not found"}, status=404)
         except Exception as e:
@@ -367,27 +667,47 @@ class AdminOnlyView(APIView):
 @extend_schema(
     summary="Получение списка всех шаблонов",
     description="Возвращает список всех шаблонов, загруженных в систему",
-    responses={200: None, 404: None},
+    parameters=[
+        OpenApiParameter(
+            name="cursor",
+            type=OpenApiTypes.STR,
+            location=OpenApiParameter.QUERY,
+            description="Курсор следующей страницы из заголовка X-Next-Cursor",
+            required=False,
+        ),
+        OpenApiParameter(
+            name="page_size",
+            type=OpenApiTypes.INT,
+            location=OpenApiParameter.QUERY,
+            description="Размер страницы (не больше LIST_MAX_PAGE_SIZE)",
+            required=False,
+        ),
+        OpenApiParameter(
+            name="fields",
+            type=OpenApiTypes.STR,
+            location=OpenApiParameter.QUERY,
+            description="Поля ответа через запятую, например project_id,project_name",
+            required=False,
+        ),
+        OpenApiParameter(
+            name="stream",
+            type=OpenApiTypes.BOOL,
+            location=OpenApiParameter.QUERY,
+            description="Отдать весь список потоково, без разбиения на страницы",
+            required=False,
+        ),
+    ],
+    responses={200: None, 400: None, 404: None},
 )
 @method_decorator(csrf_exempt, name='dispatch')
 class ListTemplatesView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        projects = Project.objects.all()
-        templates_data = [
-            {
-                'project_id': project.id,
-                'project_name': project.project_name,
-                'description': project.description,
-                'project_type': project.project_type,
-                'status': project.status,
-                'file_name': project.file_name,
-                'created_at': project.created_at,
-            }
-            for project in projects
-        ]
-        return Response(templates_data)
+        try:
+            return keyset_response(request, Project.objects.all(), TEMPLATE_LIST_FIELDS)
+        except PaginationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 @extend_schema(
     summary="Получение JSON файла по ID шаблона",
@@ -401,7 +721,7 @@ class ListTemplatesView(APIView):
             required=True,
         ),
     ],
-    responses={200: None, 404: None},
+    responses={200: None, 206: None, 304: None, 404: None, 416: None},
 )
 @method_decorator(csrf_exempt, name='dispatch')
 class GetTemplateJsonView(APIView):
@@ -410,13 +730,164 @@ class GetTemplateJsonView(APIView):
     def get(self, request, project_id):
         try:
             project = Project.objects.get(id=project_id)
-            response = minio_client.get_object(settings.MINIO_BUCKET_NAME, f"{project.id}_context.json")
-            json_data = response.read()
-            response.close()
-            response.release_conn()
+            return object_response(request, f"{project.id}_context.json", 'application/json')
+        except Project.DoesNotExist:
+            return Response({"error": "Project not found"}, status=404)
+        except Exception as e:
+            return Response({"error": str(e)}, status=500)
 
-            return HttpResponse(json_data, content_type='application/json')
+@extend_schema(
+    summary="Манифест шаблона",
+    description="Список элементов архива шаблона с размерами, хэшами и подстановками templater, "
+                "а также все переменные шаблона — без скачивания архива",
+    parameters=[
+        OpenApiParameter(
+            name="project_id",
+            type=OpenApiTypes.INT,
+            location=OpenApiParameter.PATH,
+            description="ID проекта",
+            required=True,
+        ),
+    ],
+    responses={200: None, 206: None, 304: None, 404: None, 416: None},
+)
+@method_decorator(csrf_exempt, name='dispatch')
+class GetTemplateManifestView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, project_id):
+        try:
+            project = Project.objects.get(id=project_id)
+            try:
+                return object_response(request, manifest_object_name(project), 'application/json')
+            except S3Error as e:
+                if e.code != 'NoSuchKey':
+                    raise
+            # Архив загружен до появления манифестов — строим манифест при первом запросе
+            ensure_manifest(project)
+            return object_response(request, manifest_object_name(project), 'application/json')
         except Project.DoesNotExist:
             return Response({"error": "Project not found"}, status=404)
         except Exception as e:
             return Response({"error": str(e)}, status=500)
+
+@extend_schema(
+    summary="Статистика кэша шаблонов",
+    description="Счетчики попаданий и промахов локального кэша распакованных архивов и кэша разобранных шаблонов",
+    responses={200: None, 403: None},
+)
+@method_decorator(csrf_exempt, name='dispatch')
+class TemplateCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        data = template_cache.stats()
+        if compiled_templates is not None:
+            data['compiled'] = compiled_templates.stats()
+        data['scratch'] = scratch_space.stats()
+        return Response(data)
+
+@extend_schema(
+    summary="Статус задачи генерации",
+    description="Состояние и тайминги асинхронной задачи генерации",
+    parameters=[
+        OpenApiParameter(
+            name="job_id",
+            type=OpenApiTypes.UUID,
+            location=OpenApiParameter.PATH,
+            description="ID задачи",
+            required=True,
+        ),
+    ],
+    responses={200: None, 404: None},
+)
+@method_decorator(csrf_exempt, name='dispatch')
+class RenderJobStatusView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = get_render_job(request, job_id)
+        return Response(job_status(job))
+
+@extend_schema(
+    summary="Скачивание результата задачи генерации",
+    description="Скачивание архива, сгенерированного асинхронной задачей",
+    parameters=[
+        OpenApiParameter(
+            name="job_id",
+            type=OpenApiTypes.UUID,
+            location=OpenApiParameter.PATH,
+            description="ID задачи",
+            required=True,
+        ),
+        OpenApiParameter(
+            name="redirect",
+            type=OpenApiTypes.BOOL,
+            location=OpenApiParameter.QUERY,
+            description="Ответить 302 на presigned URL MinIO вместо передачи байтов через сервер",
+            required=False,
+        ),
+    ],
+    responses={200: None, 302: None, 206: None, 304: None, 404: None, 409: None, 416: None},
+)
+@method_decorator(csrf_exempt, name='dispatch')
+class RenderJobDownloadView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = get_render_job(request, job_id)
+        if job.state != RenderJob.STATE_FINISHED:
+            return Response({"error": f"Job is {job.state}"}, status=409)
+
+        options = OutputOptions.from_dict(job.output)
+        filename = options.filename("processed_template")
+        if wants_redirect(request):
+            return HttpResponseRedirect(presigned_urls.get_url(
+                job.result_object,
+                filename=filename,
+                content_type=options.content_type,
+            ))
+        return object_response(request, job.result_object, options.content_type, filename=filename)
+
+
+def get_render_job(request, job_id):
+    jobs = RenderJob.objects.all()
+    if not request.user.is_staff:
+        jobs = jobs.filter(user=request.user)
+    return get_object_or_404(jobs, id=job_id)
+
+@extend_schema(
+    summary="Метрики клиента MinIO",
+    description="Задержки операций MinIO и загрузка пула соединений",
+    responses={200: None, 403: None},
+)
+@method_decorator(csrf_exempt, name='dispatch')
+class MinioMetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(minio_client.metrics_snapshot())
+
+@extend_schema(
+    summary="Статистика кэша аутентификации",
+    description="Попадания и промахи кэша пользователей по токену",
+    responses={200: None, 403: None},
+)
+@method_decorator(csrf_exempt, name='dispatch')
+class AuthCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(token_cache.stats())
+
+@extend_schema(
+    summary="Метрики этапов обработки",
+    description="Гистограммы длительности этапов запросов и операций MinIO в текстовом формате Prometheus",
+    responses={200: OpenApiTypes.STR, 403: None},
+)
+@method_decorator(csrf_exempt, name='dispatch')
+class StageMetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(stage_histograms.prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,244 @@
+import hashlib
+import os
+import struct
+import tarfile
+import time
+import zipfile
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _ChunkBuffer:
+    """Поток только на запись: ZipFile пишет в него, генератор забирает байты"""
+
+    def __init__(self):
+        self._chunks = []
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        self.size = 0
+        return data
+
+
+class ZipStream:
+    """Потоковая запись zip-архива порциями ограниченного размера.
+
+    ZipFile пишет в несохраняемый поток, поэтому размеры и CRC каждого файла
+    уходят в data descriptor после данных, а не в заголовок. Методы write_*
+    и close — генераторы, отдающие готовые куски архива по мере сжатия.
+    """
+
+    def __init__(self, compression=zipfile.ZIP_DEFLATED, chunk_size=CHUNK_SIZE, compress_level=None,
+                 store_extensions=()):
+        self.compression = compression
+        self.chunk_size = chunk_size
+        self.compress_level = compress_level
+        # Уже сжатые форматы (картинки, архивы) пишутся без сжатия — выигрыша в размере нет
+        self.store_extensions = frozenset(store_extensions)
+        self._buffer = _ChunkBuffer()
+        self._zip = zipfile.ZipFile(self._buffer, "w", compression, compresslevel=compress_level)
+
+    def _flush(self, force=False):
+        if self._buffer.size and (force or self._buffer.size >= self.chunk_size):
+            yield self._buffer.drain()
+
+    def write_file(self, path, arcname):
+        zinfo = zipfile.ZipInfo.from_file(path, arcname=arcname)
+        if os.path.splitext(arcname)[1].lower() in self.store_extensions:
+            zinfo.compress_type = zipfile.ZIP_STORED
+        else:
+            zinfo.compress_type = self.compression
+            # ZipFile.open берет уровень из ZipInfo, а не из compresslevel архива
+            zinfo._compresslevel = self.compress_level
+        with open(path, "rb") as src, self._zip.open(zinfo, "w") as dest:
+            while chunk := src.read(self.chunk_size):
+                dest.write(chunk)
+                yield from self._flush()
+        yield from self._flush()
+
+    def write_raw(self, info, arcname, archive):
+        """Переносит элемент info из открытого архива archive без распаковки и пересжатия.
+
+        Размеры и CRC известны заранее, поэтому они пишутся прямо в локальный
+        заголовок. ZipFile не умеет добавлять готовые сжатые данные, так что
+        запись элемента повторяет то, что делает ZipFile.writestr.
+        """
+        zinfo = zipfile.ZipInfo(arcname, date_time=info.date_time)
+        zinfo.compress_type = info.compress_type
+        zinfo.external_attr = info.external_attr
+        zinfo.flag_bits = info.flag_bits & 0x06  # биты уровня сжатия deflate, без data descriptor
+        zinfo.CRC = info.CRC
+        zinfo.compress_size = info.compress_size
+        zinfo.file_size = info.file_size
+        zip64 = max(info.file_size, info.compress_size) > zipfile.ZIP64_LIMIT
+
+        self._zip._writecheck(zinfo)
+        self._zip._didModify = True
+        zinfo.header_offset = self._zip.fp.tell()
+        self._zip.fp.write(zinfo.FileHeader(zip64))
+        for chunk in iter_raw_member(archive, info, self.chunk_size):
+            self._zip.fp.write(chunk)
+            yield from self._flush()
+        self._zip.filelist.append(zinfo)
+        self._zip.NameToInfo[zinfo.filename] = zinfo
+        self._zip.start_dir = self._zip.fp.tell()
+        yield from self._flush()
+
+    def write_bytes(self, arcname, data):
+        self._zip.writestr(arcname, data, compress_type=self.compression)
+        yield from self._flush()
+
+    def write_directory(self, directory, prefix="", source=None):
+        """Пишет файлы каталога; совпадающие с элементами source переносятся без пересжатия"""
+        for file in sorted(directory.rglob("*")):
+            if not file.is_file():
+                continue
+            arcname = f"{prefix}{file.relative_to(directory)}"
+            member = source.match(file) if source is not None else None
+            if (
+                member is not None
+                and self.compression == zipfile.ZIP_STORED
+                and member.compress_type != zipfile.ZIP_STORED
+            ):
+                # При выводе без сжатия переносятся только несжатые элементы
+                member = None
+            if member is not None:
+                yield from self.write_raw(member, arcname, source.archive)
+            else:
+                yield from self.write_file(file, arcname)
+
+    def close(self):
+        self._zip.close()
+        yield from self._flush(force=True)
+
+
+class TarStream:
+    """Потоковая запись tar со сжатием всего потока (gzip, zstd) порциями ограниченного размера.
+
+    compressor — объект с методами compress(data) и flush(), как у
+    zlib.compressobj. Интерфейс совпадает с ZipStream.
+    """
+
+    def __init__(self, compressor, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._compressor = compressor
+        self._offset = 0
+
+    def _write(self, data):
+        self._offset += len(data)
+        compressed = self._compressor.compress(data)
+        if compressed:
+            yield compressed
+
+    def _header(self, arcname, size, mtime, mode):
+        info = tarfile.TarInfo(arcname)
+        info.size = size
+        info.mtime = int(mtime)
+        info.mode = mode
+        return info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+
+    def _padding(self, size):
+        return b"\0" * (-size % tarfile.BLOCKSIZE)
+
+    def write_file(self, path, arcname):
+        stat = os.stat(path)
+        yield from self._write(self._header(arcname, stat.st_size, stat.st_mtime, stat.st_mode & 0o7777))
+        with open(path, "rb") as src:
+            while chunk := src.read(self.chunk_size):
+                yield from self._write(chunk)
+        yield from self._write(self._padding(stat.st_size))
+
+    def write_bytes(self, arcname, data):
+        if isinstance(data, str):
+            data = data.encode()
+        yield from self._write(self._header(arcname, len(data), time.time(), 0o644))
+        yield from self._write(data + self._padding(len(data)))
+
+    def write_directory(self, directory, prefix="", source=None):
+        # Сжатые данные элементов zip в tar не переносятся, source не используется
+        for file in sorted(directory.rglob("*")):
+            if file.is_file():
+                yield from self.write_file(file, f"{prefix}{file.relative_to(directory)}")
+
+    def close(self):
+        # Два нулевых блока в конце архива и добивка до размера записи, как в tarfile
+        end = b"\0" * (2 * tarfile.BLOCKSIZE)
+        end += b"\0" * (-(self._offset + len(end)) % tarfile.RECORDSIZE)
+        yield from self._write(end)
+        tail = self._compressor.flush()
+        if tail:
+            yield tail
+
+
+def iter_directory_zip(directory, compression=zipfile.ZIP_DEFLATED, chunk_size=CHUNK_SIZE, source=None):
+    """Отдает zip-архив всех файлов каталога кусками по мере сжатия"""
+    stream = ZipStream(compression, chunk_size)
+    yield from stream.write_directory(directory, source=source)
+    yield from stream.close()
+
+
+def iter_raw_member(archive, info, chunk_size=CHUNK_SIZE):
+    """Сжатые данные элемента архива как есть, без распаковки"""
+    archive.seek(info.header_offset)
+    header = archive.read(zipfile.sizeFileHeader)
+    if len(header) != zipfile.sizeFileHeader or header[:4] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"Bad local file header for {info.filename}")
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    archive.seek(name_length + extra_length, 1)
+    remaining = info.compress_size
+    while remaining:
+        chunk = archive.read(min(chunk_size, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"Truncated data for {info.filename}")
+        remaining -= len(chunk)
+        yield chunk
+
+
+class ArchiveSource:
+    """Элементы исходного архива шаблона, которые можно перенести в результат как есть.
+
+    Файл результата совпадает с элементом, если у них одинаковые размер и
+    SHA-256 (из манифеста архива); хэш файла считается, только если
+    размер совпал с размером какого-либо элемента.
+    """
+
+    def __init__(self, archive, manifest):
+        self.archive = archive
+        with zipfile.ZipFile(archive) as zip_ref:
+            infos = {info.filename: info for info in zip_ref.infolist()}
+        self._members = {}
+        for entry in manifest['members']:
+            info = infos.get(entry['path'])
+            if (
+                entry['is_dir'] or info is None or info.flag_bits & 0x01
+                or (info.file_size, info.CRC) != (entry['size'], entry['crc32'])
+            ):
+                # Зашифрованные элементы и расхождения с манифестом пересжимаются обычным путем
+                continue
+            self._members.setdefault(info.file_size, {})[entry['sha256']] = info
+
+    def match(self, path):
+        candidates = self._members.get(path.stat().st_size)
+        if not candidates:
+            return None
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                digest.update(chunk)
+        return candidates.get(digest.hexdigest())
+
+    def close(self):
+        self.archive.close()
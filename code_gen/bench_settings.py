@@ -0,0 +1,40 @@
+"""
+Настройки для бенчмарков (manage.py bench_endpoints).
+
+По умолчанию база — файл SQLite во временном каталоге; BENCH_DATABASE=postgres
+оставляет базу из settings.py (локальный Postgres). MinIO заменяется
+хранилищем в памяти самой командой.
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+BENCH_DIR = Path(os.environ.get("BENCH_DIR", Path(tempfile.gettempdir()) / "codegen_bench"))
+
+if os.environ.get("BENCH_DATABASE", "sqlite") == "sqlite":
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BENCH_DIR / "bench.sqlite3",
+            # Конкурентные записи ждут блокировку вместо ошибки "database is locked";
+            # IMMEDIATE — транзакция, начатая с чтения (select_for_update), тоже ждет
+            'OPTIONS': {'timeout': 30, 'transaction_mode': 'IMMEDIATE'},
+        }
+    }
+
+DEBUG = False
+ALLOWED_HOSTS = ['testserver', 'localhost']
+
+TEMPLATE_PROCESSING_DIR = BENCH_DIR / "template_processing"
+TEMPLATE_CACHE_DIR = TEMPLATE_PROCESSING_DIR / "cache"
+RENDER_CACHE_DIR = TEMPLATE_PROCESSING_DIR / "render_cache"
+
+# Дочерние процессы пула не видят хранилище в памяти, поэтому генерация только в потоках
+RENDER_PARALLEL_EXECUTOR = "thread"
+
+# Фоновый сборщик не должен вмешиваться в замеры
+SCRATCH_JANITOR_INTERVAL = 0
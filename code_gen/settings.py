@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api_client.stage_timing.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -109,6 +111,18 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Первый хешер — для новых паролей; хеши других алгоритмов из списка проверяются
+# и пересчитываются первым хешером при успешном входе
+PASSWORD_HASHERS = [
+    'api_client.hashers.TunablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+# None — значение Django по умолчанию; меньше итераций — дешевле вход, но слабее хеш
+PASSWORD_PBKDF2_ITERATIONS = None
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
@@ -135,7 +149,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Rest Framework Settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api_client.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -143,6 +157,18 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
 
+# Кэш пользователей по токену для CachedTokenAuthentication
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_TTL = 60  # секунд; столько токен, удаленный в другом процессе, еще принимается здесь
+AUTH_TOKEN_CACHE_BACKEND = None  # алиас из CACHES (Redis, Memcached) для общего кэша между процессами
+AUTH_TOKEN_SHARED_CACHE_TTL = 5 * 60
+
+# Вход по API: "rotate" — новый токен на каждый вход, "reuse" — существующий токен пользователя,
+# "client" — отдельный токен на клиента (поле client в запросе) со сроком CLIENT_TOKEN_TTL
+LOGIN_TOKEN_MODE = "rotate"
+CLIENT_TOKEN_TTL = 30 * 24 * 60 * 60
+LOGIN_CREATE_SESSION = True  # False — без сессии Django (записи в django_session и last_login)
+
 # Spectacular Settings
 SPECTACULAR_SETTINGS = {
     'TITLE': 'CodeGen API',
@@ -175,4 +201,103 @@ MINIO_ENDPOINT = "localhost:9000"
 MINIO_ACCESS_KEY = "minioadmin"
 MINIO_SECRET_KEY = "minioadmin"
 MINIO_USE_SSL = False
-MINIO_BUCKET_NAME = "codegen"
\ No newline at end of file
+MINIO_BUCKET_NAME = "codegen"
+# Бакет проверяется при первом обращении процесса к MinIO; создать его заранее — manage.py init_minio_bucket
+MINIO_AUTO_CREATE_BUCKET = True
+
+# Пул соединений и политика повторов клиента MinIO
+MINIO_NUM_POOLS = 4
+MINIO_POOL_MAXSIZE = 32
+MINIO_POOL_BLOCK = False  # True — ждать свободное соединение вместо открытия лишних
+MINIO_CONNECT_TIMEOUT = 5
+MINIO_READ_TIMEOUT = 60
+MINIO_MAX_RETRIES = 3
+MINIO_RETRY_BACKOFF = 0.2
+MINIO_RETRY_JITTER = 0.2
+MINIO_TCP_KEEPALIVE = True
+# Потоки для блокирующих вызовов MinIO из асинхронных представлений
+ASYNC_IO_THREADS = MINIO_POOL_MAXSIZE
+
+# Локальный кэш распакованных архивов шаблонов
+TEMPLATE_PROCESSING_DIR = Path("/tmp/template_processing")
+TEMPLATE_CACHE_DIR = TEMPLATE_PROCESSING_DIR / "cache"
+TEMPLATE_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+# Кэш готовых результатов генерации: None (выключен), "local" или "minio"
+RENDER_CACHE_BACKEND = None
+RENDER_CACHE_DIR = TEMPLATE_PROCESSING_DIR / "render_cache"
+RENDER_CACHE_PREFIX = "render-cache/"
+RENDER_CACHE_TTL = 24 * 60 * 60
+RENDER_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+RENDER_CACHE_EVICT_INTERVAL = 60  # "minio": как часто перечислять префикс для вытеснения
+
+# Асинхронные задачи генерации (очередь в основной БД, см. manage.py run_render_worker)
+RENDER_JOB_WORKERS = 2
+RENDER_JOB_POLL_INTERVAL = 1.0
+RENDER_JOB_TIMEOUT = 5 * 60  # задача без пульса воркера дольше этого возвращается в очередь
+RENDER_JOB_HEARTBEAT_INTERVAL = 30  # как часто воркер отмечает свои выполняющиеся задачи
+RENDER_JOB_REQUEUE_INTERVAL = 60  # как часто воркер возвращает в очередь брошенные задачи и удаляет старые
+RENDER_JOB_RESULT_PREFIX = "render-jobs/"
+RENDER_JOB_RESULT_TTL = 24 * 60 * 60  # завершенные задачи и их результаты хранятся столько секунд
+
+# Пакетная генерация: один архив, много контекстов
+RENDER_BATCH_WORKERS = os.cpu_count() or 1
+RENDER_BATCH_MAX_CONTEXTS = 100
+
+# Параллельная генерация одного проекта: файлы шаблона делятся между воркерами
+RENDER_PARALLEL_WORKERS = 1  # 1 — последовательная генерация
+RENDER_PARALLEL_EXECUTOR = "process"  # "process" (свой пул процессов, не пакетный) или "thread"
+RENDER_PARALLEL_MIN_FILES = 64  # для шаблонов меньше этого числа файлов параллелить невыгодно
+
+# Кэш разобранных шаблонов в памяти процесса, включается явно (например, 128 МБ);
+# 0 — всегда генерировать движком. Разбор вычисляет подстановки сам и сверяется
+# с движком только на одном пробном контексте
+TEMPLATE_COMPILED_CACHE_BYTES = 0
+
+# Режим подготовки шаблона: "cache" — дисковый кэш распакованных архивов,
+# "memory" — архив в памяти, распаковка и генерация на tmpfs без обращений к диску
+TEMPLATE_RENDER_MODE = "cache"
+TEMPLATE_MEMORY_DIR = Path("/dev/shm/template_processing") if Path("/dev/shm").is_dir() else TEMPLATE_PROCESSING_DIR
+TEMPLATE_MEMORY_CACHE_BYTES = 256 * 1024 * 1024
+
+# Рабочие каталоги генерации (<TEMPLATE_PROCESSING_DIR или TEMPLATE_MEMORY_DIR>/scratch)
+SCRATCH_QUOTA_BYTES = 4 * 1024 * 1024 * 1024  # суммарный резерв генераций всех процессов хоста
+SCRATCH_MIN_FREE_BYTES = 512 * 1024 * 1024  # не начинать генерацию, если на диске останется меньше
+SCRATCH_ADMISSION_TIMEOUT = 10  # секунд ожидания места, затем 503
+SCRATCH_ORPHAN_AGE = 60 * 60  # каталоги старше этого удаляет фоновый сборщик
+SCRATCH_JANITOR_INTERVAL = 5 * 60  # 0 — сборщик выключен
+
+# Замеры этапов обработки запросов (GET /api_client/metrics/ в формате Prometheus)
+SERVER_TIMING_HEADER = True  # заголовок Server-Timing в ответах; виден клиентам API
+STAGE_TIMING_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+# Presigned URL вместо передачи архивов через Django (можно переопределить параметром ?redirect=)
+MINIO_PRESIGNED_DOWNLOADS = False
+MINIO_PRESIGNED_EXPIRES = 15 * 60
+MINIO_PRESIGNED_REFRESH_MARGIN = 60
+
+# Загрузка архивов шаблонов в MinIO
+MINIO_UPLOAD_PART_SIZE = 16 * 1024 * 1024
+MINIO_UPLOAD_PARALLEL = 4
+# Архивы хранятся один раз по SHA-256 содержимого: <TEMPLATE_BLOB_PREFIX><sha256>
+TEMPLATE_BLOB_PREFIX = "blobs/"
+# Через сколько секунд незавершенная загрузка блоба считается брошенной (collect_template_blobs)
+TEMPLATE_BLOB_PENDING_TIMEOUT = 60 * 60
+# Проверка архива по хешу и создание проекта без передачи байтов. Знание хеша дает доступ
+# к архиву, поэтому отключите, если пользователи не должны видеть шаблоны друг друга
+TEMPLATE_BLOB_HASH_UPLOADS = True
+
+# Постраничная выдача списков проектов
+LIST_PAGE_SIZE = 100
+LIST_MAX_PAGE_SIZE = 1000
+LIST_STREAM_CHUNK_SIZE = 2000
+
+# Формат и сжатие архива результата (можно переопределить параметрами ?archive=, ?compression=, ?level=)
+OUTPUT_FORMAT = "zip"  # "zip", "tar.gz" или "tar.zst" (нужен пакет zstandard)
+OUTPUT_COMPRESSION = "deflate"  # для zip: "store", "deflate", "bzip2" или "lzma"
+OUTPUT_COMPRESSION_LEVEL = None  # None — уровень метода по умолчанию
+OUTPUT_STORE_EXTENSIONS = [
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".ico", ".woff", ".woff2",
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".zst", ".7z", ".jar", ".whl",
+    ".mp3", ".mp4", ".webm",
+]